@@ -0,0 +1,110 @@
+"""
+Benchmark: per-day/per-schedule loop vs. the vectorized adherence engine.
+
+Run from the project root:
+    python -m benchmarks.bench_adherence
+"""
+import random
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from constants.enums import FrequencyEnum, DayOfWeekEnum
+from utilities.adherence import (
+    compute_adherence, empty_schedule_table, empty_log_table, add_schedule, add_log, is_scheduled_on,
+)
+
+WINDOWS = (30, 90, 365)
+SCHEDULES_PER_CATEGORY = {"medication": 12, "blood_pressure": 3, "sugar": 3}
+LOG_PROBABILITY = 0.85
+REPEATS = 3
+
+
+def make_dataset(days: int, seed: int = 7):
+    rng = random.Random(seed)
+    end_date = date.today()
+    start_date = end_date - timedelta(days=days - 1)
+
+    schedules = []
+    next_id = 1
+    for category, count in SCHEDULES_PER_CATEGORY.items():
+        for _ in range(count):
+            frequency = rng.choice([FrequencyEnum.DAILY, FrequencyEnum.DAILY, FrequencyEnum.WEEKLY, FrequencyEnum.MONTHLY])
+            custom_days = rng.sample(list(DayOfWeekEnum), 3) if frequency == FrequencyEnum.WEEKLY else None
+            schedules.append(SimpleNamespace(
+                category=category,
+                id=next_id,
+                start_date=start_date - timedelta(days=rng.randint(0, 60)),
+                duration_days=rng.choice([None, days, days // 2 or 1]),
+                frequency=frequency,
+                custom_days=custom_days,
+            ))
+            next_id += 1
+
+    logs = []
+    for sched in schedules:
+        for n in range(days):
+            day = start_date + timedelta(days=n)
+            if rng.random() < LOG_PROBABILITY:
+                logs.append(SimpleNamespace(
+                    category=sched.category,
+                    schedule_id=sched.id,
+                    checked_at=datetime.combine(day, datetime.min.time()) + timedelta(hours=8),
+                ))
+    return schedules, logs, start_date, end_date
+
+
+def legacy_adherence(schedules, logs, start_date, end_date):
+    """Shape of the original routes/reports.py loop: next() over all logs per (day, schedule)."""
+    total = adhered = 0
+    daily = []
+    day = start_date
+    while day <= end_date:
+        day_total = day_adhered = 0
+        for sched in schedules:
+            if is_scheduled_on(sched.start_date, sched.duration_days, sched.frequency, sched.custom_days, day):
+                day_total += 1
+                log = next((log for log in logs
+                            if log.checked_at.date() == day and log.category == sched.category
+                            and log.schedule_id == sched.id), None)
+                if log:
+                    day_adhered += 1
+        daily.append((day, day_total, day_adhered))
+        total += day_total
+        adhered += day_adhered
+        day += timedelta(days=1)
+    return total, adhered, daily
+
+
+def engine_adherence(schedules, logs, start_date, end_date):
+    schedule_table = empty_schedule_table()
+    for sched in schedules:
+        add_schedule(schedule_table, sched.category, sched.id, sched.start_date, sched.duration_days, sched.frequency, sched.custom_days)
+    log_table = empty_log_table()
+    for log in logs:
+        add_log(log_table, log.category, log.schedule_id, log.checked_at)
+    return compute_adherence(schedule_table, log_table, start_date, end_date)
+
+
+def best_of(fn, *args):
+    best = float("inf")
+    result = None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    print(f"{'days':>6} {'logs':>7} {'legacy (ms)':>12} {'engine (ms)':>12} {'speedup':>8}")
+    for days in WINDOWS:
+        schedules, logs, start_date, end_date = make_dataset(days)
+        legacy_time, (total, adhered, _) = best_of(legacy_adherence, schedules, logs, start_date, end_date)
+        engine_time, result = best_of(engine_adherence, schedules, logs, start_date, end_date)
+        assert (total, adhered) == (result["total_scheduled"], result["total_completed"]), "engines disagree"
+        print(f"{days:>6} {len(logs):>7} {legacy_time * 1000:>12.1f} {engine_time * 1000:>12.2f} {legacy_time / engine_time:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark: Python adherence path vs. PostgreSQL generate_series aggregation.
+
+Needs a populated database (DATABASE_URL) and a patient with schedules/logs.
+Run from the project root:
+    python -m benchmarks.bench_adherence_sql <patient_profile_id>
+"""
+import sys
+import time
+from datetime import date, timedelta
+
+from database import SessionLocal
+from crud.reports import get_daily_adherence_counts
+from routes.reports import load_report_data
+from utilities.adherence import summarize_daily_counts
+
+WINDOWS = (30, 90, 365)
+REPEATS = 5
+
+
+def python_path(db, patient_profile_id, start_date, end_date):
+    return load_report_data(db, patient_profile_id, start_date, end_date)["adherence"]
+
+
+def sql_path(db, patient_profile_id, start_date, end_date):
+    rows = get_daily_adherence_counts(db, patient_profile_id, start_date, end_date)
+    return summarize_daily_counts(rows, start_date, end_date)
+
+
+def best_of(fn, *args):
+    best = float("inf")
+    result = None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(patient_profile_id: int):
+    db = SessionLocal()
+    try:
+        print(f"{'days':>6} {'python (ms)':>12} {'sql (ms)':>10} {'match':>6}")
+        for days in WINDOWS:
+            end_date = date.today()
+            start_date = end_date - timedelta(days=days - 1)
+            python_time, python_result = best_of(python_path, db, patient_profile_id, start_date, end_date)
+            db.expunge_all()
+            sql_time, sql_result = best_of(sql_path, db, patient_profile_id, start_date, end_date)
+            match = python_result["breakdown"] == sql_result["breakdown"]
+            print(f"{days:>6} {python_time * 1000:>12.1f} {sql_time * 1000:>10.1f} {str(match):>6}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m benchmarks.bench_adherence_sql <patient_profile_id>")
+    main(int(sys.argv[1]))
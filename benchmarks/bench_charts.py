@@ -0,0 +1,211 @@
+"""
+Benchmark: pyplot chart functions (as they were in the report code) vs. utilities.charts.
+
+Renders the BP, sugar and adherence charts for a few window sizes, sequentially and
+with the OO renderer from several threads at once (pyplot cannot do the latter safely).
+
+The legacy functions save at 150 dpi, so the pyplot vs. OO speedup is measured with
+both at 150 dpi; the OO renderer at its default DEFAULT_DPI is reported separately,
+as the effect of the smaller images.
+
+Run from the project root:
+    python -m benchmarks.bench_charts
+"""
+import io
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from utilities.charts import bp_chart, sugar_chart, adherence_chart, DEFAULT_DPI
+
+WINDOWS = (7, 30, 90)
+READINGS_PER_DAY = 2
+THREADS = 4
+LEGACY_DPI = 150  # what the legacy functions below save at
+REPEATS = 3
+
+
+def make_dataset(days: int, seed: int = 7):
+    rng = random.Random(seed)
+    start = datetime.combine(date.today() - timedelta(days=days - 1), datetime.min.time())
+    bp_logs, sugar_logs = [], []
+    for n in range(days):
+        for reading in range(READINGS_PER_DAY):
+            checked_at = start + timedelta(days=n, hours=8 + reading * 10)
+            bp_logs.append({"checked_at": checked_at, "systolic": rng.randint(105, 150), "diastolic": rng.randint(65, 95)})
+            sugar_logs.append({"checked_at": checked_at, "value": rng.randint(80, 220), "type": rng.choice(["FASTING", "RANDOM"])})
+    labels = [(start + timedelta(days=n)).strftime("%m/%d") for n in range(days)]
+    percents = [rng.uniform(40, 100) for _ in range(days)]
+    return bp_logs, sugar_logs, labels, percents
+
+
+def columns(rows, keys):
+    return {key: [row[key] for row in rows] for key in keys}
+
+
+# --- legacy pyplot implementations, kept verbatim for comparison ---
+
+def plot_bp_chart(bp_logs):
+    """Create a blood pressure chart with both systolic and diastolic, avoiding vertical lines from duplicate timestamps."""
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    import io
+    from collections import defaultdict
+    from datetime import datetime, time
+
+    plt.figure(figsize=(10, 4))
+
+    if bp_logs:
+        grouped = defaultdict(lambda: {"systolic": [], "diastolic": []})
+
+        for log in bp_logs:
+            log_time = log["checked_at"] if isinstance(log["checked_at"], datetime) else datetime.combine(log["checked_at"], time.min)
+            log_time = log_time.replace(second=0, microsecond=0)  # Normalize
+            grouped[log_time]["systolic"].append(log["systolic"])
+            grouped[log_time]["diastolic"].append(log["diastolic"])
+
+        # Sort by time
+        sorted_items = sorted(grouped.items())
+        dates = [dt for dt, _ in sorted_items]
+        systolic_avg = [sum(values["systolic"]) / len(values["systolic"]) for _, values in sorted_items]
+        diastolic_avg = [sum(values["diastolic"]) / len(values["diastolic"]) for _, values in sorted_items]
+
+        plt.plot(dates, systolic_avg, marker='o', label='Systolic', linewidth=2, markersize=4, color='#ff7f0e')  # Orange
+        plt.plot(dates, diastolic_avg, marker='s', label='Diastolic', linewidth=2, markersize=4, color='#2ca02c')  # Green
+        plt.legend()
+
+        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+        plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=1))
+
+    plt.xlabel('Date')
+    plt.ylabel('Blood Pressure (mmHg)')
+    plt.title('Blood Pressure Trend')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=150)
+    plt.close()
+    buf.seek(0)
+    return buf
+
+def plot_sugar_chart(sugar_logs):
+    """Create a sugar level line chart separated by type (e.g., FASTING, RANDOM)"""
+    from collections import defaultdict
+    from datetime import datetime, time
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    import io
+
+    plt.figure(figsize=(10, 4))
+
+    # Use nested dict to group by type and datetime
+    grouped = defaultdict(lambda: defaultdict(list))
+
+    for log in sugar_logs:
+        log_time = log["checked_at"] if isinstance(log["checked_at"], datetime) else datetime.combine(log["checked_at"], time.min)
+        log_time = log_time.replace(second=0, microsecond=0)  # Normalize seconds/microseconds
+        grouped[log["type"]][log_time].append(log["value"])
+
+    # Prepare cleaned data
+    sugar_colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
+    for idx, (label, times_dict) in enumerate(grouped.items()):
+        sorted_items = sorted(times_dict.items())
+        dates = [dt for dt, _ in sorted_items]
+        values = [sum(vals) / len(vals) for _, vals in sorted_items]  # average values
+        color = sugar_colors[idx % len(sugar_colors)]
+        plt.plot(dates, values, marker='o', linewidth=2, markersize=4, label=label, color=color)
+
+    plt.xlabel("Date")
+    plt.ylabel("Sugar Level (mg/dL)")
+    plt.title("Blood Sugar Trend")
+    plt.legend()
+    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+    plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=1))
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=150)
+    plt.close()
+    buf.seek(0)
+    return buf
+
+
+def plot_adherence_chart(dates, adherence_percents):
+    """Create an adherence bar chart with vertical bars"""
+    plt.figure(figsize=(10, 4))
+    if dates and adherence_percents:
+        # For single day (Daily view), create one centered bar
+        if len(dates) == 1:
+            plt.bar([0], adherence_percents, width=0.4, alpha=0.7, color='#1f77b4')  # Single narrow bar
+            plt.xticks([0], dates)
+        else:
+            # Use range indices for x-axis and set custom labels for multiple days
+            x_pos = range(len(dates))
+            plt.bar(x_pos, adherence_percents, width=0.6, alpha=0.7, color='#1f77b4')  # Consistent blue color
+            plt.xticks(x_pos, dates)
+    
+    plt.xlabel('Date')
+    plt.ylabel('Adherence (%)')
+    plt.title('Daily Adherence')
+    plt.ylim(0, 100)  # Set consistent Y-axis scale
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=150)
+    plt.close()
+    buf.seek(0)
+    return buf
+
+
+def legacy_all(bp_logs, sugar_logs, labels, percents):
+    plot_bp_chart(bp_logs)
+    plot_sugar_chart(sugar_logs)
+    plot_adherence_chart(labels, percents)
+
+
+def oo_all(bp, sugar, labels, percents, dpi=DEFAULT_DPI):
+    bp_chart(bp["checked_at"], bp["systolic"], bp["diastolic"], dpi=dpi)
+    sugar_chart(sugar["checked_at"], sugar["value"], sugar["type"], dpi=dpi)
+    adherence_chart(labels, percents, dpi=dpi)
+
+
+def best_of(fn, *args):
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    print(f"{'days':>6} {f'pyplot@{LEGACY_DPI} (ms)':>16} {f'OO@{LEGACY_DPI} (ms)':>12} {'speedup':>8} "
+          f"{f'OO@{DEFAULT_DPI} (ms)':>12} {'dpi gain':>9} {f'OO@{DEFAULT_DPI} x{THREADS} threads (ms/report)':>37}")
+    for days in WINDOWS:
+        bp_logs, sugar_logs, labels, percents = make_dataset(days)
+        bp = columns(bp_logs, ("checked_at", "systolic", "diastolic"))
+        sugar = columns(sugar_logs, ("checked_at", "value", "type"))
+
+        legacy_time = best_of(legacy_all, bp_logs, sugar_logs, labels, percents)
+        oo_same_dpi = best_of(oo_all, bp, sugar, labels, percents, LEGACY_DPI)
+        oo_time = best_of(oo_all, bp, sugar, labels, percents)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=THREADS) as pool:
+            list(pool.map(lambda _: oo_all(bp, sugar, labels, percents), range(THREADS * 2)))
+        threaded = (time.perf_counter() - start) / (THREADS * 2)
+
+        print(f"{days:>6} {legacy_time * 1000:>16.1f} {oo_same_dpi * 1000:>12.1f} {legacy_time / oo_same_dpi:>7.1f}x "
+              f"{oo_time * 1000:>12.1f} {oo_same_dpi / oo_time:>8.1f}x {threaded * 1000:>37.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: raw (one line per log) vs. compact (per-day aggregates) log encoding in
+insight prompts.
+
+Compares the size of the log sections as encode_logs picks them (compact sections
+that would not be shorter stay raw) and checks what the compact rows keep: every
+day's BP reading count and systolic min/max, and every reading outside the patient's
+targets (counted from the raw logs, then summed from the H/L flags).
+
+Run from the project root:
+    python -m benchmarks.bench_insight_prompt
+"""
+import random
+import re
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from constants.enums import SugarTypeEnum
+from utilities.insight_prompt import encode_logs, estimate_tokens, sugar_limits, compact_bp_logs, compact_sugar_logs
+
+WINDOWS = (1, 7, 30)
+BP_PER_DAY = 2
+SUGAR_PER_DAY = 3
+MEDICINES = ("Metformin", "Amlodipine", "Atorvastatin")
+REPEATS = 5
+
+PROFILE = SimpleNamespace(
+    bp_systolic_min=90, bp_systolic_max=135, bp_diastolic_min=60, bp_diastolic_max=85,
+    sugar_fasting_min=70, sugar_fasting_max=110, sugar_random_min=70, sugar_random_max=180,
+)
+
+
+def make_dataset(days: int, seed: int = 7):
+    rng = random.Random(seed)
+    start = datetime.combine(date.today() - timedelta(days=days), datetime.min.time())
+    sugar_types = [SugarTypeEnum.FASTING, SugarTypeEnum.POST_MEAL, SugarTypeEnum.RANDOM]
+    bp_logs, sugar_logs, med_logs = [], [], []
+    for n in range(days):
+        day = start + timedelta(days=n)
+        for reading in range(BP_PER_DAY):
+            bp_logs.append(SimpleNamespace(checked_at=day + timedelta(hours=8 + reading * 12, minutes=rng.randint(0, 40)),
+                                           systolic=rng.randint(105, 150), diastolic=rng.randint(65, 95),
+                                           pulse=rng.randint(60, 95)))
+        for reading in range(SUGAR_PER_DAY):
+            sugar_type = sugar_types[reading % len(sugar_types)]
+            sugar_logs.append(SimpleNamespace(checked_at=day + timedelta(hours=7 + reading * 5, minutes=rng.randint(0, 40)),
+                                              value=float(rng.randint(75, 220)),
+                                              schedule=SimpleNamespace(sugar_type=sugar_type)))
+        for medicine in MEDICINES:
+            for dose in range(rng.choice((1, 2))):
+                if rng.random() < 0.85:
+                    med_logs.append(SimpleNamespace(
+                        taken_at=day + timedelta(hours=9 + dose * 12),
+                        schedule=SimpleNamespace(medication=SimpleNamespace(medicine=SimpleNamespace(name=medicine))),
+                    ))
+    return bp_logs, sugar_logs, med_logs
+
+
+def out_of_range_readings(bp_logs, sugar_logs) -> int:
+    """Readings outside the targets, counted directly from the logs."""
+    bp = sum(
+        log.systolic > PROFILE.bp_systolic_max or log.diastolic > PROFILE.bp_diastolic_max
+        or log.systolic < PROFILE.bp_systolic_min or log.diastolic < PROFILE.bp_diastolic_min
+        for log in bp_logs
+    )
+    sugar = 0
+    for log in sugar_logs:
+        low, high = sugar_limits(PROFILE, log.schedule.sugar_type)
+        sugar += log.value > high or log.value < low
+    return bp + sugar
+
+
+def flagged_readings(bp_text: str, sugar_text: str) -> int:
+    """Sum of the H/L counts in the compact BP and sugar rows."""
+    text = bp_text + "\n" + sugar_text
+    return sum(int(count) for count in re.findall(r"\b[HL](\d+)\b", text))
+
+
+def extremes_kept(bp_logs, bp_text: str) -> bool:
+    """Each day's BP reading count and systolic min/max survive aggregation."""
+    rows = {}
+    for line in bp_text.splitlines()[2:]:
+        day, readings, systolic = line.split("|")[:3]
+        values = systolic.split("/")
+        rows[day] = (int(readings), int(values[0]), int(values[-1]))
+    by_day = {}
+    for log in bp_logs:
+        by_day.setdefault(log.checked_at.strftime("%m-%d"), []).append(log.systolic)
+    return all(rows.get(day) == (len(values), min(values), max(values)) for day, values in by_day.items())
+
+
+def best_of(fn, *args):
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    print(f"{'days':>5} {'raw chars':>10} {'compact':>8} {'raw ~tok':>9} {'compact ~tok':>13} {'saved':>6} "
+          f"{'out of range':>13} {'flagged':>8} {'extremes':>9} {'encode ms':>10}")
+    for days in WINDOWS:
+        bp_logs, sugar_logs, med_logs = make_dataset(days)
+        raw = "\n\n".join(encode_logs(bp_logs, sugar_logs, med_logs, PROFILE, compact=False).values())
+        compact = "\n\n".join(encode_logs(bp_logs, sugar_logs, med_logs, PROFILE, compact=True).values())
+        bp_text, sugar_text = compact_bp_logs(bp_logs, PROFILE), compact_sugar_logs(sugar_logs, PROFILE)
+        encode_time = best_of(encode_logs, bp_logs, sugar_logs, med_logs, PROFILE, True)
+        print(f"{days:>5} {len(raw):>10} {len(compact):>8} {estimate_tokens(raw):>9} {estimate_tokens(compact):>13} "
+              f"{1 - len(compact) / len(raw):>6.0%} {out_of_range_readings(bp_logs, sugar_logs):>13} "
+              f"{flagged_readings(bp_text, sugar_text):>8} {'yes' if extremes_kept(bp_logs, bp_text) else 'NO':>9} "
+              f"{encode_time * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,63 @@ load_dotenv()
 class Settings(BaseSettings):
     DATABASE_URL: str = os.getenv("DATABASE_URL")
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
+
+    # Every Gemini request (utilities/gemini_client.py)
+    GEMINI_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_TIMEOUT_SECONDS", 60))
+    GEMINI_MAX_ATTEMPTS: int = int(os.getenv("GEMINI_MAX_ATTEMPTS", 5))
+    # Chat requests are interactive, so they give up sooner
+    GEMINI_CHAT_MAX_ATTEMPTS: int = int(os.getenv("GEMINI_CHAT_MAX_ATTEMPTS", 2))
+
+    # Chat summaries are folded in after each message, off the request path (tasks/chat_summaries.py)
+    CHAT_SUMMARY_WORKERS: int = int(os.getenv("CHAT_SUMMARY_WORKERS", 2))
+    # Message pairs folded into the summary per Gemini call
+    CHAT_SUMMARY_CHUNK_PAIRS: int = int(os.getenv("CHAT_SUMMARY_CHUNK_PAIRS", 10))
+    # Latest message pairs sent verbatim with each chat turn, on top of the stored summary
+    CHAT_RECENT_PAIRS: int = int(os.getenv("CHAT_RECENT_PAIRS", 5))
+    # Estimated size budget of a chat prompt (utilities/chat_context.py)
+    CHAT_PROMPT_MAX_TOKENS: int = int(os.getenv("CHAT_PROMPT_MAX_TOKENS", 4000))
+    # Rendered patient summary block of chat prompts (utilities/patient_context_cache.py)
+    PATIENT_CONTEXT_CACHE_MAX_ENTRIES: int = int(os.getenv("PATIENT_CONTEXT_CACHE_MAX_ENTRIES", 10_000))
+    PATIENT_CONTEXT_CACHE_TTL_SECONDS: int = int(os.getenv("PATIENT_CONTEXT_CACHE_TTL_SECONDS", 600))
+    # GET /messages/chat/{chat_id} pages
+    MESSAGE_PAGE_SIZE: int = int(os.getenv("MESSAGE_PAGE_SIZE", 30))
+    MESSAGE_PAGE_MAX_SIZE: int = int(os.getenv("MESSAGE_PAGE_MAX_SIZE", 100))
+    MESSAGE_PREVIEW_CHARS: int = int(os.getenv("MESSAGE_PREVIEW_CHARS", 200))
+
+    # Background report rendering (tasks/report_jobs.py)
+    REPORT_WORKERS: int = int(os.getenv("REPORT_WORKERS", 2))
+    REPORT_MAX_PENDING_JOBS: int = int(os.getenv("REPORT_MAX_PENDING_JOBS", 20))
+    REPORT_MAX_JOBS_PER_USER: int = int(os.getenv("REPORT_MAX_JOBS_PER_USER", 3))
+    REPORT_RESULT_TTL_SECONDS: int = int(os.getenv("REPORT_RESULT_TTL_SECONDS", 900))
+    REPORT_CACHE_MAX_BYTES: int = int(os.getenv("REPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    REPORT_BULK_MAX_PATIENTS: int = int(os.getenv("REPORT_BULK_MAX_PATIENTS", 100))
+
+    # Scheduled insight generation (tasks/insight_runner.py)
+    INSIGHT_CONCURRENCY: int = int(os.getenv("INSIGHT_CONCURRENCY", 4))
+    INSIGHT_RATE_PER_MINUTE: float = float(os.getenv("INSIGHT_RATE_PER_MINUTE", 15))
+    INSIGHT_RATE_BURST: int = int(os.getenv("INSIGHT_RATE_BURST", 4))
+    INSIGHT_PATIENT_CHUNK_SIZE: int = int(os.getenv("INSIGHT_PATIENT_CHUNK_SIZE", 200))
+    INSIGHT_JOB_MAX_ATTEMPTS: int = int(os.getenv("INSIGHT_JOB_MAX_ATTEMPTS", 3))
+    INSIGHT_JOB_LEASE_SECONDS: int = int(os.getenv("INSIGHT_JOB_LEASE_SECONDS", 600))
+    INSIGHT_QUEUE_POLL_MINUTES: int = int(os.getenv("INSIGHT_QUEUE_POLL_MINUTES", 10))
+    # Patients per batched Gemini request (1 disables batching); output tokens, not the
+    # context window, are the real limit, so keep this small
+    INSIGHT_BATCH_SIZE: int = int(os.getenv("INSIGHT_BATCH_SIZE", 5))
+    INSIGHT_BATCH_MAX_PROMPT_CHARS: int = int(os.getenv("INSIGHT_BATCH_MAX_PROMPT_CHARS", 200_000))
+    # Insights requested through GET /insights, generated in the API process
+    INSIGHT_ON_DEMAND_WORKERS: int = int(os.getenv("INSIGHT_ON_DEMAND_WORKERS", 2))
+    INSIGHT_EVENTS_TIMEOUT_SECONDS: int = int(os.getenv("INSIGHT_EVENTS_TIMEOUT_SECONDS", 300))
+    # Per-day aggregated logs in insight prompts instead of one line per log (utilities/insight_prompt.py)
+    INSIGHT_COMPACT_LOGS: bool = os.getenv("INSIGHT_COMPACT_LOGS", "true").lower() in ("1", "true", "yes")
+    # Parsed insights reused for identical prompts (utilities/insight_cache.py)
+    INSIGHT_CACHE_MAX_BYTES: int = int(os.getenv("INSIGHT_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+    INSIGHT_CACHE_TTL_SECONDS: int = int(os.getenv("INSIGHT_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+    # Only the process holding the scheduler advisory lock runs the cron jobs (tasks/leader.py)
+    SCHEDULER_LEADER_RETRY_SECONDS: float = float(os.getenv("SCHEDULER_LEADER_RETRY_SECONDS", 15))
+    # Set to false on the API tier when a separate `python -m tasks.worker` tier runs the jobs
+    RUN_SCHEDULER: bool = os.getenv("RUN_SCHEDULER", "true").lower() in ("1", "true", "yes")
+
     model_config = SettingsConfigDict(env_file=".env", extra="allow")
 
 
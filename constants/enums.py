@@ -66,4 +66,34 @@ class DayOfWeekEnum(enum.Enum):
     THURSDAY = "THURSDAY"
     FRIDAY = "FRIDAY"
     SATURDAY = "SATURDAY"
-    SUNDAY = "SUNDAY"
\ No newline at end of file
+    SUNDAY = "SUNDAY"
+
+
+class AdherenceSourceEnum(enum.Enum):
+    """Where adherence is computed for report endpoints"""
+    ROLLUP = "ROLLUP"
+    PYTHON = "PYTHON"
+    SQL = "SQL"
+
+
+class ReportJobStatusEnum(enum.Enum):
+    """Lifecycle of a background report job"""
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+
+class BulkReportFormatEnum(enum.Enum):
+    """Output of a multi-patient report export"""
+    ZIP = "ZIP"
+    PDF = "PDF"
+
+
+class InsightJobStatusEnum(enum.Enum):
+    """Lifecycle of a queued insight work item"""
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
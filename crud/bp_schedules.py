@@ -7,6 +7,7 @@ from sqlalchemy.exc import IntegrityError
 from models.bp_schedules import BPSchedule
 from schemas.bp_schedules import BPScheduleCreate, BPScheduleUpdate
 from utilities.permissions import can_modify_patient_schedules
+from crud.daily_adherence_rollups import invalidate_adherence_rollups
 from constants.enums import FrequencyEnum, DayOfWeekEnum
 
 
@@ -34,6 +35,7 @@ def create_bp_schedule_core(
         payload=payload
     )
 
+    invalidate_adherence_rollups(db, patient_profile_id, payload.start_date)
     db.commit()
     for schedule in schedules:
         db.refresh(schedule)
@@ -146,6 +148,8 @@ def update_bp_schedule(db: Session, schedule_id: int, payload: BPScheduleUpdate)
             detail="BP schedule not found."
         )
 
+    previous_start_date = schedule.start_date
+
     # Validate duration_days
     if payload.duration_days is not None:
         if payload.duration_days <= 0:
@@ -243,6 +247,9 @@ def update_bp_schedule(db: Session, schedule_id: int, payload: BPScheduleUpdate)
             
             schedule.scheduled_time = new_time
 
+    # Schedule rules changed: past days must be re-materialized from the earlier start
+    invalidate_adherence_rollups(db, schedule.patient_profile_id, min(previous_start_date, schedule.start_date))
+
     # Commit changes with error handling
     try:
         db.flush()
@@ -261,5 +268,6 @@ def delete_bp_schedule(db: Session, schedule_id: int, patient_profile_id: int) -
     schedule = db.query(BPSchedule).filter_by(id=schedule_id, patient_profile_id=patient_profile_id).first()
     if not schedule:
         return False
+    invalidate_adherence_rollups(db, patient_profile_id, schedule.start_date)
     db.delete(schedule)
     return True
\ No newline at end of file
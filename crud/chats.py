@@ -1,5 +1,8 @@
+from typing import Optional
+
 from sqlalchemy.orm import Session
 from models.chats import Chat
+from models.chat_summary_states import ChatSummaryState
 from schemas.chats import ChatCreate, ChatUpdate
 
 
@@ -20,11 +23,24 @@ def get_chat_summary(db: Session, chat_id: int) -> str:
     return chat.summary if chat and chat.summary else ""
 
 
-def set_chat_summary(db: Session, chat_id: int, summary: str):
+def get_summarized_message_id(db: Session, chat_id: int) -> Optional[int]:
+    """Id of the newest message folded into the chat's summary, None if none was recorded."""
+    state = db.get(ChatSummaryState, chat_id)
+    return state.last_message_id if state else None
+
+
+def set_chat_summary(db: Session, chat_id: int, summary: str, last_message_id: Optional[int] = None):
+    """Store the summary; last_message_id is the newest message it covers (see ChatSummaryState)."""
     chat = db.query(Chat).filter(Chat.id == chat_id).first()
     if chat:
         if summary is not None:
             chat.summary = summary
+        if last_message_id is not None:
+            state = db.get(ChatSummaryState, chat_id)
+            if state is None:
+                db.add(ChatSummaryState(chat_id=chat_id, last_message_id=last_message_id))
+            else:
+                state.last_message_id = last_message_id
         db.commit()
         db.refresh(chat)
     return chat
@@ -0,0 +1,181 @@
+from collections import namedtuple
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models.daily_adherence_rollups import DailyAdherenceRollup
+from models.medications import Medication
+from models.bp_schedules import BPSchedule
+from models.sugar_schedules import SugarSchedule
+from crud.reports import get_daily_adherence_counts, get_daily_adherence_counts_for_patients
+from utilities.adherence import CATEGORIES
+
+# Same shape as the rows returned by get_daily_adherence_counts, so both can be
+# fed to utilities.adherence.summarize_daily_counts.
+DailyCounts = namedtuple(
+    "DailyCounts",
+    ["day"] + [f"{category}_{field}" for category in CATEGORIES for field in ("scheduled", "completed")],
+)
+
+
+def last_closed_day(today: Optional[date] = None) -> date:
+    """Most recent day that can be materialized; today is always computed live."""
+    return (today or date.today()) - timedelta(days=1)
+
+
+def refresh_adherence_rollups(db: Session, patient_profile_id: int, start_date: date, end_date: date) -> int:
+    """
+    Recompute and upsert rollup rows for the closed days in [start_date, end_date].
+    Every category gets a row for every day (zero counts included) so that a missing
+    row always means "not materialized yet". Does not commit; returns the number of days written.
+    """
+    end_date = min(end_date, last_closed_day())
+    if start_date > end_date:
+        return 0
+
+    counts = {row.day: row for row in get_daily_adherence_counts(db, patient_profile_id, start_date, end_date)}
+    values = []
+    day = start_date
+    while day <= end_date:
+        row = counts.get(day)
+        for category in CATEGORIES:
+            values.append({
+                "patient_profile_id": patient_profile_id,
+                "date": day,
+                "category": category,
+                "scheduled": int(getattr(row, f"{category}_scheduled")) if row else 0,
+                "completed": int(getattr(row, f"{category}_completed")) if row else 0,
+            })
+        day += timedelta(days=1)
+
+    stmt = insert(DailyAdherenceRollup).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyAdherenceRollup.patient_profile_id, DailyAdherenceRollup.date, DailyAdherenceRollup.category],
+        set_={
+            "scheduled": stmt.excluded.scheduled,
+            "completed": stmt.excluded.completed,
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+    return len(values) // len(CATEGORIES)
+
+
+def refresh_adherence_days(db: Session, patient_profile_id: int, *days: Optional[date]) -> None:
+    """
+    Incremental hook for scheduled log writes: refresh the closed days a log was
+    added to, moved from/to or removed from, inside the caller's transaction.
+    Each refresh runs in a SAVEPOINT so a rollup failure never blocks the log write;
+    a day that could not be refreshed is dropped instead, and rebuilt lazily on the next read.
+    """
+    db.flush()
+    for day in sorted({day for day in days if day is not None}):
+        if day > last_closed_day():
+            continue
+        try:
+            with db.begin_nested():
+                refresh_adherence_rollups(db, patient_profile_id, day, day)
+        except Exception as e:
+            print(f"⚠️ Could not refresh adherence rollup for patient {patient_profile_id} on {day}, dropping it: {e}")
+            db.query(DailyAdherenceRollup).filter(
+                DailyAdherenceRollup.patient_profile_id == patient_profile_id,
+                DailyAdherenceRollup.date == day,
+            ).delete(synchronize_session=False)
+
+
+def invalidate_adherence_rollups(db: Session, patient_profile_id: int, from_date: Optional[date] = None) -> None:
+    """
+    Drop materialized days from from_date onwards (all days if None) after a schedule
+    change. Runs in the caller's transaction; the days are rebuilt lazily on the next read.
+    """
+    query = db.query(DailyAdherenceRollup).filter(DailyAdherenceRollup.patient_profile_id == patient_profile_id)
+    if from_date is not None:
+        query = query.filter(DailyAdherenceRollup.date >= from_date)
+    query.delete(synchronize_session=False)
+
+
+def _read_rollups(db: Session, patient_profile_ids: List[int], start_date: date, end_date: date) -> Dict[int, List[DailyCounts]]:
+    rows = (
+        db.query(
+            DailyAdherenceRollup.patient_profile_id,
+            DailyAdherenceRollup.date,
+            DailyAdherenceRollup.category,
+            DailyAdherenceRollup.scheduled,
+            DailyAdherenceRollup.completed,
+        )
+        .filter(
+            DailyAdherenceRollup.patient_profile_id.in_(patient_profile_ids),
+            DailyAdherenceRollup.date >= start_date,
+            DailyAdherenceRollup.date <= end_date,
+        )
+        .all()
+    )
+    by_patient = {patient_profile_id: {} for patient_profile_id in patient_profile_ids}
+    for patient_profile_id, day, category, scheduled, completed in rows:
+        counts = by_patient[patient_profile_id].setdefault(day, {"day": day, **{field: 0 for field in DailyCounts._fields[1:]}})
+        counts[f"{category}_scheduled"] = scheduled
+        counts[f"{category}_completed"] = completed
+    return {
+        patient_profile_id: [DailyCounts(**by_day[day]) for day in sorted(by_day)]
+        for patient_profile_id, by_day in by_patient.items()
+    }
+
+
+def get_daily_adherence_rows_for_patients(db: Session, patient_profile_ids: Iterable[int], start_date: date, end_date: date) -> Dict[int, List]:
+    """
+    Per-day, per-category counts for the window for several patients, keyed by
+    patient profile id: closed days come from the rollup table in one query
+    (materializing any missing ones first), today is computed live in one query.
+    """
+    patient_profile_ids = list(patient_profile_ids)
+    rows: Dict[int, List] = {patient_profile_id: [] for patient_profile_id in patient_profile_ids}
+    if not patient_profile_ids:
+        return rows
+
+    past_end = min(end_date, last_closed_day())
+    if start_date <= past_end:
+        window = [start_date + timedelta(days=n) for n in range((past_end - start_date).days + 1)]
+        stored = _read_rollups(db, patient_profile_ids, start_date, past_end)
+        incomplete = [patient_profile_id for patient_profile_id in patient_profile_ids if len(stored[patient_profile_id]) < len(window)]
+        if incomplete:
+            try:
+                for patient_profile_id in incomplete:
+                    materialized = {row.day for row in stored[patient_profile_id]}
+                    missing = [day for day in window if day not in materialized]
+                    refresh_adherence_rollups(db, patient_profile_id, missing[0], missing[-1])
+                db.commit()
+                stored.update(_read_rollups(db, incomplete, start_date, past_end))
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Could not materialize adherence rollups for patients {incomplete}: {e}")
+                stored.update(get_daily_adherence_counts_for_patients(db, incomplete, start_date, past_end))
+        for patient_profile_id in patient_profile_ids:
+            rows[patient_profile_id].extend(stored[patient_profile_id])
+
+    today = last_closed_day() + timedelta(days=1)
+    if start_date <= today <= end_date:
+        for patient_profile_id, live in get_daily_adherence_counts_for_patients(db, patient_profile_ids, today, today).items():
+            rows[patient_profile_id].extend(live)
+    return rows
+
+
+def get_daily_adherence_rows(db: Session, patient_profile_id: int, start_date: date, end_date: date) -> List:
+    """
+    Per-day, per-category counts for the window: closed days come from the rollup
+    table (materializing any missing ones first), today is computed live.
+    """
+    return get_daily_adherence_rows_for_patients(db, [patient_profile_id], start_date, end_date)[patient_profile_id]
+
+
+def get_earliest_schedule_start(db: Session, patient_profile_id: int) -> Optional[date]:
+    """First start_date across the patient's medication, BP and sugar schedules."""
+    starts = [
+        db.query(func.min(Medication.start_date)).filter(Medication.patient_profile_id == patient_profile_id).scalar(),
+        db.query(func.min(BPSchedule.start_date)).filter(BPSchedule.patient_profile_id == patient_profile_id).scalar(),
+        db.query(func.min(SugarSchedule.start_date)).filter(SugarSchedule.patient_profile_id == patient_profile_id).scalar(),
+    ]
+    starts = [start for start in starts if start is not None]
+    return min(starts) if starts else None
@@ -0,0 +1,144 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models.insight_jobs import InsightJob
+from constants.enums import InsightPeriodEnum, InsightJobStatusEnum
+
+
+def enqueue_insight_jobs(db: Session, patient_profile_ids: Iterable[int], period: InsightPeriodEnum, start_date: date) -> int:
+    """
+    Add a PENDING work item per patient; items that already exist (in any state) are
+    left alone, so re-running a scheduler firing never duplicates work. Does not commit.
+    Returns the number of new items.
+    """
+    values = [
+        {"patient_profile_id": patient_profile_id, "period": period, "start_date": start_date,
+         "status": InsightJobStatusEnum.PENDING, "attempts": 0}
+        for patient_profile_id in patient_profile_ids
+    ]
+    if not values:
+        return 0
+    stmt = insert(InsightJob).values(values).on_conflict_do_nothing(
+        index_elements=[InsightJob.patient_profile_id, InsightJob.period, InsightJob.start_date]
+    )
+    return db.execute(stmt).rowcount
+
+
+def request_insight_job(db: Session, patient_profile_id: int, period: InsightPeriodEnum, start_date: date):
+    """
+    Get or create the work item for one insight, re-arming it as a fresh PENDING item
+    if it already finished (DONE but the insight was since deleted, or FAILED).
+    A PENDING or RUNNING item is returned as is, so concurrent requests for the same
+    insight share one generation. Commits. Returns a row of (id, status).
+    """
+    stmt = insert(InsightJob).values(
+        patient_profile_id=patient_profile_id, period=period, start_date=start_date,
+        status=InsightJobStatusEnum.PENDING, attempts=0,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[InsightJob.patient_profile_id, InsightJob.period, InsightJob.start_date],
+        set_={"status": InsightJobStatusEnum.PENDING, "attempts": 0, "last_error": None, "finished_at": None,
+              "updated_at": datetime.now(timezone.utc)},
+        where=InsightJob.status.in_([InsightJobStatusEnum.DONE, InsightJobStatusEnum.FAILED]),
+    ).returning(InsightJob.id, InsightJob.status)
+    job = db.execute(stmt).first()
+    if job is None:
+        # Already queued or running: the conflict update did not apply
+        job = db.execute(
+            select(InsightJob.id, InsightJob.status).where(
+                InsightJob.patient_profile_id == patient_profile_id,
+                InsightJob.period == period,
+                InsightJob.start_date == start_date,
+            )
+        ).first()
+    db.commit()
+    return job
+
+
+def get_insight_job(db: Session, job_id: int) -> Optional[InsightJob]:
+    return db.get(InsightJob, job_id)
+
+
+def _lease_expired(lease_seconds: int):
+    return and_(
+        InsightJob.status == InsightJobStatusEnum.RUNNING,
+        InsightJob.locked_at < datetime.now(timezone.utc) - timedelta(seconds=lease_seconds),
+    )
+
+
+def fail_abandoned_insight_jobs(db: Session, lease_seconds: int, max_attempts: int) -> int:
+    """Mark RUNNING items whose lease expired on their final attempt as FAILED. Commits."""
+    result = db.execute(
+        update(InsightJob)
+        .where(_lease_expired(lease_seconds), InsightJob.attempts >= max_attempts)
+        .values(status=InsightJobStatusEnum.FAILED, last_error="Worker stopped during the final attempt.",
+                locked_by=None, locked_at=None, finished_at=datetime.now(timezone.utc))
+    )
+    db.commit()
+    return result.rowcount
+
+
+def claim_insight_jobs(db: Session, worker_id: str, lease_seconds: int, max_attempts: int, limit: int = 1,
+                       job_id: Optional[int] = None) -> List:
+    """
+    Atomically claim up to limit runnable items (PENDING, or RUNNING with an expired
+    lease) for worker_id, or only the item job_id when given. FOR UPDATE SKIP LOCKED
+    lets concurrent workers claim disjoint items without waiting on each other.
+    Commits so the claim is visible immediately.
+    Returns rows of (id, patient_profile_id, period, start_date, attempts).
+    """
+    conditions = [
+        or_(InsightJob.status == InsightJobStatusEnum.PENDING, _lease_expired(lease_seconds)),
+        InsightJob.attempts < max_attempts,
+    ]
+    if job_id is not None:
+        conditions.append(InsightJob.id == job_id)
+    claimable = (
+        select(InsightJob.id)
+        .where(*conditions)
+        .order_by(InsightJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    jobs = db.execute(
+        update(InsightJob)
+        .where(InsightJob.id.in_(claimable.scalar_subquery()))
+        .values(
+            status=InsightJobStatusEnum.RUNNING,
+            attempts=InsightJob.attempts + 1,
+            locked_by=worker_id,
+            locked_at=datetime.now(timezone.utc),
+        )
+        .returning(InsightJob.id, InsightJob.patient_profile_id, InsightJob.period, InsightJob.start_date, InsightJob.attempts)
+    ).all()
+    db.commit()
+    return jobs
+
+
+def finish_insight_job(db: Session, job_id: int, error: Optional[str] = None, max_attempts: Optional[int] = None) -> None:
+    """
+    Record the outcome of a claimed item. Success marks it DONE; a failure puts it back
+    to PENDING for another attempt, or FAILED once max_attempts is reached. Commits.
+    """
+    job = db.get(InsightJob, job_id)
+    if job is None:
+        return
+    job.locked_by = None
+    job.locked_at = None
+    if error is None:
+        job.status = InsightJobStatusEnum.DONE
+        job.last_error = None
+        job.finished_at = datetime.now(timezone.utc)
+    else:
+        job.last_error = error[:1000]
+        if max_attempts is not None and job.attempts >= max_attempts:
+            job.status = InsightJobStatusEnum.FAILED
+            job.finished_at = datetime.now(timezone.utc)
+        else:
+            job.status = InsightJobStatusEnum.PENDING
+    db.commit()
+
@@ -1,8 +1,10 @@
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from models.medication_schedules import MedicationSchedule
+from models.medications import Medication
 from schemas.medication_schedules import MedicationScheduleUpdate
 from fastapi import HTTPException
+from crud.daily_adherence_rollups import invalidate_adherence_rollups
 
 def get_schedules_for_medication(db: Session, medication_id: int) -> List[MedicationSchedule]:
     """Get all schedules for a given medication."""
@@ -26,6 +28,10 @@ def create_medication_schedule(db: Session, medication_id: int, scheduled_time,
         is_active=False
     ).first()
 
+    medication = db.query(Medication).filter_by(id=medication_id).first()
+    if medication:
+        invalidate_adherence_rollups(db, medication.patient_profile_id, medication.start_date)
+
     if existing_inactive:
         # Reactivate the inactive schedule
         existing_inactive.is_active = True
@@ -87,5 +93,6 @@ def delete_medication_schedule(db: Session, schedule_id: int) -> bool:
     schedule = db.query(MedicationSchedule).filter_by(id=schedule_id).first()
     if not schedule:
         return False
+    invalidate_adherence_rollups(db, schedule.medication.patient_profile_id, schedule.medication.start_date)
     db.delete(schedule)
     return True
@@ -10,6 +10,8 @@ from schemas.medications import MedicationUpdate, MedicationCreateWithSchedules
 from fastapi import HTTPException, status
 from utilities.permissions import can_modify_patient_schedules
 from constants.enums import FrequencyEnum
+from crud.daily_adherence_rollups import invalidate_adherence_rollups
+from utilities.patient_context_cache import invalidate_patient_context
 
 def create_medication_core(
     db: Session,
@@ -37,6 +39,8 @@ def create_medication_core(
         payload=payload
     )
 
+    invalidate_adherence_rollups(db, patient_profile_id, medication.start_date)
+    invalidate_patient_context(db, patient_profile_id)
     db.commit()
     db.refresh(medication)
     return medication
@@ -123,6 +127,8 @@ def update_medication(db: Session, medication_id: int, payload: MedicationUpdate
             detail="Medication not found."
         )
 
+    previous_start_date = medication.start_date
+
     # Validate duration_days
     print('Raw payload frequency:', payload.frequency)
 
@@ -184,6 +190,10 @@ def update_medication(db: Session, medication_id: int, payload: MedicationUpdate
                 # ✏️ Exists and active — update instruction only if provided
                 existing.dosage_instruction = instruction
 
+    # Schedule rules changed: past days must be re-materialized from the earlier start
+    invalidate_adherence_rollups(db, medication.patient_profile_id, min(previous_start_date, medication.start_date))
+    invalidate_patient_context(db, medication.patient_profile_id)
+
     # Commit changes with error handling
     try:
         db.flush()
@@ -207,5 +217,7 @@ def delete_medication(db: Session, medication_id: int, patient_profile_id: int)
     medication = db.query(Medication).filter_by(id=medication_id, patient_profile_id=patient_profile_id).first()
     if not medication:
         return False
+    invalidate_adherence_rollups(db, patient_profile_id, medication.start_date)
+    invalidate_patient_context(db, patient_profile_id)
     db.delete(medication)
     return True
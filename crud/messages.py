@@ -1,98 +1,124 @@
 from config import settings
-from dotenv import load_dotenv
 from fastapi import HTTPException
+from sqlalchemy import func, tuple_
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
-import google.generativeai as genai
-from typing import Tuple
+from typing import Iterator, Optional, Tuple
 
+from models.chats import Chat
 from models.messages import Message
-from crud.chats import get_chat_summary
+from crud.chats import get_chat, get_summarized_message_id, set_chat_summary
 from crud.scheduled_bp_logs import get_recent_bp_logs
 from crud.scheduled_sugar_logs import get_recent_sugar_logs
 from crud.medications import get_user_medicines
 
-from schemas.messages import MessageCreate, MessagePair
+from schemas.messages import ChatHistory, MessageCreate, MessagePair
 from constants.systemPrompt import system_prompt
+from utilities.gemini_client import generate_text, stream_text
+from utilities.patient_context_cache import patient_context_cache
+from utilities.chat_context import ContextPart, assemble_prompt, chat_prompt_stats
 
-load_dotenv()
+# chats.summary is capped by a check constraint
+CHAT_SUMMARY_MAX_LENGTH = 2000
 
-genai.configure(api_key=settings.GEMINI_API_KEY)
-
-gemini_model = genai.GenerativeModel("gemini-2.5-flash")
 
 class LLMResponseError(Exception):
     pass
 
-def get_llm_response(message: str, system_message: str) -> Tuple[str, int]:
-    prompt = system_message + '\n\nUser: ' + message
+def get_llm_response(prompt: str) -> str:
     try:
-        response = gemini_model.generate_content(prompt)
-        content = response.text
-        return content
+        return generate_text(prompt, max_attempts=settings.GEMINI_CHAT_MAX_ATTEMPTS)
     except Exception as e:
         print(f"Error while calling Gemini API: {e}")
         raise LLMResponseError(str(e))
 
 
-def create_message_with_ai(db: Session, user_id: int, message: MessageCreate, message_context: str):
+def build_patient_summary(db: Session, user_id: int) -> str:
+    """The patient's medicines and last readings, one line each ("" if there are none)."""
+    medicines = get_user_medicines(db, user_id)
+    bp_logs = get_recent_bp_logs(db, user_id, limit=4)
+    sugar_logs = get_recent_sugar_logs(db, user_id, limit=4)
+
+    # Format context parts
+    context_parts = []
+
+    if medicines:
+        med_names = ', '.join([f"{med.name} ({med.strength})" for med in medicines])
+        print(f"Current medications: {med_names}.")
+        context_parts.append(f"Current medications: {med_names}.")
+
+    if bp_logs:
+        formatted_bp = ', '.join([
+            f"{bp.checked_at.strftime('%b %d')}: {bp.systolic}/{bp.diastolic} mmHg"
+            for bp in bp_logs
+        ])
+        print(f"Last 4 blood pressure readings: {formatted_bp}.")
+        context_parts.append(f"Last 4 blood pressure readings: {formatted_bp}.")
+
+    if sugar_logs:
+        formatted_sugar = ', '.join([
+            f"{sugar.checked_at.strftime('%b %d')}: {sugar.value} mg/dL"
+            for sugar in sugar_logs
+        ])
+        print(f"Last 4 sugar level readings: {formatted_sugar}.")
+        context_parts.append(f"Last 4 sugar level readings: {formatted_sugar}.")
+
+    return '\n'.join(context_parts)
+
+
+def build_chat_prompt(db: Session, user_id: int, request: str, message_context: ChatHistory) -> str:
+    """
+    Prompt for the user's message: system prompt, the patient's medicines and recent
+    readings, the conversation summary and the latest message pairs, cut to
+    CHAT_PROMPT_MAX_TOKENS in that order of priority (utilities/chat_context.py).
+    """
+    patient_summary = patient_context_cache.get_or_build(user_id, lambda: build_patient_summary(db, user_id))
+    parts = [
+        ContextPart("system", system_prompt, required=True),
+        ContextPart("patient", patient_summary, priority=1, header='\n\n**Patient Summary**:\n'),
+        ContextPart(
+            "summary", message_context.summary, priority=2,
+            header='\nThe following is a summary of the previous conversation to maintain context:\n',
+            footer="\nPlease avoid repeating questions or greetings. Continue from where we left off.",
+        ),
+        ContextPart(
+            "recent", [f"User: {pair.user}\nAI: {pair.ai}" for pair in message_context.recent], priority=3,
+            header='\n\nMost recent messages:\n',
+        ),
+        ContextPart("request", request, required=True, header='\n\nUser: '),
+    ]
+    prompt, metrics = assemble_prompt(parts, settings.CHAT_PROMPT_MAX_TOKENS)
+    chat_prompt_stats.record(metrics)
+
+    print(prompt)
+    print(f"📏 Chat prompt ~{metrics['tokens']}/{metrics['max_tokens']} tokens, parts {metrics['parts']}"
+          + (f", truncated {metrics['truncated']}" if metrics['truncated'] else "")
+          + (f", dropped {metrics['dropped']}" if metrics['dropped'] else ""))
+    return prompt
+
+
+def save_message(db: Session, chat_id: int, request: str, response: str) -> Message:
+    user_message = Message(
+        response=response,
+        chat_id=chat_id,
+        request=request,
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    )
+    db.add(user_message)
+    db.commit()
+    db.refresh(user_message)
+    return user_message
+
+
+def create_message_with_ai(db: Session, user_id: int, message: MessageCreate, message_context: ChatHistory):
     try:
-        system_message = system_prompt
-
-        medicines = get_user_medicines(db, user_id)
-        bp_logs = get_recent_bp_logs(db, user_id, limit=4)
-        sugar_logs = get_recent_sugar_logs(db, user_id, limit=4)
-
-        # Format context parts
-        context_parts = []
-
-        if medicines:
-            med_names = ', '.join([f"{med.name} ({med.strength})" for med in medicines])
-            print(f"Current medications: {med_names}.")
-            context_parts.append(f"Current medications: {med_names}.")
-
-        if bp_logs:
-            formatted_bp = ', '.join([
-                f"{bp.checked_at.strftime('%b %d')}: {bp.systolic}/{bp.diastolic} mmHg"
-                for bp in bp_logs
-            ])
-            print(f"Last 4 blood pressure readings: {formatted_bp}.")
-            context_parts.append(f"Last 4 blood pressure readings: {formatted_bp}.")
-
-        if sugar_logs:
-            formatted_sugar = ', '.join([
-                f"{sugar.checked_at.strftime('%b %d')}: {sugar.value} mg/dL"
-                for sugar in sugar_logs
-            ])
-            print(f"Last 4 sugar level readings: {formatted_sugar}.")
-            context_parts.append(f"Last 4 sugar level readings: {formatted_sugar}.")
-
-        if context_parts:
-            print(context_parts)
-            system_message += '\n\n**Patient Summary**:\n' + '\n'.join(context_parts)
-
-        if message_context:
-            system_message += (
-                '\nThe following is a summary of the previous conversation to maintain context:\n' + message_context + "\nPlease avoid repeating questions or greetings. Continue from where we left off."
-            )
-
-        print(system_message)
+        prompt = build_chat_prompt(db, user_id, message.request, message_context)
 
         # Get Gemini Response
-        response = get_llm_response(message.request, system_message)
-
-        user_message = Message(
-            response=response,
-            chat_id=message.chat_id,
-            request=message.request,
-            created_at=datetime.now(timezone.utc),
-            updated_at=datetime.now(timezone.utc),
-        )
-        db.add(user_message)
-        db.commit()
-        db.refresh(user_message)
+        response = get_llm_response(prompt)
 
-        return user_message
+        return save_message(db, message.chat_id, message.request, response)
     except LLMResponseError as e:
         return {"error": f"LLM call failed: {e}"}, 0
     except Exception as e:
@@ -101,23 +127,38 @@ def create_message_with_ai(db: Session, user_id: int, message: MessageCreate, me
         return {"error": "Internal server error"}, 0
 
 
-def summarize_conversation_incremental(messages: list, previous_summary: str) -> Tuple[str, int]:
-    """Perform an incremental summary using Gemini."""
+def stream_llm_response(prompt: str) -> Iterator[str]:
+    """
+    Yield the answer chunk by chunk; generation starts on the first next() and is
+    cancelled if the generator is closed early. Failures raise LLMResponseError.
+    """
+    chunks = stream_text(prompt, max_attempts=settings.GEMINI_CHAT_MAX_ATTEMPTS)
+    try:
+        yield from chunks
+    except Exception as e:
+        print(f"Error while streaming from Gemini API: {e}")
+        raise LLMResponseError(str(e))
+    finally:
+        chunks.close()
+
+
+def summarize_conversation_incremental(messages: list, previous_summary: str) -> str:
+    """Fold the new message pairs into the previous summary using Gemini; failures raise LLMResponseError."""
     if not messages:
         return previous_summary
 
-    last_message = messages[-1]
+    new_messages = "\n".join(f"User: {message.user}\nAI: {message.ai}" for message in messages)
     new_content = (
         f"Previous Summary:\n{previous_summary}\n\n"
-        f"New Message:\nUser: {last_message.user}\nAI: {last_message.ai}"
+        f"New Messages:\n{new_messages}"
     )
     try:
-        response = gemini_model.generate_content(new_content + '\n\nPlease summarize the conversation succinctly:')
-        updated_summary = response.text
-        return updated_summary
+        summary = generate_text(new_content + '\n\nPlease summarize the conversation succinctly, in under 1500 characters:',
+                                max_attempts=settings.GEMINI_CHAT_MAX_ATTEMPTS)
     except Exception as e:
         print(f"Error summarizing conversation: {e}")
-        return previous_summary, 0
+        raise LLMResponseError(str(e))
+    return summary.strip()[:CHAT_SUMMARY_MAX_LENGTH]
 
 
 def get_message(db: Session, message_id: int) -> Message:
@@ -139,6 +180,53 @@ def get_messages_by_chat(db: Session, chat_id: int) -> list:
     return db.query(Message).filter(Message.chat_id == chat_id).all()
 
 
+def get_message_page(
+    db: Session,
+    chat_id: int,
+    limit: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    preview_chars: Optional[int] = None,
+) -> Tuple[list, bool]:
+    """
+    Up to `limit` messages of the chat, oldest first, and whether there are more in the
+    paging direction: the latest ones, or the ones right before/after the cursor message.
+    Keyset on (created_at, id), so every page is an index range scan on
+    idx_message_chat_created. With preview_chars the bodies are cut in the query.
+    """
+    if preview_chars:
+        query = db.query(
+            Message.id,
+            Message.chat_id,
+            func.substr(Message.request, 1, preview_chars).label("request"),
+            func.substr(Message.response, 1, preview_chars).label("response"),
+            ((func.length(Message.request) > preview_chars) | (func.length(Message.response) > preview_chars)).label("truncated"),
+            Message.created_at,
+        )
+    else:
+        query = db.query(Message)
+    query = query.filter(Message.chat_id == chat_id)
+
+    cursor_id = after if after is not None else before
+    if cursor_id is not None:
+        cursor = (
+            db.query(Message.created_at, Message.id)
+            .filter(Message.id == cursor_id, Message.chat_id == chat_id)
+            .first()
+        )
+        if cursor is None:
+            raise HTTPException(status_code=404, detail="Cursor message not found in this chat.")
+        key, cursor_key = tuple_(Message.created_at, Message.id), tuple_(cursor.created_at, cursor.id)
+        query = query.filter(key > cursor_key if after is not None else key < cursor_key)
+
+    if after is not None:
+        rows = query.order_by(Message.created_at.asc(), Message.id.asc()).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+
+    rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    return rows[:limit][::-1], len(rows) > limit
+
+
 def get_last_n_message_pairs(
     db: Session, chat_id: int, n: int = 5
 ) -> list[MessagePair]:
@@ -153,11 +241,69 @@ def get_last_n_message_pairs(
     return [MessagePair(user=row.request, ai=row.response) for row in rows]
 
 
-def get_summary(db: Session, chat_id: int) -> str:
-    messages = get_last_n_message_pairs(db, chat_id, 1)
-    summary = get_chat_summary(db, chat_id)
-    summary = summarize_conversation_incremental(messages, summary)
-    return summary
+def _pairs_after(db: Session, chat_id: int, after_id: int, limit: int):
+    """The first `limit` messages of the chat with an id above after_id, oldest first."""
+    return (
+        db.query(Message.id, Message.request, Message.response)
+        .filter(Message.chat_id == chat_id, Message.id > after_id)
+        .order_by(Message.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _summarized_message_id(db: Session, chat: Chat) -> int:
+    last_message_id = get_summarized_message_id(db, chat.id)
+    if last_message_id is not None:
+        return last_message_id
+    if not chat.summary:
+        return 0
+    # Summaries written before the watermark existed cover every message but the newest
+    previous = (
+        db.query(Message.id)
+        .filter(Message.chat_id == chat.id)
+        .order_by(Message.id.desc())
+        .offset(1)
+        .first()
+    )
+    return previous.id if previous else 0
+
+
+def get_chat_context(db: Session, chat: Chat) -> ChatHistory:
+    """
+    Conversation context for the next turn without calling Gemini: the stored summary
+    and the latest CHAT_RECENT_PAIRS pairs verbatim, which also cover messages the
+    background summary has not caught up with yet.
+    """
+    return ChatHistory(
+        summary=chat.summary or "",
+        recent=get_last_n_message_pairs(db, chat.id, settings.CHAT_RECENT_PAIRS),
+    )
+
+
+def summarize_chat(db: Session, chat_id: int) -> int:
+    """
+    Fold every message newer than the stored summary into it, oldest first and
+    CHAT_SUMMARY_CHUNK_PAIRS at a time, storing the summary after each chunk.
+    Returns the number of messages folded; a failure keeps what was stored so far.
+    """
+    chat = get_chat(db, chat_id)
+    if chat is None:
+        return 0
+    last_message_id = _summarized_message_id(db, chat)
+    summary = chat.summary or ""
+    folded = 0
+    while True:
+        pending = _pairs_after(db, chat_id, last_message_id, settings.CHAT_SUMMARY_CHUNK_PAIRS)
+        if not pending:
+            return folded
+        summary = summarize_conversation_incremental(
+            [MessagePair(user=row.request, ai=row.response) for row in pending],
+            summary,
+        )
+        last_message_id = pending[-1].id
+        set_chat_summary(db, chat_id, summary, last_message_id=last_message_id)
+        folded += len(pending)
 
 
 def get_last_user_message_by_chat(db: Session, chat_id: int) -> str:
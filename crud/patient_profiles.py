@@ -1,8 +1,19 @@
+from sqlalchemy import exists, or_
 from sqlalchemy.orm import Session
 from models.patient_profiles import PatientProfile
+from models.bp_schedules import BPSchedule
+from models.scheduled_bp_logs import ScheduledBPLog
+from models.sugar_schedules import SugarSchedule
+from models.scheduled_sugar_logs import ScheduledSugarLog
+from models.medications import Medication
+from models.medication_schedules import MedicationSchedule
+from models.scheduled_medication_logs import ScheduledMedicationLog
+from models.adhoc_bp_logs import AdhocBPLog
+from models.adhoc_sugar_logs import AdhocSugarLog
+from models.adhoc_medication_logs import AdhocMedicationLog
 from schemas.patient_profiles import PatientProfileCreate, PatientProfileUpdate
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime, time
 from fastapi import HTTPException
 from models.user_roles import UserRole
 from constants.enums import UserRoleEnum
@@ -47,3 +58,43 @@ def delete_patient_profile(db: Session, user_id: int):
     db.delete(profile)
     db.commit()
     return True
+
+
+def get_active_patient_ids_page(db: Session, start_date: date, end_date: date, after_id: int = 0, limit: int = 200) -> List[int]:
+    """
+    One keyset page of patient profile ids (ascending, > after_id) that have at least
+    one scheduled or adhoc log in [start_date, end_date]. Each EXISTS probe uses the
+    log tables' patient/schedule and timestamp indexes, so pages cost the same at any offset.
+    """
+    start_dt = datetime.combine(start_date, time.min)
+    end_dt = datetime.combine(end_date, time.max)
+    patient = PatientProfile.user_id
+    activity = or_(
+        exists().where(
+            BPSchedule.patient_profile_id == patient,
+            ScheduledBPLog.schedule_id == BPSchedule.id,
+            ScheduledBPLog.checked_at.between(start_dt, end_dt),
+        ),
+        exists().where(
+            SugarSchedule.patient_profile_id == patient,
+            ScheduledSugarLog.schedule_id == SugarSchedule.id,
+            ScheduledSugarLog.checked_at.between(start_dt, end_dt),
+        ),
+        exists().where(
+            Medication.patient_profile_id == patient,
+            MedicationSchedule.medication_id == Medication.id,
+            ScheduledMedicationLog.medication_schedule_id == MedicationSchedule.id,
+            ScheduledMedicationLog.taken_at.between(start_dt, end_dt),
+        ),
+        exists().where(AdhocBPLog.patient_profile_id == patient, AdhocBPLog.checked_at.between(start_dt, end_dt)),
+        exists().where(AdhocSugarLog.patient_profile_id == patient, AdhocSugarLog.checked_at.between(start_dt, end_dt)),
+        exists().where(AdhocMedicationLog.patient_profile_id == patient, AdhocMedicationLog.taken_at.between(start_dt, end_dt)),
+    )
+    rows = (
+        db.query(patient)
+        .filter(patient > after_id, activity)
+        .order_by(patient)
+        .limit(limit)
+        .all()
+    )
+    return [patient_profile_id for (patient_profile_id,) in rows]
@@ -0,0 +1,242 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from datetime import date, datetime, time
+from typing import Dict, Iterable, List
+
+from models.medications import Medication
+from models.medication_schedules import MedicationSchedule
+from models.medicines import Medicine
+from models.scheduled_medication_logs import ScheduledMedicationLog
+
+
+def _to_columns(rows, keys) -> Dict[str, list]:
+    """Pivot a list of row tuples into a dict of column lists."""
+    columns = {key: [] for key in keys}
+    for row in rows:
+        for key, value in zip(keys, row):
+            columns[key].append(value)
+    return columns
+
+
+MEDICATION_SCHEDULE_COLUMNS = (
+    "schedule_id",
+    "medication_id",
+    "medicine_name",
+    "scheduled_time",
+    "dosage_instruction",
+    "start_date",
+    "duration_days",
+    "frequency",
+    "custom_days",
+)
+
+MEDICATION_LOG_COLUMNS = (
+    "schedule_id",
+    "taken_at",
+)
+
+
+def load_medication_adherence_rows(db: Session, patient_profile_id: int, start_date: date, end_date: date) -> Dict[str, Dict[str, list]]:
+    """
+    Bulk-load active medication schedules and their in-range logs for a patient.
+    Two round trips regardless of how many medications/schedules the patient has:
+    one join for the schedules (with their medication's recurrence rules) and one
+    IN query for the logs. Returns plain column lists instead of ORM objects.
+    """
+    schedule_rows = (
+        db.query(
+            MedicationSchedule.id,
+            MedicationSchedule.medication_id,
+            Medicine.name,
+            MedicationSchedule.scheduled_time,
+            MedicationSchedule.dosage_instruction,
+            Medication.start_date,
+            Medication.duration_days,
+            Medication.frequency,
+            Medication.custom_days,
+        )
+        .join(Medication, MedicationSchedule.medication_id == Medication.id)
+        .join(Medicine, Medication.medicine_id == Medicine.id)
+        .filter(
+            Medication.patient_profile_id == patient_profile_id,
+            Medication.is_active.is_(True),
+            MedicationSchedule.is_active.is_(True),
+        )
+        .order_by(MedicationSchedule.medication_id, MedicationSchedule.scheduled_time)
+        .all()
+    )
+    schedules = _to_columns(schedule_rows, MEDICATION_SCHEDULE_COLUMNS)
+
+    log_rows: List[tuple] = []
+    if schedules["schedule_id"]:
+        log_rows = (
+            db.query(
+                ScheduledMedicationLog.medication_schedule_id,
+                ScheduledMedicationLog.taken_at,
+            )
+            .filter(
+                ScheduledMedicationLog.medication_schedule_id.in_(schedules["schedule_id"]),
+                ScheduledMedicationLog.taken_at >= datetime.combine(start_date, time.min),
+                ScheduledMedicationLog.taken_at <= datetime.combine(end_date, time.max),
+            )
+            .order_by(ScheduledMedicationLog.taken_at)
+            .all()
+        )
+
+    return {
+        "schedules": schedules,
+        "logs": _to_columns(log_rows, MEDICATION_LOG_COLUMNS),
+    }
+
+
+# Expands every active schedule against generate_series over the window, left-joins
+# the distinct (schedule, day) pairs that have a scheduled log, and pivots the counts
+# so the caller receives exactly one row per patient and day that has anything scheduled.
+# Takes an array of patient profile ids so a whole panel is counted in one round trip.
+# MONTHLY schedules fire on the start_date's day of month, clamped to short months;
+# WEEKLY schedules fire on the weekdays listed in custom_days.
+DAILY_ADHERENCE_SQL = text("""
+WITH days AS (
+    SELECT d::date AS day
+    FROM generate_series(CAST(:start_date AS date), CAST(:end_date AS date), interval '1 day') AS d
+),
+schedules AS (
+    SELECT m.patient_profile_id, 'medication' AS category, ms.id AS schedule_id, m.start_date, m.duration_days,
+           m.frequency::text AS frequency, m.custom_days::text[] AS custom_days
+    FROM medication_schedules ms
+    JOIN medications m ON m.id = ms.medication_id
+    WHERE m.patient_profile_id = ANY(:patient_profile_ids) AND m.is_active AND ms.is_active
+    UNION ALL
+    SELECT patient_profile_id, 'blood_pressure', id, start_date, duration_days, frequency::text, custom_days::text[]
+    FROM bp_schedules
+    WHERE patient_profile_id = ANY(:patient_profile_ids) AND is_active
+    UNION ALL
+    SELECT patient_profile_id, 'sugar', id, start_date, duration_days, frequency::text, custom_days::text[]
+    FROM sugar_schedules
+    WHERE patient_profile_id = ANY(:patient_profile_ids) AND is_active
+),
+expected AS (
+    SELECT s.patient_profile_id, s.category, s.schedule_id, d.day
+    FROM schedules s
+    JOIN days d
+      ON d.day >= s.start_date
+     AND (s.duration_days IS NULL OR d.day <= s.start_date + s.duration_days - 1)
+     AND (
+            s.frequency = 'DAILY'
+         OR (s.frequency = 'WEEKLY'
+             AND (ARRAY['MONDAY','TUESDAY','WEDNESDAY','THURSDAY','FRIDAY','SATURDAY','SUNDAY'])
+                 [extract(isodow FROM d.day)::int] = ANY(s.custom_days))
+         OR (s.frequency = 'MONTHLY'
+             AND extract(day FROM d.day) = least(
+                 extract(day FROM s.start_date),
+                 extract(day FROM date_trunc('month', d.day) + interval '1 month - 1 day')))
+     )
+),
+logged AS (
+    SELECT 'medication' AS category, l.medication_schedule_id AS schedule_id, l.taken_at::date AS day
+    FROM scheduled_medication_logs l
+    JOIN medication_schedules ms ON ms.id = l.medication_schedule_id
+    JOIN medications m ON m.id = ms.medication_id
+    WHERE m.patient_profile_id = ANY(:patient_profile_ids)
+      AND l.taken_at >= :start_ts AND l.taken_at <= :end_ts
+    UNION
+    SELECT 'blood_pressure', l.schedule_id, l.checked_at::date
+    FROM scheduled_bp_logs l
+    JOIN bp_schedules s ON s.id = l.schedule_id
+    WHERE s.patient_profile_id = ANY(:patient_profile_ids)
+      AND l.checked_at >= :start_ts AND l.checked_at <= :end_ts
+    UNION
+    SELECT 'sugar', l.schedule_id, l.checked_at::date
+    FROM scheduled_sugar_logs l
+    JOIN sugar_schedules s ON s.id = l.schedule_id
+    WHERE s.patient_profile_id = ANY(:patient_profile_ids)
+      AND l.checked_at >= :start_ts AND l.checked_at <= :end_ts
+)
+SELECT e.patient_profile_id, e.day,
+       count(*) FILTER (WHERE e.category = 'medication') AS medication_scheduled,
+       count(l.schedule_id) FILTER (WHERE e.category = 'medication') AS medication_completed,
+       count(*) FILTER (WHERE e.category = 'blood_pressure') AS blood_pressure_scheduled,
+       count(l.schedule_id) FILTER (WHERE e.category = 'blood_pressure') AS blood_pressure_completed,
+       count(*) FILTER (WHERE e.category = 'sugar') AS sugar_scheduled,
+       count(l.schedule_id) FILTER (WHERE e.category = 'sugar') AS sugar_completed
+FROM expected e
+LEFT JOIN logged l
+  ON l.category = e.category AND l.schedule_id = e.schedule_id AND l.day = e.day
+GROUP BY e.patient_profile_id, e.day
+ORDER BY e.patient_profile_id, e.day
+""")
+
+
+def get_daily_adherence_counts_for_patients(db: Session, patient_profile_ids: Iterable[int], start_date: date, end_date: date) -> Dict[int, list]:
+    """Per-day, per-category scheduled/completed counts for several patients, keyed by patient profile id."""
+    patient_profile_ids = list(patient_profile_ids)
+    counts = {patient_profile_id: [] for patient_profile_id in patient_profile_ids}
+    if not patient_profile_ids:
+        return counts
+    rows = db.execute(DAILY_ADHERENCE_SQL, {
+        "patient_profile_ids": patient_profile_ids,
+        "start_date": start_date,
+        "end_date": end_date,
+        "start_ts": datetime.combine(start_date, time.min),
+        "end_ts": datetime.combine(end_date, time.max),
+    }).all()
+    for row in rows:
+        counts[row.patient_profile_id].append(row)
+    return counts
+
+
+def get_daily_adherence_counts(db: Session, patient_profile_id: int, start_date: date, end_date: date):
+    """Compute per-day, per-category scheduled/completed counts inside PostgreSQL."""
+    return get_daily_adherence_counts_for_patients(db, [patient_profile_id], start_date, end_date)[patient_profile_id]
+
+
+# Cheap change-detection for a report window: count and latest updated_at of every
+# table a report reads. Counts catch deletions, max(updated_at) catches inserts and edits.
+# One row per requested patient; the correlated subqueries each hit a patient_profile_id index.
+REPORT_FINGERPRINT_SQL = text("""
+SELECT
+    p.id AS patient_profile_id,
+    (SELECT concat_ws('/', count(*), max(l.updated_at))
+       FROM scheduled_bp_logs l JOIN bp_schedules s ON s.id = l.schedule_id
+      WHERE s.patient_profile_id = p.id
+        AND l.checked_at >= :start_ts AND l.checked_at <= :end_ts) AS bp_logs,
+    (SELECT concat_ws('/', count(*), max(l.updated_at))
+       FROM scheduled_sugar_logs l JOIN sugar_schedules s ON s.id = l.schedule_id
+      WHERE s.patient_profile_id = p.id
+        AND l.checked_at >= :start_ts AND l.checked_at <= :end_ts) AS sugar_logs,
+    (SELECT concat_ws('/', count(*), max(l.updated_at))
+       FROM scheduled_medication_logs l
+       JOIN medication_schedules ms ON ms.id = l.medication_schedule_id
+       JOIN medications m ON m.id = ms.medication_id
+      WHERE m.patient_profile_id = p.id
+        AND l.taken_at >= :start_ts AND l.taken_at <= :end_ts) AS medication_logs,
+    (SELECT concat_ws('/', count(*), max(updated_at))
+       FROM bp_schedules WHERE patient_profile_id = p.id) AS bp_schedules,
+    (SELECT concat_ws('/', count(*), max(updated_at))
+       FROM sugar_schedules WHERE patient_profile_id = p.id) AS sugar_schedules,
+    (SELECT concat_ws('/', count(*), max(updated_at))
+       FROM medications WHERE patient_profile_id = p.id) AS medications,
+    (SELECT concat_ws('/', count(*), max(ms.updated_at))
+       FROM medication_schedules ms JOIN medications m ON m.id = ms.medication_id
+      WHERE m.patient_profile_id = p.id) AS medication_schedules,
+    (SELECT updated_at FROM users WHERE id = p.id) AS patient
+FROM unnest(CAST(:patient_profile_ids AS integer[])) AS p(id)
+""")
+
+
+def get_report_fingerprints(db: Session, patient_profile_ids: Iterable[int], start_date: date, end_date: date) -> Dict[int, tuple]:
+    """Fingerprints for several patients' reports over the same window, in one round trip."""
+    patient_profile_ids = list(patient_profile_ids)
+    if not patient_profile_ids:
+        return {}
+    rows = db.execute(REPORT_FINGERPRINT_SQL, {
+        "patient_profile_ids": patient_profile_ids,
+        "start_ts": datetime.combine(start_date, time.min),
+        "end_ts": datetime.combine(end_date, time.max),
+    }).all()
+    return {row[0]: tuple(str(value) for value in row[1:]) for row in rows}
+
+
+def get_report_fingerprint(db: Session, patient_profile_id: int, start_date: date, end_date: date) -> tuple:
+    """Summarize everything a report for the window depends on into one comparable tuple."""
+    return get_report_fingerprints(db, [patient_profile_id], start_date, end_date)[patient_profile_id]
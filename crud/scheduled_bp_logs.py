@@ -6,6 +6,8 @@ from models.scheduled_bp_logs import ScheduledBPLog
 from models.bp_schedules import BPSchedule
 from schemas.scheduled_bp_logs import ScheduledBPLogCreate, ScheduledBPLogUpdate
 from utilities.permissions import can_modify_patient_logs
+from crud.daily_adherence_rollups import refresh_adherence_days
+from utilities.patient_context_cache import invalidate_patient_context
 
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
@@ -49,6 +51,8 @@ def create_bp_log(db: Session, actor_user, schedule_id: int, data: ScheduledBPLo
 
     try:
         db.add(log)
+        refresh_adherence_days(db, schedule.patient_profile_id, checked_date)
+        invalidate_patient_context(db, schedule.patient_profile_id)
         db.commit()
         db.refresh(log)
         return log
@@ -90,9 +94,12 @@ def update_bp_log(db: Session, log_id: int, data: ScheduledBPLogUpdate) -> Optio
     if not log:
         return None
 
+    previous_date = log.checked_at.date()
     for field, value in data.dict(exclude_unset=True).items():
         setattr(log, field, value)
 
+    refresh_adherence_days(db, log.schedule.patient_profile_id, previous_date, log.checked_at.date())
+    invalidate_patient_context(db, log.schedule.patient_profile_id)
     db.commit()
     db.refresh(log)
     return log
@@ -103,7 +110,11 @@ def delete_bp_log(db: Session, log_id: int) -> bool:
     if not log:
         return False
 
+    patient_profile_id = log.schedule.patient_profile_id
+    checked_date = log.checked_at.date()
     db.delete(log)
+    refresh_adherence_days(db, patient_profile_id, checked_date)
+    invalidate_patient_context(db, patient_profile_id)
     db.commit()
     return True
 
@@ -132,7 +143,7 @@ def get_recent_bp_logs(db: Session, user_id: int, limit: int = 4) -> List[Schedu
     return (
         db.query(ScheduledBPLog)
         .join(BPSchedule)
-        .filter(BPSchedule.user_id == user_id)
+        .filter(BPSchedule.patient_profile_id == user_id)
         .order_by(ScheduledBPLog.checked_at.desc())
         .limit(limit)
         .all()
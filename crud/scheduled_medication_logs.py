@@ -8,6 +8,7 @@ from typing import List
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 from utilities.permissions import can_modify_patient_logs, can_modify_patient_schedules
+from crud.daily_adherence_rollups import refresh_adherence_days
 
 def create_log(db: Session, schedule_id: int, log_data, actor_user: int) -> ScheduledMedicationLog:
     schedule = (
@@ -30,6 +31,7 @@ def create_log(db: Session, schedule_id: int, log_data, actor_user: int) -> Sche
     )
     db.add(log)
     try:
+        refresh_adherence_days(db, medication.patient_profile_id, log.taken_at.date())
         db.commit()
         db.refresh(log)
         return log
@@ -101,8 +103,10 @@ def update_log(db: Session, log_id: int, updates: MedicationLogUpdate, actor_use
     if not can_modify_patient_logs(db, actor_user, medication.patient_profile_id):
         raise HTTPException(status_code=403, detail="Unauthorized")
     
+    previous_date = log.taken_at.date()
     for key, value in updates.model_dump(exclude_unset=True).items():
         setattr(log, key, value)
+    refresh_adherence_days(db, medication.patient_profile_id, previous_date, log.taken_at.date())
     db.commit()
     db.refresh(log)
     return log
@@ -123,7 +127,9 @@ def delete_log(db: Session, log_id: int, actor_user):
     medication = log.schedule.medication
     if not can_modify_patient_logs(db, actor_user, medication.patient_profile_id):
         raise HTTPException(status_code=403, detail="Unauthorized")
+    taken_date = log.taken_at.date()
     db.delete(log)
+    refresh_adherence_days(db, medication.patient_profile_id, taken_date)
     db.commit()
     return True
 
@@ -6,10 +6,12 @@ from datetime import datetime, date
 from models.scheduled_sugar_logs import ScheduledSugarLog
 from models.sugar_schedules import SugarSchedule
 from schemas.scheduled_sugar_logs import SugarLogCreate, SugarLogUpdate
+from crud.daily_adherence_rollups import refresh_adherence_days
+from utilities.patient_context_cache import invalidate_patient_context
 
 def create_sugar_log(db: Session, user_id: int, schedule_id: int, data: SugarLogCreate) -> ScheduledSugarLog:
     if schedule_id:
-        schedule = db.query(SugarSchedule).filter_by(id=schedule_id, user_id=user_id).first()
+        schedule = db.query(SugarSchedule).filter_by(id=schedule_id, patient_profile_id=user_id).first()
         if not schedule:
             raise PermissionError("Invalid schedule ID or not authorized")
 
@@ -23,6 +25,9 @@ def create_sugar_log(db: Session, user_id: int, schedule_id: int, data: SugarLog
     # infer user_id from schedule
     log.schedule = db.query(SugarSchedule).filter_by(id=schedule_id).first() if schedule_id else None
     db.add(log)
+    if log.schedule:
+        refresh_adherence_days(db, log.schedule.patient_profile_id, log.checked_at.date())
+        invalidate_patient_context(db, log.schedule.patient_profile_id)
     db.commit()
     db.refresh(log)
     return log
@@ -30,23 +35,23 @@ def create_sugar_log(db: Session, user_id: int, schedule_id: int, data: SugarLog
 def get_sugar_log_by_id(db: Session, log_id: int, user_id: int) -> Optional[ScheduledSugarLog]:
     return db.query(ScheduledSugarLog).join(SugarSchedule).filter(
         ScheduledSugarLog.id == log_id,
-        SugarSchedule.user_id == user_id
+        SugarSchedule.patient_profile_id == user_id
     ).first()
 
 def get_sugar_logs_by_schedule(db: Session, schedule_id: int, user_id: int) -> List[ScheduledSugarLog]:
     return db.query(ScheduledSugarLog).join(SugarSchedule).filter(
         ScheduledSugarLog.schedule_id == schedule_id,
-        SugarSchedule.user_id == user_id
+        SugarSchedule.patient_profile_id == user_id
     ).all()
 
 def get_sugar_logs_by_user(db: Session, user_id: int) -> List[ScheduledSugarLog]:
-    return db.query(ScheduledSugarLog).join(SugarSchedule).filter(SugarSchedule.user_id == user_id).all()
+    return db.query(ScheduledSugarLog).join(SugarSchedule).filter(SugarSchedule.patient_profile_id == user_id).all()
 
 def get_recent_sugar_logs(db: Session, user_id: int, limit: int = 4) -> List[ScheduledSugarLog]:
     return (
         db.query(ScheduledSugarLog)
         .join(SugarSchedule)
-        .filter(SugarSchedule.user_id == user_id)
+        .filter(SugarSchedule.patient_profile_id == user_id)
         .order_by(ScheduledSugarLog.checked_at.desc())
         .limit(limit)
         .all()
@@ -54,7 +59,7 @@ def get_recent_sugar_logs(db: Session, user_id: int, limit: int = 4) -> List[Sch
 
 def get_sugar_logs_by_date_range(db: Session, user_id: int, start: date, end: date) -> List[ScheduledSugarLog]:
     return db.query(ScheduledSugarLog).join(SugarSchedule).filter(
-        SugarSchedule.user_id == user_id,
+        SugarSchedule.patient_profile_id == user_id,
         ScheduledSugarLog.checked_at >= datetime.combine(start, datetime.min.time()),
         ScheduledSugarLog.checked_at <= datetime.combine(end, datetime.max.time())
     ).all()
@@ -64,7 +69,7 @@ def get_sugar_logs_by_date(db: Session, user_id: int, target_date: date) -> List
     end_dt = datetime.combine(target_date, datetime.max.time())
 
     return db.query(ScheduledSugarLog).join(SugarSchedule).filter(
-        SugarSchedule.user_id == user_id,
+        SugarSchedule.patient_profile_id == user_id,
         ScheduledSugarLog.checked_at >= start_dt,
         ScheduledSugarLog.checked_at <= end_dt
     ).all()
@@ -72,7 +77,7 @@ def get_sugar_logs_by_date(db: Session, user_id: int, target_date: date) -> List
 def update_sugar_log(db: Session, log_id: int, user_id: int, data: SugarLogUpdate) -> Optional[ScheduledSugarLog]:
     log = db.query(ScheduledSugarLog).join(SugarSchedule).filter(
         ScheduledSugarLog.id == log_id,
-        SugarSchedule.user_id == user_id
+        SugarSchedule.patient_profile_id == user_id
     ).first()
 
     if not log:
@@ -80,9 +85,12 @@ def update_sugar_log(db: Session, log_id: int, user_id: int, data: SugarLogUpdat
 
     update_data = data.dict(exclude_unset=True)
 
+    previous_date = log.checked_at.date()
     for key, value in update_data.items():
         setattr(log, key, value)
 
+    refresh_adherence_days(db, log.schedule.patient_profile_id, previous_date, log.checked_at.date())
+    invalidate_patient_context(db, log.schedule.patient_profile_id)
     db.commit()
     db.refresh(log)
     return log
@@ -90,12 +98,16 @@ def update_sugar_log(db: Session, log_id: int, user_id: int, data: SugarLogUpdat
 def delete_sugar_log(db: Session, log_id: int, user_id: int) -> bool:
     log = db.query(ScheduledSugarLog).join(SugarSchedule).filter(
         ScheduledSugarLog.id == log_id,
-        SugarSchedule.user_id == user_id
+        SugarSchedule.patient_profile_id == user_id
     ).first()
 
     if not log:
         return False
 
+    patient_profile_id = log.schedule.patient_profile_id
+    checked_date = log.checked_at.date()
     db.delete(log)
+    refresh_adherence_days(db, patient_profile_id, checked_date)
+    invalidate_patient_context(db, patient_profile_id)
     db.commit()
     return True
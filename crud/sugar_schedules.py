@@ -6,6 +6,7 @@ from schemas.sugar_schedules import SugarScheduleUpdate, SugarScheduleCreate
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 from utilities.permissions import can_modify_patient_schedules
+from crud.daily_adherence_rollups import invalidate_adherence_rollups
 from constants.enums import FrequencyEnum, DayOfWeekEnum, SugarTypeEnum
 
 
@@ -33,6 +34,7 @@ def create_sugar_schedule_core(
         payload=payload
     )
 
+    invalidate_adherence_rollups(db, patient_profile_id, payload.start_date)
     db.commit()
     for schedule in schedules:
         db.refresh(schedule)
@@ -158,6 +160,8 @@ def update_sugar_schedule(db: Session, schedule_id: int, payload: SugarScheduleU
             detail="Sugar schedule not found."
         )
 
+    previous_start_date = schedule.start_date
+
     # Validate duration_days
     if payload.duration_days is not None:
         if payload.duration_days <= 0:
@@ -247,6 +251,9 @@ def update_sugar_schedule(db: Session, schedule_id: int, payload: SugarScheduleU
             
             schedule.scheduled_time = new_time
 
+    # Schedule rules changed: past days must be re-materialized from the earlier start
+    invalidate_adherence_rollups(db, schedule.patient_profile_id, min(previous_start_date, schedule.start_date))
+
     # Commit changes with error handling (same as medications)
     try:
         db.flush()
@@ -265,6 +272,7 @@ def delete_sugar_schedule(db: Session, schedule_id: int, patient_profile_id: int
     schedule = db.query(SugarSchedule).filter_by(id=schedule_id, patient_profile_id=patient_profile_id).first()
     if not schedule:
         return False
+    invalidate_adherence_rollups(db, patient_profile_id, schedule.start_date)
     db.delete(schedule)
     return True
 
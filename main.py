@@ -3,6 +3,7 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from database import Base, engine
 from tasks.scheduler import start_scheduler
+from config import settings
 import os
 from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
@@ -52,7 +53,10 @@ app.add_middleware(
 Base.metadata.create_all(bind=engine)
 
 app.include_router(routes.router)
-start_scheduler()
+
+# Scheduled jobs run here unless a dedicated worker tier (tasks/worker.py) owns them
+if settings.RUN_SCHEDULER:
+    start_scheduler()
 
 @app.exception_handler(ValueError)
 async def value_error_exception_handler(request: Request, exc: ValueError):
@@ -20,6 +20,9 @@ from .connections import Connection
 from .weight_logs import WeightLog
 from .reminders import Reminder
 from .patient_notes import PatientNote
+from .daily_adherence_rollups import DailyAdherenceRollup
+from .insight_jobs import InsightJob
+from .chat_summary_states import ChatSummaryState
 from constants.enums import UserRoleEnum, InsightPeriodEnum, ConnectionTypeEnum, ConnectionStatusEnum, SugarTypeEnum, GenderEnum
 
 __all__ = [
@@ -51,4 +54,7 @@ __all__ = [
     "WeightLog",
     "Reminder",
     "PatientNote",
+    "DailyAdherenceRollup",
+    "InsightJob",
+    "ChatSummaryState",
 ]
\ No newline at end of file
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from database import Base
+
+
+class ChatSummaryState(Base):
+    """
+    How far chats.summary has got: the id of the newest message folded into it.
+    Messages with a higher id are still pending. Kept apart from chats so that
+    unrelated chat updates (e.g. a topic rename) cannot move it. No foreign key to
+    messages, because the message may be deleted later (e.g. by /regenerate).
+    """
+    __tablename__ = 'chat_summary_states'
+
+    chat_id = Column(Integer, ForeignKey('chats.id', ondelete='CASCADE'), primary_key=True)
+    last_message_id = Column(Integer, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
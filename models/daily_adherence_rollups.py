@@ -0,0 +1,30 @@
+from sqlalchemy import (
+    Column, Integer, String, Date,
+    DateTime, ForeignKey, CheckConstraint, Index
+)
+from sqlalchemy.sql import func
+from database import Base
+
+
+class DailyAdherenceRollup(Base):
+    """
+    Materialized scheduled/completed counts per patient, day and category.
+    Only past days are stored; "today" is always computed live.
+    A day with no rows has not been materialized yet (zero counts are stored).
+    """
+    __tablename__ = 'daily_adherence_rollups'
+
+    patient_profile_id = Column(Integer, ForeignKey('patient_profiles.user_id', ondelete='CASCADE'), primary_key=True)
+    date = Column(Date, primary_key=True)
+    category = Column(String(20), primary_key=True)
+    scheduled = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        CheckConstraint("category IN ('medication', 'blood_pressure', 'sugar')", name='check_rollup_category'),
+        CheckConstraint("scheduled >= 0 AND completed >= 0 AND completed <= scheduled", name='check_rollup_counts'),
+        Index('idx_rollup_date', 'date'),
+    )
+
@@ -0,0 +1,37 @@
+from sqlalchemy import (
+    Column, Integer, String, Date,
+    DateTime, ForeignKey, Enum, CheckConstraint, UniqueConstraint, Index
+)
+from sqlalchemy.sql import func
+from database import Base
+from constants.enums import InsightPeriodEnum, InsightJobStatusEnum
+
+
+class InsightJob(Base):
+    """
+    Durable work item for scheduled and on-demand insight generation, one per
+    (patient, period, start_date).
+    Workers claim PENDING items with FOR UPDATE SKIP LOCKED; a RUNNING item whose
+    lease (locked_at) expired belongs to a crashed worker and is claimed again.
+    """
+    __tablename__ = 'insight_jobs'
+
+    id = Column(Integer, primary_key=True)
+    patient_profile_id = Column(Integer, ForeignKey('patient_profiles.user_id', ondelete='CASCADE'), nullable=False, index=True)
+    period = Column(Enum(InsightPeriodEnum), nullable=False)
+    start_date = Column(Date, nullable=False)
+    status = Column(Enum(InsightJobStatusEnum), nullable=False, default=InsightJobStatusEnum.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(1000), nullable=True)
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        CheckConstraint("attempts >= 0", name='check_insight_job_attempts'),
+        UniqueConstraint('patient_profile_id', 'period', 'start_date', name='uq_insight_job_patient_period_date'),
+        Index('idx_insight_job_status', 'status', 'id'),
+    )
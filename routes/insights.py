@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, Query
+import asyncio
+import time
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from database import get_db
+from config import settings
+from database import get_db, SessionLocal
 from utilities.insight_generator import generate_insight
 from datetime import date, timedelta
 from middlewares.auth import get_current_user
 from models.users import User
 from crud.insights import get_insight_by_period_and_date
-from constants.enums import InsightPeriodEnum
+from constants.enums import InsightPeriodEnum, InsightJobStatusEnum
+from crud.insight_jobs import request_insight_job, get_insight_job
 from tasks.scheduler import generate_insights
+from tasks.insight_runner import on_demand_insights
 from utilities.insight_generator import generate_and_save_insight
+from utilities.insight_cache import insight_cache
+from utilities.sse import sse_event, SSE_KEEPALIVE
 
 router = APIRouter()
 
@@ -16,21 +27,120 @@ router = APIRouter()
 def generate_insight_route(
     period: InsightPeriodEnum = Query(InsightPeriodEnum.DAILY, description="Insight period: daily, weekly, or monthly")
 ):
-    generate_insights(period)
+    return generate_insights(period)
+
+FINISHED_JOB_STATUSES = (InsightJobStatusEnum.DONE, InsightJobStatusEnum.FAILED)
+EVENTS_POLL_SECONDS = 1
+EVENTS_KEEPALIVE_SECONDS = 15
+
+
+def insight_job_urls(job_id: int) -> dict:
+    return {"status_url": f"/insights/jobs/{job_id}", "events_url": f"/insights/jobs/{job_id}/events"}
+
+
+def insight_job_status(db: Session, job) -> dict:
+    """Status of an on-demand insight job, with the insight once it is ready."""
+    insight = None
+    if job.status == InsightJobStatusEnum.DONE:
+        insight = get_insight_by_period_and_date(db, job.patient_profile_id, job.period, job.start_date)
+    return {
+        "job_id": job.id,
+        "status": job.status.value,
+        "attempts": job.attempts,
+        "error": job.last_error if job.status == InsightJobStatusEnum.FAILED else None,
+        "insight": jsonable_encoder(insight) if insight else None,
+    }
+
+
+def get_own_insight_job(db: Session, job_id: int, user: User):
+    job = get_insight_job(db, job_id)
+    if job is None or job.patient_profile_id != user.id:
+        raise HTTPException(status_code=404, detail="Insight job not found.")
+    return job
+
 
 @router.get("")
 def get_insight_route(
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     period: InsightPeriodEnum = Query(InsightPeriodEnum.DAILY, description="Insight period: daily, weekly, or monthly"),
     start_date: date = Query((date.today() - timedelta(days=1)), description="Start date for the insight period (defaults to yesterday)")
 ):
+    """
+    Return the insight if it exists; otherwise queue its generation and answer 202 with
+    a status URL to poll (or an events URL to stream). Concurrent requests for the same
+    insight share one job.
+    """
     insight_data = get_insight_by_period_and_date(db, current_user.id, period, start_date)
-    if not insight_data:
-        insight_data = generate_and_save_insight(db, current_user.id, period, start_date)
-    if not insight_data:
-        return {"success": False, "error": "Could not generate insight (no data)."}
-    return {"success": True, "insight": insight_data}
+    if insight_data:
+        return {"success": True, "insight": insight_data}
+
+    try:
+        job = request_insight_job(db, current_user.id, period, start_date)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Patient profile not found.")
+    on_demand_insights.submit(job.id)
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {"success": True, "job_id": job.id, "status": job.status.value, **insight_job_urls(job.id)}
+
+
+@router.get("/jobs/{job_id}")
+def get_insight_job_route(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Poll an on-demand insight job; includes the insight once status is DONE."""
+    return insight_job_status(db, get_own_insight_job(db, job_id, current_user))
+
+
+def _read_job_status(job_id: int, user_id: int) -> dict:
+    """insight_job_status in a short-lived session, None if the job is not the user's."""
+    db: Session = SessionLocal()
+    try:
+        job = get_insight_job(db, job_id)
+        if job is None or job.patient_profile_id != user_id:
+            return None
+        return insight_job_status(db, job)
+    finally:
+        db.close()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_insight_job_route(job_id: int, request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Server-sent events for an on-demand insight job: a "status" event whenever the
+    status changes, ending after DONE or FAILED (or INSIGHT_EVENTS_TIMEOUT_SECONDS).
+    """
+    current = await run_in_threadpool(_read_job_status, job_id, current_user.id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Insight job not found.")
+
+    async def events():
+        last_status, last_sent = None, time.monotonic()
+        deadline = time.monotonic() + settings.INSIGHT_EVENTS_TIMEOUT_SECONDS
+        job_status = current
+        while True:
+            if job_status is None:
+                return
+            if job_status["status"] != last_status:
+                last_status, last_sent = job_status["status"], time.monotonic()
+                yield sse_event("status", job_status)
+                if InsightJobStatusEnum(last_status) in FINISHED_JOB_STATUSES:
+                    return
+            elif time.monotonic() - last_sent >= EVENTS_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield SSE_KEEPALIVE
+            if time.monotonic() >= deadline or await request.is_disconnected():
+                return
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+            job_status = await run_in_threadpool(_read_job_status, job_id, current_user.id)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/cache/stats")
+def get_insight_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit/miss counters and size of the insight prompt cache."""
+    return insight_cache.stats()
 
 # @router.post("")
 # def generate_insight_route(
@@ -1,34 +1,45 @@
 import os
-from database import get_db
+from database import get_db, SessionLocal
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
+from config import settings
 from models.chats import Chat
-from crud.chats import (
-    get_chat,
-    get_chat_summary,
-    set_chat_summary,
-)
+from crud.chats import get_chat
 
 from models.users import User
 from middlewares.auth import get_current_user
 
 from schemas.messages import (
+    ChatHistory,
     MessageCreate,
+    MessagePage,
+    MessagePreview,
     MessageResponse,
     Regenerate_Message,
 )
 from crud.messages import (
     get_message,
-    get_summary,
+    save_message,
     delete_message,
+    LLMResponseError,
     delete_last_message,
-    get_messages_by_chat,
+    stream_llm_response,
+    get_chat_context,
+    get_message_page,
+    build_chat_prompt,
     create_message_with_ai,
     get_last_user_message_by_chat,
 )
+from utilities.sse import sse_event
+from utilities.chat_context import chat_prompt_stats
+from utilities.patient_context_cache import patient_context_cache
+from tasks.chat_summaries import chat_summarizer
 
 load_dotenv()
 
@@ -39,7 +50,7 @@ def _generate_response(
     user: User,
     chat: Chat,
     request_text: str,
-    message_context: str,
+    message_context: ChatHistory,
 ) -> MessageResponse:
     saved_message = create_message_with_ai(
         db,
@@ -52,6 +63,7 @@ def _generate_response(
     )
     if isinstance(saved_message, dict) and "error" in saved_message:
         raise HTTPException(status_code=502, detail=saved_message["error"])
+    chat_summarizer.submit(chat.id)
 
     db.commit()
     db.refresh(user)
@@ -87,11 +99,11 @@ def send_message_regenerate(
         )
 
     request_text = get_last_user_message_by_chat(db, chat.id)
-    message_context = get_chat_summary(db, chat.id)
 
     _validate_request(current_user, request_text)
 
     delete_last_message(db, chat.id)
+    message_context = get_chat_context(db, chat)
 
     return _generate_response(
         db,
@@ -102,6 +114,31 @@ def send_message_regenerate(
     )
 
 
+def _resolve_chat(db: Session, current_user: User, message_data: MessageCreate):
+    """The message's chat (a new one if no chat_id) and the context of the conversation so far."""
+    message_context = ChatHistory()
+    chat_id = message_data.chat_id
+
+    if chat_id:
+        chat = get_chat(db, chat_id)
+        if chat is None or chat.user_id != current_user.id:
+            raise HTTPException(
+                status_code=404 if chat is None else 403,
+                detail="Chat not found" if chat is None else "Not authorized",
+            )
+        return chat, get_chat_context(db, chat)
+
+    new_chat = Chat(
+        user_id=current_user.id,
+        topic=message_data.request[:30],
+        created_at=datetime.now(timezone.utc),
+    )
+    db.add(new_chat)
+    db.commit()
+    db.refresh(new_chat)
+    return new_chat, message_context
+
+
 @router.post("", response_model=MessageResponse)
 def send_message(
     message_data: MessageCreate,
@@ -110,30 +147,7 @@ def send_message(
 ):
     _validate_request(current_user, message_data.request)
 
-    message_context = ""
-    chat_id = message_data.chat_id
-
-    if chat_id:
-        message_context = get_summary(db, chat_id)
-        set_chat_summary(db, chat_id, message_context)
-
-    if not chat_id:
-        new_chat = Chat(
-            user_id=current_user.id,
-            topic=message_data.request[:30],
-            created_at=datetime.now(timezone.utc),
-        )
-        db.add(new_chat)
-        db.commit()
-        db.refresh(new_chat)
-        chat_id = new_chat.id
-
-    chat = get_chat(db, chat_id)
-    if chat is None or chat.user_id != current_user.id:
-        raise HTTPException(
-            status_code=404 if chat is None else 403,
-            detail="Chat not found" if chat is None else "Not authorized",
-        )
+    chat, message_context = _resolve_chat(db, current_user, message_data)
 
     response = _generate_response(
         db,
@@ -149,6 +163,89 @@ def send_message(
     return response
 
 
+def _persist_streamed_message(chat_id: int, request_text: str, response_text: str) -> dict:
+    db: Session = SessionLocal()
+    try:
+        message = save_message(db, chat_id, request_text, response_text)
+        return MessageResponse.model_validate(message).model_dump(mode="json")
+    finally:
+        db.close()
+
+
+def _close_stream(chunks):
+    try:
+        chunks.close()
+    except ValueError:
+        pass  # still running in a worker thread after a cancelled read; it stops at its next chunk
+
+
+async def _relay_stream(request: Request, chunks, chat_id: int, request_text: str):
+    """
+    SSE body: "start" with the chat id, a "chunk" per piece of the answer, then "done"
+    with the saved message (or "error"). Nothing is saved if the client disconnects;
+    closing the chunk stream cancels the generation.
+    """
+    yield sse_event("start", {"chat_id": chat_id})
+    parts = []
+    try:
+        while True:
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+            if await request.is_disconnected():
+                print(f"🔌 Client left chat {chat_id} mid-answer, generation stopped.")
+                return
+            parts.append(chunk)
+            yield sse_event("chunk", {"text": chunk})
+    except LLMResponseError as e:
+        yield sse_event("error", {"detail": f"LLM call failed: {e}"})
+        return
+    finally:
+        _close_stream(chunks)
+
+    try:
+        message = await run_in_threadpool(_persist_streamed_message, chat_id, request_text, "".join(parts))
+    except Exception as e:
+        print(f"DB Error: {e}")
+        yield sse_event("error", {"detail": "Internal server error"})
+        return
+    chat_summarizer.submit(chat_id)
+    yield sse_event("done", message)
+
+
+@router.post("/stream")
+def stream_message(
+    message_data: MessageCreate,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Like POST /messages, but relays the answer as server-sent events while it is
+    generated. The message is saved once the answer is complete.
+    """
+    _validate_request(current_user, message_data.request)
+
+    chat, message_context = _resolve_chat(db, current_user, message_data)
+    prompt = build_chat_prompt(db, current_user.id, message_data.request, message_context)
+    chunks = stream_llm_response(prompt)
+
+    return StreamingResponse(
+        _relay_stream(request, chunks, chat.id, message_data.request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/context/stats")
+def chat_context_stats(current_user: User = Depends(get_current_user)):
+    """Chat prompt sizes and patient summary cache counters of this process."""
+    return {
+        "prompts": chat_prompt_stats.stats(),
+        "patient_context_cache": patient_context_cache.stats(),
+    }
+
+
 @router.get("/{message_id}", response_model=MessageResponse)
 def read_message(
     message_id: int,
@@ -194,12 +291,19 @@ def delete_existing_message(
     return {"message": "Message deleted successfully"}
 
 
-@router.get("/chat/{chat_id}", response_model=list[MessageResponse])
+@router.get("/chat/{chat_id}", response_model=MessagePage)
 def fetch_messages(
     chat_id: int,
+    before: Optional[int] = Query(None, description="Message id; return the messages right before it"),
+    after: Optional[int] = Query(None, description="Message id; return the messages right after it"),
+    limit: int = Query(settings.MESSAGE_PAGE_SIZE, ge=1, le=settings.MESSAGE_PAGE_MAX_SIZE),
+    preview: bool = Query(False, description="Only ids and truncated request/response texts"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """A page of the chat's messages, the latest ones unless a before/after cursor is given."""
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both.")
     db_chat = get_chat(db, chat_id)
     if db_chat is None:
         raise HTTPException(status_code=404, detail="Chat not found")
@@ -207,7 +311,17 @@ def fetch_messages(
         raise HTTPException(
             status_code=403, detail="Not authorized to access this chat"
         )
-    messages = get_messages_by_chat(db, chat_id)
-    if not messages:
+    rows, has_more = get_message_page(
+        db, chat_id, limit, before=before, after=after,
+        preview_chars=settings.MESSAGE_PREVIEW_CHARS if preview else None,
+    )
+    if not rows and before is None and after is None:
         raise HTTPException(status_code=404, detail="No messages found for this chat")
-    return messages
+
+    item_model = MessagePreview if preview else MessageResponse
+    return MessagePage(
+        messages=[item_model.model_validate(row) for row in rows],
+        has_more=has_more,
+        first_id=rows[0].id if rows else None,
+        last_id=rows[-1].id if rows else None,
+    )
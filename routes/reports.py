@@ -1,689 +1,430 @@
-from fastapi import APIRouter, Depends, Query, Response
-from sqlalchemy.orm import Session
+import re
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, contains_eager
 from database import get_db
 from datetime import date, datetime, timedelta, time
-from middlewares.auth import get_current_user
+from middlewares.auth import get_current_user, require_doctor
 from models.users import User
-from models.medications import Medication
-from models.medication_schedules import MedicationSchedule
-from models.scheduled_medication_logs import ScheduledMedicationLog
 from models.bp_schedules import BPSchedule
 from models.scheduled_bp_logs import ScheduledBPLog
 from models.sugar_schedules import SugarSchedule
 from models.scheduled_sugar_logs import ScheduledSugarLog
-from constants.enums import InsightPeriodEnum
-from typing import List, Dict, Any
-import io
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import os
-import tempfile
-from fpdf import FPDF
+from constants.enums import InsightPeriodEnum, AdherenceSourceEnum, BulkReportFormatEnum
+from typing import List, Dict, Any, Iterable
+from crud.reports import load_medication_adherence_rows, get_daily_adherence_counts, get_report_fingerprint, get_report_fingerprints
+from crud.daily_adherence_rollups import get_daily_adherence_rows, get_daily_adherence_rows_for_patients
+from utilities.adherence import compute_adherence, summarize_daily_counts, empty_schedule_table, empty_log_table, add_schedule, add_log
+from utilities.report_renderer import build_report_payload, render_report_job
+from utilities.report_cache import report_cache, report_cache_key, get_cached_report, cache_report, attach_cached_charts, cache_rendered_charts
+from tasks.report_jobs import report_jobs, ReportJobLimitError, BulkReportPart
+from schemas.reports import BulkReportRequest
+from utilities.permissions import get_doctor_patient_ids
+from config import settings
+from constants.enums import ReportJobStatusEnum
 from .alerts import generate_alerts_route
 
 router = APIRouter()
 
-def daterange(start_date, end_date):
-    """Generate date range from start_date to end_date inclusive"""
-    for n in range(int((end_date - start_date).days) + 1):
-        yield start_date + timedelta(n)
-
-def calculate_medication_adherence(schedules, logs, start_date, end_date, log_date_field, schedule_id_field):
-    """Calculate adherence based on schedules and logs"""
-    total = 0
-    adhered = 0
-    
-    # Create a lookup for logs by (day, schedule_id)
-    logs_by_day_sched = {}
-    for log in logs:
-        log_date = getattr(log, log_date_field)
-        if isinstance(log_date, datetime):
-            log_day = log_date.date()
-        else:
-            log_day = log_date
-        schedule_id = getattr(log, schedule_id_field)
-        logs_by_day_sched[(log_day, schedule_id)] = log
-    
-    # Check each schedule for each day in the period
-    for sched in schedules:
-        day = start_date
-        while day <= end_date:
-            # Check if schedule is active on this day
-            if sched.medication.start_date.date() <= day and (not sched.medication.end_date or sched.medication.end_date.date() >= day):
-                total += 1
-                if (day, sched.id) in logs_by_day_sched:
-                    adhered += 1
-            day += timedelta(days=1)
-    
-    return adhered, total
-
-def calculate_adherence(schedules, logs, start_date, end_date, log_date_field, schedule_id_field):
-    """Calculate adherence based on schedules and logs"""
-    total = 0
-    adhered = 0
-    
-    # Create a lookup for logs by (day, schedule_id)
-    logs_by_day_sched = {}
-    for log in logs:
-        log_date = getattr(log, log_date_field)
-        if isinstance(log_date, datetime):
-            log_day = log_date.date()
-        else:
-            log_day = log_date
-        schedule_id = getattr(log, schedule_id_field)
-        logs_by_day_sched[(log_day, schedule_id)] = log
-    
-    # Check each schedule for each day in the period
-    for sched in schedules:
-        day = start_date
-        while day <= end_date:
-            # Check if schedule is active on this day
-            if sched.start_date <= day and (not sched.end_date or sched.end_date >= day):
-                total += 1
-                if (day, sched.id) in logs_by_day_sched:
-                    adhered += 1
-            day += timedelta(days=1)
-    
-    return adhered, total
-
-def plot_bp_chart(bp_logs):
-    """Create a blood pressure chart with both systolic and diastolic, avoiding vertical lines from duplicate timestamps."""
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    import io
-    from collections import defaultdict
-    from datetime import datetime, time
-
-    plt.figure(figsize=(10, 4))
-
-    if bp_logs:
-        grouped = defaultdict(lambda: {"systolic": [], "diastolic": []})
-
-        for log in bp_logs:
-            log_time = log.checked_at if isinstance(log.checked_at, datetime) else datetime.combine(log.checked_at, time.min)
-            log_time = log_time.replace(second=0, microsecond=0)  # Normalize
-            grouped[log_time]["systolic"].append(log.systolic)
-            grouped[log_time]["diastolic"].append(log.diastolic)
-
-        # Sort by time
-        sorted_items = sorted(grouped.items())
-        dates = [dt for dt, _ in sorted_items]
-        systolic_avg = [sum(values["systolic"]) / len(values["systolic"]) for _, values in sorted_items]
-        diastolic_avg = [sum(values["diastolic"]) / len(values["diastolic"]) for _, values in sorted_items]
-
-        plt.plot(dates, systolic_avg, marker='o', label='Systolic', linewidth=2, markersize=4, color='#ff7f0e')  # Orange
-        plt.plot(dates, diastolic_avg, marker='s', label='Diastolic', linewidth=2, markersize=4, color='#2ca02c')  # Green
-        plt.legend()
-
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-        plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=1))
-
-    plt.xlabel('Date')
-    plt.ylabel('Blood Pressure (mmHg)')
-    plt.title('Blood Pressure Trend')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150)
-    plt.close()
-    buf.seek(0)
-    return buf
-
-def plot_sugar_chart(sugar_logs):
-    """Create a sugar level line chart separated by type (e.g., FASTING, RANDOM)"""
-    from collections import defaultdict
-    from datetime import datetime, time
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    import io
-
-    plt.figure(figsize=(10, 4))
-
-    # Use nested dict to group by type and datetime
-    grouped = defaultdict(lambda: defaultdict(list))
-
+def build_adherence_tables(medication_rows, bp_schedules, sugar_schedules, bp_logs, sugar_logs):
+    """Flatten medication rows plus BP/sugar ORM objects into the column tables used by the adherence engine."""
+    schedules = empty_schedule_table()
+    med_schedules = medication_rows["schedules"]
+    for idx, schedule_id in enumerate(med_schedules["schedule_id"]):
+        add_schedule(
+            schedules, "medication", schedule_id,
+            med_schedules["start_date"][idx], med_schedules["duration_days"][idx],
+            med_schedules["frequency"][idx], med_schedules["custom_days"][idx],
+        )
+    for sched in bp_schedules:
+        add_schedule(schedules, "blood_pressure", sched.id, sched.start_date, sched.duration_days, sched.frequency, sched.custom_days)
+    for sched in sugar_schedules:
+        add_schedule(schedules, "sugar", sched.id, sched.start_date, sched.duration_days, sched.frequency, sched.custom_days)
+
+    logs = empty_log_table()
+    med_logs = medication_rows["logs"]
+    for schedule_id, taken_at in zip(med_logs["schedule_id"], med_logs["taken_at"]):
+        add_log(logs, "medication", schedule_id, taken_at)
+    for log in bp_logs:
+        add_log(logs, "blood_pressure", log.schedule_id, log.checked_at)
     for log in sugar_logs:
-        log_time = log.checked_at if isinstance(log.checked_at, datetime) else datetime.combine(log.checked_at, time.min)
-        log_time = log_time.replace(second=0, microsecond=0)  # Normalize seconds/microseconds
-        label = getattr(log.type, 'name', str(log.type))
-        grouped[label][log_time].append(log.value)
-
-    # Prepare cleaned data
-    sugar_colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
-    for idx, (label, times_dict) in enumerate(grouped.items()):
-        sorted_items = sorted(times_dict.items())
-        dates = [dt for dt, _ in sorted_items]
-        values = [sum(vals) / len(vals) for _, vals in sorted_items]  # average values
-        color = sugar_colors[idx % len(sugar_colors)]
-        plt.plot(dates, values, marker='o', linewidth=2, markersize=4, label=label, color=color)
-
-    plt.xlabel("Date")
-    plt.ylabel("Sugar Level (mg/dL)")
-    plt.title("Blood Sugar Trend")
-    plt.legend()
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-    plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=1))
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150)
-    plt.close()
-    buf.seek(0)
-    return buf
-
-
-def plot_adherence_chart(dates, adherence_percents):
-    """Create an adherence bar chart with vertical bars"""
-    plt.figure(figsize=(10, 4))
-    if dates and adherence_percents:
-        # For single day (Daily view), create one centered bar
-        if len(dates) == 1:
-            plt.bar([0], adherence_percents, width=0.4, alpha=0.7, color='#1f77b4')  # Single narrow bar
-            plt.xticks([0], dates)
-        else:
-            # Use range indices for x-axis and set custom labels for multiple days
-            x_pos = range(len(dates))
-            plt.bar(x_pos, adherence_percents, width=0.6, alpha=0.7, color='#1f77b4')  # Consistent blue color
-            plt.xticks(x_pos, dates)
-    
-    plt.xlabel('Date')
-    plt.ylabel('Adherence (%)')
-    plt.title('Daily Adherence')
-    plt.ylim(0, 100)  # Set consistent Y-axis scale
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150)
-    plt.close()
-    buf.seek(0)
-    return buf
-
-def generate_pdf_report(user: User, bp_logs, sugar_logs, adherence_data, adherence_chart, bp_chart, sugar_chart, start_date, end_date):
-
-    temp_files = []
-
-    def add_chart(pdf, chart_file):
-        temp_fd, temp_path = tempfile.mkstemp(suffix='.png')
-        temp_files.append(temp_path)
-        try:
-            with os.fdopen(temp_fd, 'wb') as tmp_file:
-                tmp_file.write(chart_file.read())
-
-            # Estimate image height (maintain aspect ratio if needed)
-            chart_height = 75
-
-            if pdf.get_y() + chart_height > 270:  # Avoid bottom margin cutoff
-                pdf.add_page()
-            
-            pdf.image(temp_path, x=15, y=pdf.get_y(), w=180)
-            pdf.ln(chart_height)  # Only move down by chart height
-        except:
-            os.close(temp_fd)
-
-
-    try:
-        pdf = FPDF()
-        pdf.add_page()
-
-        # --- HEADER ---
-        pdf.image("static/healthmate_logo.png", x=10, y=8, w=25)  # Adjust path if needed
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "HEALTHMATE", ln=True, align="C")
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(0, 5, "YOUR WELLNESS COMPANION", ln=True, align="C")
-        pdf.ln(10)
-
-        # --- PATIENT INFO ---
-        pdf.set_font("Arial", "", 11)
-        pdf.cell(100, 7, f"Patient Name: {user.name}", ln=0)
-        pdf.cell(90, 7, f"Date: {datetime.now().strftime('%Y-%m-%d')}", ln=1)
-        pdf.cell(100, 7, f"Patient ID: {user.id}", ln=1)
-        pdf.ln(5)
-
-        # --- ADHERENCE SECTION ---
-        pdf.set_font("Arial", "B", 13)
-        pdf.cell(0, 10, "Medication Adherence", ln=True)
-        pdf.set_font("Arial", "", 11)
-        pdf.cell(0, 8, f"Overall adherence: {adherence_data.get('adherence_percent', 0):.1f}%", ln=True)
-        add_chart(pdf, adherence_chart)
-
-        # --- BLOOD PRESSURE SECTION ---
-        if bp_logs:
-            if pdf.get_y() > 200:  # Avoid bottom cutoff
-                pdf.add_page()
-            pdf.set_font("Arial", "B", 13)
-            pdf.cell(0, 10, "Blood Pressure Logs", ln=True)
-
-            pdf.set_font("Arial", "B", 10)
-            pdf.cell(50, 8, "Date", 1)
-            pdf.cell(40, 8, "Time", 1)
-            pdf.cell(50, 8, "Systolic (mmHg)", 1)
-            pdf.cell(50, 8, "Diastolic (mmHg)", 1)
-            pdf.ln()
-
-            pdf.set_font("Arial", "", 10)
-            for log in bp_logs[-10:]:
-                pdf.cell(50, 8, log.checked_at.strftime("%Y-%m-%d"), 1)
-                pdf.cell(40, 8, log.checked_at.strftime("%H:%M"), 1)
-                pdf.cell(50, 8, str(log.systolic), 1, align="C")
-                pdf.cell(50, 8, str(log.diastolic), 1, align="C")
-                pdf.ln()
-            pdf.ln()
-            # pdf.cell(0, 10, "Blood Pressure Trend", ln=True)
-            add_chart(pdf, bp_chart)
-
-        # --- SUGAR SECTION ---
-        if sugar_logs:
-            if pdf.get_y() > 200:  # Avoid bottom cutoff
-                pdf.add_page()
-            pdf.set_font("Arial", "B", 13)
-            pdf.cell(0, 10, "Blood Sugar Logs", ln=True)
-
-            pdf.set_font("Arial", "B", 10)
-            pdf.cell(50, 8, "Date", 1)
-            pdf.cell(40, 8, "Time", 1)
-            pdf.cell(50, 8, "Type", 1)
-            pdf.cell(50, 8, "Value (mg/dL)", 1)
-            pdf.ln()
-
-            pdf.set_font("Arial", "", 10)
-            for log in sugar_logs[-10:]:
-                pdf.cell(50, 8, log.checked_at.strftime("%Y-%m-%d"), 1)
-                pdf.cell(40, 8, log.checked_at.strftime("%H:%M"), 1)
-                pdf.cell(50, 8, getattr(log.type, 'name', str(log.type)), 1)
-                pdf.cell(50, 8, str(log.value), 1, align="C")
-                pdf.ln()
-            pdf.ln()
-            # pdf.cell(0, 10, "Sugar Trend", ln=True)
-            add_chart(pdf, sugar_chart)
-
-        #Alerts Section
-        # if alerts:
-        #     if pdf.get_y() > 200:  # Avoid bottom cutoff
-        #         pdf.add_page()
-        #     pdf.set_font("Arial", "B", 13)
-        #     pdf.cell(0, 10, "Alerts", ln=True)
-
-        #     pdf.set_font("Arial", "B", 10)
-        #     pdf.cell(50, 8, "Tag", 1)
-        #     pdf.cell(40, 8, "Heading", 1)
-        #     pdf.cell(50, 8, "Description", 1)
-        #     pdf.cell(50, 8, "Date", 1)
-        #     pdf.cell(50, 8, "Time", 1)
-        #     pdf.ln()
-
-        #     pdf.set_font("Arial", "", 10)
-        #     for alert in alerts[-10:]:
-        #         if alert["tag"]=="Emergency":
-        #             pdf.cell(50, 8, str(alert["tag"]), 1, align="C")
-        #             pdf.cell(50, 8, str(alert["heading"]), 1, align="C")
-        #             pdf.cell(50, 8, str(alert["description"]), 1, align="C")
-        #             pdf.cell(50, 8, alert["date"], 1)
-        #             pdf.cell(40, 8, alert["time"], 1)
-        #             pdf.ln()
-        #     pdf.ln()
-        
-        # --- FOOTER ---
-        pdf.ln()
-        pdf.set_font("Arial", "", 11)
-        pdf.cell(0, 10, "Automated Report", ln=True, align="R")
-
-        pdf_bytes = pdf.output(dest='S').encode('latin1')
-        buf = io.BytesIO(pdf_bytes)
-        buf.seek(0)
-        return buf
-
-    finally:
-        for temp_path in temp_files:
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-
-
-@router.post("")
-def generate_report(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-    period: InsightPeriodEnum = Query(InsightPeriodEnum.DAILY, description="Report period: daily, weekly, or monthly"),
-    start_date: date = Query(None, description="Optional start date override (if not provided, automatically calculated based on period)")
-):
-    """Generate comprehensive health report with adherence data and charts"""
-    
-    # 1. Calculate date range automatically based on period (like frontend getDateRange)
+        add_log(logs, "sugar", log.schedule_id, log.checked_at)
+    return schedules, logs
+
+def resolve_report_window(period: InsightPeriodEnum, start_date: date = None):
+    """
+    Calculate the report date range (like frontend getDateRange).
+    Returns (start_date, end_date), or (None, None) for an unknown period.
+    """
     today = date.today()
-    
+
     if start_date is None:
         # Auto-calculate start_date based on period (matching frontend logic)
         if period == InsightPeriodEnum.DAILY:
-            start_date = today  # Today only
-            end_date = today
+            return today, today  # Today only
         elif period == InsightPeriodEnum.WEEKLY:
-            start_date = today - timedelta(days=6)  # Last 7 days
-            end_date = today
+            return today - timedelta(days=6), today  # Last 7 days
         elif period == InsightPeriodEnum.MONTHLY:
-            start_date = today - timedelta(days=29)  # Last 30 days
-            end_date = today
+            return today - timedelta(days=29), today  # Last 30 days
+        return None, None
+
+    # Use provided start_date and calculate end_date based on period
+    if period == InsightPeriodEnum.DAILY:
+        end_date = start_date
+    elif period == InsightPeriodEnum.WEEKLY:
+        end_date = start_date + timedelta(days=6)
+    elif period == InsightPeriodEnum.MONTHLY:
+        if start_date.month == 12:
+            end_date = start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
         else:
-            return {"success": False, "error": "Unknown period."}
+            end_date = start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
     else:
-        # Use provided start_date and calculate end_date based on period
-        if period == InsightPeriodEnum.DAILY:
-            end_date = start_date
-        elif period == InsightPeriodEnum.WEEKLY:
-            end_date = start_date + timedelta(days=6)
-        elif period == InsightPeriodEnum.MONTHLY:
-            if start_date.month == 12:
-                end_date = start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
-            else:
-                end_date = start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
-        else:
-            return {"success": False, "error": "Unknown period."}
-
-        # Ensure end_date doesn't go beyond today
-        if end_date > today:
-            end_date = today
-
-    # 2. Query schedules and logs - Fixed to match alerts.py schema
-    
-    # Medication data
-    medications = db.query(Medication).filter(
-        Medication.user_id == current_user.id, 
-        Medication.is_active == True
-    ).all()
-    
-    med_schedules = []
-    med_logs = []
-    for med in medications:
-        for sched in med.schedules:
-            med_schedules.append(sched)
-            # Get logs for this schedule in the date range
-            sched_logs = db.query(ScheduledMedicationLog).filter(
-                ScheduledMedicationLog.medication_schedule_id == sched.id,
-                ScheduledMedicationLog.scheduled_date >= start_date,
-                ScheduledMedicationLog.scheduled_date <= end_date
-            ).all()
-            med_logs.extend(sched_logs)
-
-    # Blood Pressure data
+        return None, None
+
+    # Ensure end_date doesn't go beyond today
+    return start_date, min(end_date, today)
+
+
+def load_report_logs_for_patients(db: Session, patient_profile_ids: Iterable[int], start_date: date, end_date: date) -> Dict[int, tuple]:
+    """
+    Scheduled BP and sugar logs for the window, oldest first, keyed by patient profile id
+    as (bp_logs, sugar_logs). One query per log type however many patients are asked for.
+    """
+    patient_profile_ids = list(patient_profile_ids)
+    logs = {patient_profile_id: ([], []) for patient_profile_id in patient_profile_ids}
+    if not patient_profile_ids:
+        return logs
+
+    bp_logs = db.query(ScheduledBPLog).join(BPSchedule).options(
+        contains_eager(ScheduledBPLog.schedule)  # patient_profile_id lives on the schedule
+    ).filter(
+        BPSchedule.patient_profile_id.in_(patient_profile_ids),
+        ScheduledBPLog.checked_at >= datetime.combine(start_date, time.min),
+        ScheduledBPLog.checked_at <= datetime.combine(end_date, time.max)
+    ).order_by(ScheduledBPLog.checked_at).all()
+    for log in bp_logs:
+        logs[log.schedule.patient_profile_id][0].append(log)
+
+    sugar_logs = db.query(ScheduledSugarLog).join(SugarSchedule).options(
+        contains_eager(ScheduledSugarLog.schedule)  # sugar_type lives on the schedule
+    ).filter(
+        SugarSchedule.patient_profile_id.in_(patient_profile_ids),
+        ScheduledSugarLog.checked_at >= datetime.combine(start_date, time.min),
+        ScheduledSugarLog.checked_at <= datetime.combine(end_date, time.max)
+    ).order_by(ScheduledSugarLog.checked_at).all()
+    for log in sugar_logs:
+        logs[log.schedule.patient_profile_id][1].append(log)
+    return logs
+
+
+def load_report_logs(db: Session, patient_profile_id: int, start_date: date, end_date: date):
+    """Scheduled BP and sugar logs for the window, oldest first (used by the charts and PDF tables)."""
+    return load_report_logs_for_patients(db, [patient_profile_id], start_date, end_date)[patient_profile_id]
+
+
+def load_report_data(db: Session, patient_profile_id: int, start_date: date, end_date: date) -> Dict[str, Any]:
+    """Query schedules and logs for the window and compute adherence in Python."""
+    # Medication data: schedules + in-range logs in two round trips, as plain columns
+    medication_rows = load_medication_adherence_rows(db, patient_profile_id, start_date, end_date)
+
     bp_schedules = db.query(BPSchedule).filter(
-        BPSchedule.user_id == current_user.id, 
+        BPSchedule.patient_profile_id == patient_profile_id,
         BPSchedule.is_active == True
     ).all()
-    
-    bp_logs = db.query(ScheduledBPLog).join(BPSchedule).filter(
-    BPSchedule.user_id == current_user.id,
-    ScheduledBPLog.checked_at >= datetime.combine(start_date, time.min),
-    ScheduledBPLog.checked_at <= datetime.combine(end_date, time.max)
-    ).all()
-
-    # Sugar data
     sugar_schedules = db.query(SugarSchedule).filter(
-        SugarSchedule.user_id == current_user.id, 
+        SugarSchedule.patient_profile_id == patient_profile_id,
         SugarSchedule.is_active == True
     ).all()
-    
-    sugar_logs = db.query(ScheduledSugarLog).join(SugarSchedule).filter(
-    SugarSchedule.user_id == current_user.id,
-    ScheduledSugarLog.checked_at >= datetime.combine(start_date, time.min),
-    ScheduledSugarLog.checked_at <= datetime.combine(end_date, time.max)
-    ).all()
+    bp_logs, sugar_logs = load_report_logs(db, patient_profile_id, start_date, end_date)
 
-    # 3. Calculate adherence
-    med_adhered, med_total = calculate_medication_adherence(
-        med_schedules, med_logs, start_date, end_date, "scheduled_date", "medication_schedule_id"
+    # Overall, per-category and daily adherence in one vectorized pass
+    schedules, logs = build_adherence_tables(
+        medication_rows, bp_schedules, sugar_schedules, bp_logs, sugar_logs
     )
-    bp_adhered, bp_total = calculate_adherence(
-        bp_schedules, bp_logs, start_date, end_date, "checked_at", "schedule_id"
-    )
-    sugar_adhered, sugar_total = calculate_adherence(
-        sugar_schedules, sugar_logs, start_date, end_date, "checked_at", "schedule_id"
+    return {
+        "bp_logs": bp_logs,
+        "sugar_logs": sugar_logs,
+        "adherence": compute_adherence(schedules, logs, start_date, end_date),
+    }
+
+
+def compute_report_adherence(db: Session, patient_profile_id: int, start_date: date, end_date: date,
+                             source: AdherenceSourceEnum = AdherenceSourceEnum.ROLLUP) -> Dict[str, Any]:
+    """
+    Overall, per-category and daily adherence for the window.
+    ROLLUP reads closed days from daily_adherence_rollups and computes only today live;
+    SQL and PYTHON recompute the whole window from raw logs.
+    """
+    if source == AdherenceSourceEnum.ROLLUP:
+        rows = get_daily_adherence_rows(db, patient_profile_id, start_date, end_date)
+        return summarize_daily_counts(rows, start_date, end_date)
+    if source == AdherenceSourceEnum.SQL:
+        rows = get_daily_adherence_counts(db, patient_profile_id, start_date, end_date)
+        return summarize_daily_counts(rows, start_date, end_date)
+    return load_report_data(db, patient_profile_id, start_date, end_date)["adherence"]
+
+
+def prepare_reports(db: Session, users: List[User], start_date: date, end_date: date) -> Dict[int, tuple]:
+    """
+    Load everything the reports need for several patients with set-based queries and
+    flatten each into a renderable payload, with any chart already rendered for the
+    same data attached from the cache. Returns {patient_profile_id: (payload, headers)}.
+    """
+    patient_profile_ids = [user.id for user in users]
+    # Query logs for the charts, read adherence from the daily rollups
+    logs = load_report_logs_for_patients(db, patient_profile_ids, start_date, end_date)
+    adherence_rows = get_daily_adherence_rows_for_patients(db, patient_profile_ids, start_date, end_date)
+
+    reports = {}
+    for user in users:
+        bp_logs, sugar_logs = logs[user.id]
+        adherence = summarize_daily_counts(adherence_rows[user.id], start_date, end_date)
+        payload = build_report_payload(user, bp_logs, sugar_logs, adherence, start_date, end_date)
+        attach_cached_charts(payload)
+        reports[user.id] = (payload, {"X-Adherence-Percent": f"{adherence['adherence_percent']:.2f}"})
+    return reports
+
+
+def prepare_report(db: Session, user: User, start_date: date, end_date: date):
+    """Payload and headers for a single patient's report (see prepare_reports)."""
+    return prepare_reports(db, [user], start_date, end_date)[user.id]
+
+
+PDF_STREAM_CHUNK = 64 * 1024
+
+
+def iter_chunks(data: bytes, chunk_size: int = PDF_STREAM_CHUNK):
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+
+def pdf_response(pdf_bytes: bytes, filename: str, headers: Dict[str, str], cache_status: str,
+                 media_type: str = "application/pdf") -> StreamingResponse:
+    """Stream PDF (or ZIP) bytes to the client in chunks, without copying them into another buffer."""
+    return StreamingResponse(
+        iter_chunks(pdf_bytes),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(len(pdf_bytes)),
+            "X-Report-Cache": cache_status,
+            **headers,
+        }
     )
-    
-    total = med_total + bp_total + sugar_total
-    adhered = med_adhered + bp_adhered + sugar_adhered
-    adherence_percent = (adhered / total * 100) if total > 0 else 0
-
-    # 4. Prepare data for daily adherence chart
-    days = list(daterange(start_date, end_date))
-    adherence_per_day = []
-    
-    for day in days:
-        day_total = 0
-        day_adhered = 0
-        
-        # Check medication adherence for this day
-        for med in medications:
-            for sched in med.schedules:
-                if med.start_date.date() <= day and (not med.end_date or med.end_date.date() >= day):
-                    day_total += 1
-                    log = next((log for log in med_logs 
-                              if log.scheduled_date == day and log.medication_schedule_id == sched.id), None)
-                    if log and log.taken_at:
-                        day_adhered += 1
-        
-        # Check BP adherence for this day
-        for sched in bp_schedules:
-            if sched.start_date <= day and (not sched.end_date or sched.end_date >= day):
-                day_total += 1
-                log = next((log for log in bp_logs 
-                          if log.checked_at.date() == day and log.schedule_id == sched.id), None)
-                if log:
-                    day_adhered += 1
-        
-        # Check sugar adherence for this day
-        for sched in sugar_schedules:
-            if sched.start_date <= day and (not sched.end_date or sched.end_date >= day):
-                day_total += 1
-                log = next((log for log in sugar_logs 
-                          if log.checked_at.date() == day and log.schedule_id == sched.id), None)
-                if log:
-                    day_adhered += 1
-        
-        day_adherence = (day_adhered / day_total * 100) if day_total > 0 else 0
-        adherence_per_day.append((day, day_adherence))
-
-    # 5. Generate charts
-    try:
-        # BP chart
-        bp_chart = plot_bp_chart(bp_logs)
-        
-        # Sugar chart
-        sugar_chart = plot_sugar_chart(sugar_logs)
-        
-        # Adherence chart
-        adherence_chart = plot_adherence_chart(
-            [d.strftime("%m/%d") for d, _ in adherence_per_day],
-            [a for _, a in adherence_per_day]
-        )
 
-        # 6. Generate PDF
-        adherence_data = {
-            "adherence_percent": adherence_percent,
-            "total_scheduled": total,
-            "total_completed": adhered
-        }
 
-        # alerts = generate_alerts_route(db, current_user, period, start_date)
-        
-        pdf_buf = generate_pdf_report(
-            current_user,
-            # alerts["alerts"],
-            bp_logs, sugar_logs, adherence_data, 
-            adherence_chart, bp_chart, sugar_chart, 
-            start_date, end_date
-        )
+@router.post("")
+def generate_report(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    period: InsightPeriodEnum = Query(InsightPeriodEnum.DAILY, description="Report period: daily, weekly, or monthly"),
+    start_date: date = Query(None, description="Optional start date override (if not provided, automatically calculated based on period)")
+):
+    """Generate comprehensive health report with adherence data and charts (synchronously; see /reports/jobs)"""
 
-        # 7. Return PDF response
-        return Response(
-            content=pdf_buf.read(),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=health_report_{start_date}_{end_date}.pdf",
-                "X-Adherence-Percent": f"{adherence_percent:.2f}"
-            }
-        )
-        
+    # 1. Calculate date range automatically based on period
+    start_date, end_date = resolve_report_window(period, start_date)
+    if start_date is None:
+        return {"success": False, "error": "Unknown period."}
+    filename = f"health_report_{start_date}_{end_date}.pdf"
+
+    # 2. Serve an identical earlier render if nothing the report reads has changed
+    cache_key = report_cache_key(current_user.id, period.value, start_date, end_date,
+                                 get_report_fingerprint(db, current_user.id, start_date, end_date))
+    cached = get_cached_report(cache_key)
+    if cached is not None:
+        pdf_bytes, headers = cached
+        return pdf_response(pdf_bytes, filename, headers, "HIT")
+
+    # 3. Load data, render charts and PDF
+    payload, headers = prepare_report(db, current_user, start_date, end_date)
+
+    # alerts = generate_alerts_route(db, current_user, period, start_date)
+
+    try:
+        pdf_bytes, _, charts = render_report_job(payload)
     except Exception as e:
         return {"success": False, "error": f"Error generating report: {str(e)}"}
 
-@router.get("/adherence")
-def get_adherence_summary(
+    cache_rendered_charts(payload, charts)
+    cache_report(cache_key, pdf_bytes, headers)
+    return pdf_response(pdf_bytes, filename, headers, "MISS")
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+def submit_report_job(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     period: InsightPeriodEnum = Query(InsightPeriodEnum.DAILY, description="Report period: daily, weekly, or monthly"),
     start_date: date = Query(None, description="Optional start date override (if not provided, automatically calculated based on period)")
 ):
-    """Return adherence summary with per-day adherence values for graphing."""
-
-    # 1. Calculate date range automatically based on period (like frontend getDateRange)
-    today = date.today()
-    
+    """Queue a report for background rendering and return its job id immediately."""
+    start_date, end_date = resolve_report_window(period, start_date)
     if start_date is None:
-        # Auto-calculate start_date based on period (matching frontend logic)
-        if period == InsightPeriodEnum.DAILY:
-            start_date = today  # Today only
-            end_date = today
-        elif period == InsightPeriodEnum.WEEKLY:
-            start_date = today - timedelta(days=6)  # Last 7 days
-            end_date = today
-        elif period == InsightPeriodEnum.MONTHLY:
-            start_date = today - timedelta(days=29)  # Last 30 days
-            end_date = today
-        else:
-            return {"success": False, "error": "Unknown period."}
-    else:
-        # Use provided start_date and calculate end_date based on period
-        if period == InsightPeriodEnum.DAILY:
-            end_date = start_date
-        elif period == InsightPeriodEnum.WEEKLY:
-            end_date = start_date + timedelta(days=6)
-        elif period == InsightPeriodEnum.MONTHLY:
-            if start_date.month == 12:
-                end_date = start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
-            else:
-                end_date = start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
+        raise HTTPException(status_code=400, detail="Unknown period.")
+    filename = f"health_report_{start_date}_{end_date}.pdf"
+
+    cache_key = report_cache_key(current_user.id, period.value, start_date, end_date,
+                                 get_report_fingerprint(db, current_user.id, start_date, end_date))
+    try:
+        cached = get_cached_report(cache_key)
+        if cached is not None:
+            # Already rendered: the job is born finished
+            pdf_bytes, headers = cached
+            job = report_jobs.complete(current_user.id, pdf_bytes, filename, headers)
         else:
-            return {"success": False, "error": "Unknown period."}
+            payload, headers = prepare_report(db, current_user, start_date, end_date)
+            job = report_jobs.submit(current_user.id, payload, filename, headers, cache_key=cache_key)
+    except ReportJobLimitError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
 
-        # Ensure end_date doesn't go beyond today
-        if end_date > today:
-            end_date = today
+    return {
+        **job.to_dict(),
+        "status_url": f"/reports/jobs/{job.id}",
+        "download_url": f"/reports/jobs/{job.id}/download",
+    }
 
-    # 2. Query schedules and logs
-    medications = db.query(Medication).filter(
-        Medication.user_id == current_user.id,
-        Medication.is_active == True
-    ).all()
 
-    med_schedules = []
-    med_logs = []
-    for med in medications:
-        for sched in med.schedules:
-            med_schedules.append(sched)
-            sched_logs = db.query(ScheduledMedicationLog).filter(
-                ScheduledMedicationLog.medication_schedule_id == sched.id,
-                ScheduledMedicationLog.scheduled_date >= start_date,
-                ScheduledMedicationLog.scheduled_date <= end_date
-            ).all()
-            med_logs.extend(sched_logs)
+def report_filename(user: User, start_date: date, end_date: date) -> str:
+    safe_name = re.sub(r"[^A-Za-z0-9]+", "_", user.name or "").strip("_") or "patient"
+    return f"{user.id}_{safe_name}_{start_date}_{end_date}.pdf"
 
-    bp_schedules = db.query(BPSchedule).filter(
-        BPSchedule.user_id == current_user.id,
-        BPSchedule.is_active == True
-    ).all()
 
-    bp_logs = db.query(ScheduledBPLog).join(BPSchedule).filter(
-        BPSchedule.user_id == current_user.id,
-        ScheduledBPLog.checked_at >= datetime.combine(start_date, time.min),
-        ScheduledBPLog.checked_at <= datetime.combine(end_date, time.max)
-    ).all()
+@router.post("/bulk", status_code=status.HTTP_202_ACCEPTED)
+def submit_bulk_report_job(
+    request: BulkReportRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_doctor),
+):
+    """
+    Queue one export of many patients' reports: the given patient_profile_ids, or every
+    accepted patient when omitted. Poll /reports/jobs/{job_id} for progress and download
+    a ZIP of per-patient PDFs or one combined PDF when it is DONE.
+    """
+    start_date, end_date = resolve_report_window(request.period, request.start_date)
+    if start_date is None:
+        raise HTTPException(status_code=400, detail="Unknown period.")
+
+    patient_profile_ids = get_doctor_patient_ids(db, current_user.id, request.patient_profile_ids)
+    if request.patient_profile_ids is not None:
+        not_connected = sorted(set(request.patient_profile_ids) - set(patient_profile_ids))
+        if not_connected:
+            raise HTTPException(status_code=403, detail=f"Not an accepted doctor of patients: {not_connected}")
+    if not patient_profile_ids:
+        raise HTTPException(status_code=404, detail="No connected patients to export.")
+    if len(patient_profile_ids) > settings.REPORT_BULK_MAX_PATIENTS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.REPORT_BULK_MAX_PATIENTS} patients can be exported at once.")
+
+    users = db.query(User).filter(User.id.in_(patient_profile_ids)).order_by(User.id).all()
+
+    # Per-patient PDFs that are still current are reused as-is (ZIP only)
+    cache_keys = {}
+    if request.output == BulkReportFormatEnum.ZIP:
+        fingerprints = get_report_fingerprints(db, patient_profile_ids, start_date, end_date)
+        cache_keys = {
+            patient_profile_id: report_cache_key(patient_profile_id, request.period.value, start_date, end_date, fingerprint)
+            for patient_profile_id, fingerprint in fingerprints.items()
+        }
+    cached = {patient_profile_id: get_cached_report(key) for patient_profile_id, key in cache_keys.items()}
+    to_render = [user for user in users if cached.get(user.id) is None]
+    prepared = prepare_reports(db, to_render, start_date, end_date)
+
+    parts = []
+    for user in users:
+        filename = report_filename(user, start_date, end_date)
+        if cached.get(user.id) is not None:
+            parts.append(BulkReportPart(user.id, filename, pdf=cached[user.id][0]))
+        else:
+            payload, headers = prepared[user.id]
+            parts.append(BulkReportPart(user.id, filename, payload=payload, cache_key=cache_keys.get(user.id), headers=headers))
 
-    sugar_schedules = db.query(SugarSchedule).filter(
-        SugarSchedule.user_id == current_user.id,
-        SugarSchedule.is_active == True
-    ).all()
+    extension = "zip" if request.output == BulkReportFormatEnum.ZIP else "pdf"
+    try:
+        job = report_jobs.submit_bulk(current_user.id, parts, request.output,
+                                      f"health_reports_{start_date}_{end_date}.{extension}")
+    except ReportJobLimitError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
 
-    sugar_logs = db.query(ScheduledSugarLog).join(SugarSchedule).filter(
-        SugarSchedule.user_id == current_user.id,
-        ScheduledSugarLog.checked_at >= datetime.combine(start_date, time.min),
-        ScheduledSugarLog.checked_at <= datetime.combine(end_date, time.max)
-    ).all()
+    return {
+        **job.to_dict(),
+        "status_url": f"/reports/jobs/{job.id}",
+        "download_url": f"/reports/jobs/{job.id}/download",
+    }
+
+
+@router.get("/cache/stats")
+def get_report_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit/miss counters and size of the rendered report/chart cache."""
+    return report_cache.stats()
+
+
+@router.get("/jobs/{job_id}")
+def get_report_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Poll a report job's status and timing metrics."""
+    job = report_jobs.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found or expired.")
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/download")
+def download_report_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Download the PDF (or bulk export ZIP) of a finished report job."""
+    job = report_jobs.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found or expired.")
+    if job.status == ReportJobStatusEnum.FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != ReportJobStatusEnum.DONE:
+        raise HTTPException(status_code=409, detail=f"Report is not ready (status: {job.status.value}).")
+    return pdf_response(job.result, job.filename, job.headers, "HIT" if job.from_cache else "MISS", job.media_type)
+
+
+@router.delete("/jobs/{job_id}")
+def cancel_report_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Cancel a queued or running report job."""
+    job = report_jobs.cancel(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found or expired.")
+    return job.to_dict()
 
-    # 3. Calculate overall adherence
-    med_adhered, med_total = calculate_medication_adherence(
-        med_schedules, med_logs, start_date, end_date, "scheduled_date", "medication_schedule_id"
-    )
-    bp_adhered, bp_total = calculate_adherence(
-        bp_schedules, bp_logs, start_date, end_date, "checked_at", "schedule_id"
-    )
-    sugar_adhered, sugar_total = calculate_adherence(
-        sugar_schedules, sugar_logs, start_date, end_date, "checked_at", "schedule_id"
-    )
+@router.get("/adherence")
+def get_adherence_summary(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    period: InsightPeriodEnum = Query(InsightPeriodEnum.DAILY, description="Report period: daily, weekly, or monthly"),
+    start_date: date = Query(None, description="Optional start date override (if not provided, automatically calculated based on period)"),
+    source: AdherenceSourceEnum = Query(AdherenceSourceEnum.ROLLUP, description="ROLLUP reads materialized past days and computes today live; PYTHON loads logs and counts in the API; SQL aggregates per day inside PostgreSQL")
+):
+    """Return adherence summary with per-day adherence values for graphing."""
 
-    total = med_total + bp_total + sugar_total
-    adhered = med_adhered + bp_adhered + sugar_adhered
-    adherence_percent = (adhered / total * 100) if total > 0 else 0
-
-    # 4. Calculate daily adherence array for the graph
-    days = list(daterange(start_date, end_date))
-    daily_adherence = []
-    
-    for day in days:
-        day_total = 0
-        day_adhered = 0
-
-        # Medication adherence per day
-        for med in medications:
-            for sched in med.schedules:
-                if med.start_date.date() <= day and (not med.end_date or med.end_date.date() >= day):
-                    day_total += 1
-                    log = next((log for log in med_logs
-                                if log.scheduled_date == day and log.medication_schedule_id == sched.id), None)
-                    if log and log.taken_at:
-                        day_adhered += 1
-
-        # Blood Pressure adherence per day
-        for sched in bp_schedules:
-            if sched.start_date <= day and (not sched.end_date or sched.end_date >= day):
-                day_total += 1
-                log = next((log for log in bp_logs
-                            if log.checked_at.date() == day and log.schedule_id == sched.id), None)
-                if log:
-                    day_adhered += 1
-
-        # Sugar adherence per day
-        for sched in sugar_schedules:
-            if sched.start_date <= day and (not sched.end_date or sched.end_date >= day):
-                day_total += 1
-                log = next((log for log in sugar_logs
-                            if log.checked_at.date() == day and log.schedule_id == sched.id), None)
-                if log:
-                    day_adhered += 1
-
-        daily_percent = (day_adhered / day_total * 100) if day_total > 0 else 0
-        daily_adherence.append({
-            "date": day.strftime("%Y-%m-%d"),
-            "adherence_percent": round(daily_percent, 2),
-            "completed": day_adhered,
-            "scheduled": day_total
-        })
+    # 1. Calculate date range automatically based on period
+    start_date, end_date = resolve_report_window(period, start_date)
+    if start_date is None:
+        return {"success": False, "error": "Unknown period."}
+
+    # 2. Calculate overall, per-category and daily adherence
+    adherence = compute_report_adherence(db, current_user.id, start_date, end_date, source)
+
+    # 3. Daily adherence array for the graph
+    daily_adherence = [
+        {
+            "date": day["date"].strftime("%Y-%m-%d"),
+            "adherence_percent": round(day["adherence_percent"], 2),
+            "completed": day["completed"],
+            "scheduled": day["scheduled"],
+        }
+        for day in adherence["daily"]
+    ]
 
     return {
         "success": True,
         "start_date": start_date,
         "end_date": end_date,
-        "total_scheduled": total,
-        "total_completed": adhered,
-        "adherence_percent": round(adherence_percent, 2),
-        "breakdown": {
-            "medication": {"scheduled": med_total, "completed": med_adhered},
-            "blood_pressure": {"scheduled": bp_total, "completed": bp_adhered},
-            "sugar": {"scheduled": sugar_total, "completed": sugar_adhered},
-        },
+        "total_scheduled": adherence["total_scheduled"],
+        "total_completed": adherence["total_completed"],
+        "adherence_percent": round(adherence["adherence_percent"], 2),
+        "breakdown": adherence["breakdown"],
         "daily_adherence": daily_adherence  # Array for graphing
-    }
\ No newline at end of file
+    }
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+from sqlalchemy import MetaData
 from datetime import datetime
-from typing import Optional, Any
+from typing import List, Optional, Any, Union
 
 
 class MessagePair(BaseModel):
@@ -8,6 +9,12 @@ class MessagePair(BaseModel):
     ai: str
 
 
+class ChatHistory(BaseModel):
+    """What a chat turn knows of the conversation before it."""
+    summary: str = ""
+    recent: List[MessagePair] = []
+
+
 class MessageCreate(BaseModel):
     chat_id: Optional[int] = None
     request: str
@@ -29,3 +36,33 @@ class MessageResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+    @field_validator("metadata", mode="before")
+    @classmethod
+    def skip_table_metadata(cls, value):
+        # messages has no metadata column; on ORM rows the attribute is the declarative MetaData
+        return None if isinstance(value, MetaData) else value
+
+
+class MessagePreview(BaseModel):
+    """A message with request/response cut to MESSAGE_PREVIEW_CHARS; GET /messages/{id} has the full text."""
+    id: int
+    chat_id: int
+    request: str
+    response: str
+    truncated: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class MessagePage(BaseModel):
+    """
+    Messages oldest first. Cursors are message ids: pass first_id as `before` for older
+    messages, last_id as `after` for newer ones. has_more is for the paging direction.
+    """
+    messages: List[Union[MessagePreview, MessageResponse]]
+    has_more: bool
+    first_id: Optional[int] = None
+    last_id: Optional[int] = None
@@ -0,0 +1,12 @@
+from pydantic import BaseModel, Field
+from datetime import date
+from typing import List, Optional
+from constants.enums import InsightPeriodEnum, BulkReportFormatEnum
+
+
+class BulkReportRequest(BaseModel):
+    # None exports every patient with an accepted DOCTOR connection to the caller
+    patient_profile_ids: Optional[List[int]] = Field(None, min_length=1)
+    period: InsightPeriodEnum = InsightPeriodEnum.WEEKLY
+    start_date: Optional[date] = None
+    output: BulkReportFormatEnum = BulkReportFormatEnum.ZIP
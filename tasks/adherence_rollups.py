@@ -0,0 +1,73 @@
+"""
+Backfill / repair job for the daily_adherence_rollups table.
+
+Recomputes the closed days of every patient (or the given ones) from raw schedules
+and logs and upserts them, so it can be re-run safely at any time:
+
+    python -m tasks.adherence_rollups                      # everything since each patient's first schedule
+    python -m tasks.adherence_rollups --start 2025-01-01   # repair a window
+    python -m tasks.adherence_rollups --patient 12 --patient 40
+"""
+import argparse
+from datetime import date, timedelta
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.patient_profiles import PatientProfile
+from crud.daily_adherence_rollups import refresh_adherence_rollups, get_earliest_schedule_start, last_closed_day
+
+# Days recomputed per statement/commit, keeps each upsert and transaction small
+CHUNK_DAYS = 90
+
+
+def backfill_adherence_rollups(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    patient_profile_ids: Optional[List[int]] = None,
+):
+    db: Session = SessionLocal()
+    patients = failed = days_written = 0
+    try:
+        end_date = min(end_date or last_closed_day(), last_closed_day())
+        if patient_profile_ids is None:
+            patient_profile_ids = [
+                profile_id for (profile_id,) in db.query(PatientProfile.user_id).order_by(PatientProfile.user_id).all()
+            ]
+
+        for patient_profile_id in patient_profile_ids:
+            first_day = start_date or get_earliest_schedule_start(db, patient_profile_id)
+            if first_day is None or first_day > end_date:
+                continue
+            try:
+                chunk_start = first_day
+                while chunk_start <= end_date:
+                    chunk_end = min(chunk_start + timedelta(days=CHUNK_DAYS - 1), end_date)
+                    days_written += refresh_adherence_rollups(db, patient_profile_id, chunk_start, chunk_end)
+                    db.commit()
+                    chunk_start = chunk_end + timedelta(days=1)
+                patients += 1
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                print(f"❌ Error rebuilding adherence rollups for patient {patient_profile_id}: {e}")
+
+        print(f"✅ Adherence rollups rebuilt for {patients} patients ({days_written} patient-days, {failed} failed) up to {end_date}.")
+    finally:
+        db.close()
+
+
+def refresh_previous_day_rollups():
+    """Nightly job: materialize the day that just closed for every patient."""
+    yesterday = last_closed_day()
+    backfill_adherence_rollups(start_date=yesterday, end_date=yesterday)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill or repair daily adherence rollups.")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="First day to rebuild (default: each patient's first schedule)")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="Last day to rebuild (default: yesterday)")
+    parser.add_argument("--patient", type=int, action="append", default=None, help="Patient profile id, repeatable (default: all)")
+    args = parser.parse_args()
+    backfill_adherence_rollups(args.start, args.end, args.patient)
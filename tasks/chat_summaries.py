@@ -0,0 +1,74 @@
+"""
+Background chat summarization.
+
+Answering a message no longer waits for a second Gemini call to update the chat
+summary. Once a message is saved, the chat is submitted here and a small thread
+pool folds every message newer than the stored summary into it, a chunk at a time
+(crud/messages.py, models/chat_summary_states.py). The next turn also sends the
+latest messages verbatim, which covers those the summary has not caught up with
+(get_chat_context).
+
+Submissions for a chat that is already being summarized in this process are
+coalesced into one more pass once the current one finishes. A failed pass keeps
+the chunks it had already folded; the remaining messages are picked up by the next one.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from crud.messages import summarize_chat
+
+
+class ChatSummarizer:
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Set[int] = set()
+        self._rerun: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, chat_id: int) -> bool:
+        """Summarize the chat soon; False if it is already being summarized (it gets one more pass)."""
+        with self._lock:
+            if chat_id in self._in_flight:
+                self._rerun.add(chat_id)
+                return False
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chat-summary")
+            self._in_flight.add(chat_id)
+            self._pool.submit(self._run, chat_id)
+        return True
+
+    def _run(self, chat_id: int):
+        while True:
+            self._summarize(chat_id)
+            with self._lock:
+                if chat_id not in self._rerun:
+                    self._in_flight.discard(chat_id)
+                    return
+                self._rerun.discard(chat_id)
+
+    def _summarize(self, chat_id: int):
+        db: Session = SessionLocal()
+        try:
+            folded = summarize_chat(db, chat_id)
+            if folded:
+                print(f"📝 Chat {chat_id} summary updated with {folded} messages.")
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Summarizing chat {chat_id} failed: {e}")
+        finally:
+            db.close()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+chat_summarizer = ChatSummarizer(settings.CHAT_SUMMARY_WORKERS)
@@ -0,0 +1,312 @@
+"""
+Concurrent insight generation for the scheduled insight jobs.
+
+Each insight is a blocking Gemini call, so the queue is drained by
+INSIGHT_CONCURRENCY worker threads instead of one item after another. Calls are
+paced by a token bucket sized to the Gemini quota (INSIGHT_RATE_PER_MINUTE, bursts of
+up to INSIGHT_RATE_BURST), and every worker uses its own DB sessions because
+sessions must not be shared between threads.
+
+The scheduler enqueues one insight_jobs row per patient and drains the queue with
+run_insight_queue, so a crash or restart mid-run only delays the remaining items:
+the next drain resumes them, and failed items are retried up to INSIGHT_JOB_MAX_ATTEMPTS.
+Queue workers claim up to INSIGHT_BATCH_SIZE items at a time and generate them with one
+batched Gemini request, falling back to single-patient requests for any patient whose
+section of the batch response fails validation.
+
+Insights requested through the API go through the same insight_jobs rows, but are
+generated right away by on_demand_insights, a small pool in the API process.
+"""
+import math
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from itertools import groupby
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from constants.enums import InsightPeriodEnum
+from database import SessionLocal
+from crud.insights import get_insight_by_period_and_date
+from crud.insight_jobs import claim_insight_jobs, finish_insight_job, fail_abandoned_insight_jobs
+from utilities.insight_generator import (
+    generate_and_save_insight, generate_insight_batch, format_insight_context, insight_end_date,
+    pack_insight_batches, save_insight_to_db,
+)
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a token is available."""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+# Shared by every run in this process, so overlapping runs still respect the quota
+gemini_rate_limiter = TokenBucket(settings.INSIGHT_RATE_PER_MINUTE, settings.INSIGHT_RATE_BURST)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class RunStats:
+    """Thread-safe outcome counters and generation latencies for one run."""
+
+    def __init__(self):
+        self.counts = {SUCCEEDED: 0, FAILED: 0, SKIPPED: 0}
+        self.latencies: List[float] = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str, latency_ms: Optional[float]):
+        with self._lock:
+            self.counts[outcome] += 1
+            if latency_ms is not None:
+                self.latencies.append(latency_ms)
+
+    def summary(self, label: str, concurrency: int) -> Dict[str, object]:
+        p50, p95 = percentile(self.latencies, 50), percentile(self.latencies, 95)
+        summary = {
+            "total": sum(self.counts.values()),
+            **self.counts,
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "wall_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "concurrency": concurrency,
+        }
+        print(f"✅ {label}: {summary['succeeded']} succeeded, "
+              f"{summary['failed']} failed, {summary['skipped']} skipped of {summary['total']} "
+              f"(p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, wall {summary['wall_ms']} ms)")
+        return summary
+
+
+def _generate_one(db: Session, patient_profile_id: int, period: InsightPeriodEnum, start_date: date, rate_limiter: TokenBucket) -> tuple:
+    """
+    Generate and save one insight: (outcome, latency_ms, error). Latency covers generation
+    only, not rate-limit waits. An insight that already exists counts as skipped, which
+    together with uq_patient_period_date makes retries and duplicate claims harmless.
+    """
+    if get_insight_by_period_and_date(db, patient_profile_id, period, start_date):
+        return SKIPPED, None, None
+    rate_limiter.acquire()
+    started = time.perf_counter()
+    insight = generate_and_save_insight(db, patient_profile_id, period, start_date)
+    latency_ms = (time.perf_counter() - started) * 1000
+    if insight:
+        return SUCCEEDED, latency_ms, None
+    if get_insight_by_period_and_date(db, patient_profile_id, period, start_date):
+        return SKIPPED, latency_ms, None  # saved concurrently by another worker
+    return FAILED, latency_ms, "No insight was generated."
+
+
+def _generate_one_safely(db: Session, patient_profile_id: int, period: InsightPeriodEnum, start_date: date, rate_limiter: TokenBucket) -> tuple:
+    try:
+        return _generate_one(db, patient_profile_id, period, start_date, rate_limiter)
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error generating {period.value.lower()} insight for patient {patient_profile_id}: {e}")
+        return FAILED, None, str(e)
+
+
+def _generate_batch(db: Session, patient_profile_ids: List[int], period: InsightPeriodEnum, start_date: date, rate_limiter: TokenBucket) -> Dict[int, tuple]:
+    """
+    Generate the period's insight for several patients, packing them into as few Gemini
+    requests as the batch limits allow. Returns {patient_profile_id: (outcome, latency_ms, error)};
+    latency is that of the request the patient was part of.
+    """
+    results = {}
+    contexts = {}
+    end_date = insight_end_date(period, start_date)
+    for patient_profile_id in patient_profile_ids:
+        if get_insight_by_period_and_date(db, patient_profile_id, period, start_date):
+            results[patient_profile_id] = (SKIPPED, None, None)
+        else:
+            contexts[patient_profile_id] = format_insight_context(db, patient_profile_id, period, start_date, end_date)
+
+    for batch in pack_insight_batches(contexts, settings.INSIGHT_BATCH_SIZE, settings.INSIGHT_BATCH_MAX_PROMPT_CHARS):
+        if len(batch) == 1:
+            results[batch[0]] = _generate_one_safely(db, batch[0], period, start_date, rate_limiter)
+            continue
+        rate_limiter.acquire()
+        started = time.perf_counter()
+        try:
+            generated = generate_insight_batch(period, start_date, end_date, {pid: contexts[pid] for pid in batch})
+        except Exception as e:
+            # The request itself failed; leave the items to the queue's retries
+            print(f"❌ Error generating {period.value.lower()} insights for patients {batch}: {e}")
+            results.update({pid: (FAILED, None, str(e)) for pid in batch})
+            continue
+        latency_ms = (time.perf_counter() - started) * 1000
+        for patient_profile_id in batch:
+            insight_data = generated.get(patient_profile_id)
+            if insight_data is None:
+                results[patient_profile_id] = _generate_one_safely(db, patient_profile_id, period, start_date, rate_limiter)
+            elif save_insight_to_db(db, **insight_data):
+                results[patient_profile_id] = (SUCCEEDED, latency_ms, None)
+            elif get_insight_by_period_and_date(db, patient_profile_id, period, start_date):
+                results[patient_profile_id] = (SKIPPED, latency_ms, None)  # saved concurrently by another worker
+            else:
+                results[patient_profile_id] = (FAILED, latency_ms, "Insight could not be saved.")
+    return results
+
+
+def _process_claimed(db: Session, jobs: List, rate_limiter: TokenBucket) -> Dict[int, tuple]:
+    """Generate claimed items, batching those that share a period and start date. Keyed by job id."""
+    results = {}
+    key = lambda job: (job.period.value, job.start_date)
+    for _, group in groupby(sorted(jobs, key=key), key=key):
+        group = list(group)
+        period, start_date = group[0].period, group[0].start_date
+        if len(group) == 1:
+            results[group[0].id] = _generate_one_safely(db, group[0].patient_profile_id, period, start_date, rate_limiter)
+            continue
+        try:
+            by_patient = _generate_batch(db, [job.patient_profile_id for job in group], period, start_date, rate_limiter)
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Error generating {period.value.lower()} insight batch for {start_date}: {e}")
+            by_patient = {job.patient_profile_id: (FAILED, None, str(e)) for job in group}
+        results.update({job.id: by_patient[job.patient_profile_id] for job in group})
+    return results
+
+
+def _queue_worker(worker_id: str, stats: RunStats, rate_limiter: TokenBucket):
+    """Claim and process insight_jobs items, a batch at a time, until none are runnable."""
+    lease, max_attempts = settings.INSIGHT_JOB_LEASE_SECONDS, settings.INSIGHT_JOB_MAX_ATTEMPTS
+    while True:
+        db: Session = SessionLocal()
+        try:
+            claimed = claim_insight_jobs(db, worker_id, lease, max_attempts, limit=max(settings.INSIGHT_BATCH_SIZE, 1))
+            if not claimed:
+                return
+            results = _process_claimed(db, claimed, rate_limiter)
+            for job in claimed:
+                outcome, latency_ms, error = results[job.id]
+                if error:
+                    print(f"⚠️ Insight for patient {job.patient_profile_id} failed "
+                          f"(attempt {job.attempts}/{max_attempts}): {error}")
+                finish_insight_job(db, job.id, error, max_attempts)
+                stats.record(outcome, latency_ms)
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Insight queue worker {worker_id} stopped: {e}")
+            return
+        finally:
+            db.close()
+
+
+def run_insight_queue(concurrency: Optional[int] = None, rate_limiter: Optional[TokenBucket] = None) -> Dict[str, object]:
+    """
+    Drain the insight_jobs queue with concurrency worker threads. Safe to run from
+    several processes at once (claims use SKIP LOCKED), and picks up items left RUNNING
+    by a crashed worker once their lease expires.
+    """
+    concurrency = concurrency or settings.INSIGHT_CONCURRENCY
+    rate_limiter = rate_limiter or gemini_rate_limiter
+    stats = RunStats()
+    worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    db: Session = SessionLocal()
+    try:
+        fail_abandoned_insight_jobs(db, settings.INSIGHT_JOB_LEASE_SECONDS, settings.INSIGHT_JOB_MAX_ATTEMPTS)
+    finally:
+        db.close()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="insight-queue") as pool:
+        for n in range(concurrency):
+            pool.submit(_queue_worker, f"{worker_prefix}/{n}", stats, rate_limiter)
+
+    return stats.summary("Insight queue drained", concurrency)
+
+
+class OnDemandInsights:
+    """
+    Generates insights requested through the API on a small thread pool, so request
+    handlers only enqueue and return. A second request for a job already in flight in
+    this process is coalesced onto it; across processes the job's claim does the same.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id: int) -> bool:
+        """Start generating the insight_jobs item; False if it is already in flight here."""
+        with self._lock:
+            if job_id in self._in_flight:
+                return False
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="insight-on-demand")
+            future = self._pool.submit(self._run, job_id)
+            self._in_flight[job_id] = future
+        future.add_done_callback(lambda _: self._done(job_id))
+        return True
+
+    def _done(self, job_id: int):
+        with self._lock:
+            self._in_flight.pop(job_id, None)
+
+    def _run(self, job_id: int):
+        """Claim the item and retry it right away until it succeeds or runs out of attempts."""
+        worker_id = f"{socket.gethostname()}:{os.getpid()}/on-demand"
+        lease, max_attempts = settings.INSIGHT_JOB_LEASE_SECONDS, settings.INSIGHT_JOB_MAX_ATTEMPTS
+        db: Session = SessionLocal()
+        try:
+            while True:
+                claimed = claim_insight_jobs(db, worker_id, lease, max_attempts, job_id=job_id)
+                if not claimed:
+                    return  # finished, or another worker holds it
+                job = claimed[0]
+                outcome, _, error = _generate_one_safely(db, job.patient_profile_id, job.period, job.start_date, gemini_rate_limiter)
+                finish_insight_job(db, job.id, error, max_attempts)
+                if error is None:
+                    print(f"✅ On-demand {job.period.value.lower()} insight for patient {job.patient_profile_id} {outcome}.")
+                    return
+                print(f"⚠️ On-demand insight for patient {job.patient_profile_id} failed "
+                      f"(attempt {job.attempts}/{max_attempts}): {error}")
+        except Exception as e:
+            db.rollback()
+            print(f"❌ On-demand insight job {job_id} stopped: {e}")
+        finally:
+            db.close()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+on_demand_insights = OnDemandInsights(settings.INSIGHT_ON_DEMAND_WORKERS)
@@ -0,0 +1,104 @@
+"""
+Leader election on a PostgreSQL session-level advisory lock.
+
+Every API process (uvicorn worker or replica) builds the same APScheduler, but only
+the process holding the advisory lock runs it; the others keep it paused and retry
+the lock every SCHEDULER_LEADER_RETRY_SECONDS. The lock lives on a dedicated
+connection, so if the leader process dies (or its connection drops) PostgreSQL
+releases the lock and a standby takes over on its next attempt.
+"""
+import threading
+from typing import Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from database import engine
+
+# Arbitrary application-wide key for the scheduler lock (pg advisory locks are keyed by bigint)
+SCHEDULER_LOCK_KEY = 72430001
+
+
+class AdvisoryLockLeader:
+    """
+    Background thread that tries to become leader and keeps checking it still is.
+    on_elected/on_demoted are called from that thread when leadership changes.
+    """
+
+    def __init__(self, lock_key: int, on_elected: Callable[[], None], on_demoted: Callable[[], None],
+                 retry_seconds: float, name: str = "scheduler"):
+        self.lock_key = lock_key
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.retry_seconds = retry_seconds
+        self.name = name
+        self._conn: Optional[Connection] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._conn is not None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-leader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Step down (releasing the lock) and stop campaigning."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.retry_seconds + 5)
+        if self.is_leader:
+            self._step_down(release=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.is_leader:
+                    self._heartbeat()
+                else:
+                    self._try_acquire()
+            except Exception as e:
+                print(f"⚠️ {self.name} leader election error: {e}")
+            self._stop.wait(self.retry_seconds)
+
+    def _try_acquire(self):
+        # AUTOCOMMIT so the lock connection never sits idle in a transaction
+        conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}).scalar()
+        except Exception:
+            conn.invalidate()
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return
+        self._conn = conn
+        print(f"👑 This process is now the {self.name} leader.")
+        self.on_elected()
+
+    def _heartbeat(self):
+        try:
+            self._conn.execute(text("SELECT 1"))
+        except Exception as e:
+            # The lock went away with the connection; another process may already hold it
+            print(f"⚠️ Lost {self.name} leadership: {e}")
+            self._step_down(release=False)
+
+    def _step_down(self, release: bool):
+        conn, self._conn = self._conn, None
+        try:
+            self.on_demoted()
+        finally:
+            try:
+                if release:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+                    conn.close()
+                else:
+                    # Never hand a connection that may still hold the lock back to the pool
+                    conn.invalidate()
+                    conn.close()
+            except Exception:
+                pass
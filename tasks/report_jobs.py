@@ -0,0 +1,378 @@
+"""
+Background report rendering.
+
+Report data is loaded inside the request (the queries are cheap), flattened into a
+plain payload and handed to a ProcessPoolExecutor, because the matplotlib/FPDF work
+is CPU-bound and would otherwise hold an API worker thread for seconds.
+
+Bulk exports (BulkReportJob) fan one render per patient out to the same pool,
+at most max_workers at a time so single reports are not starved, and report
+progress as parts finish; the parts are then packed into a ZIP or drawn into one
+combined PDF by a final pool task.
+
+Jobs and their finished files are kept in this process's memory for
+REPORT_RESULT_TTL_SECONDS. With several API processes, clients have to poll the
+process that accepted the job (sticky sessions).
+"""
+import io
+import multiprocessing
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from constants.enums import ReportJobStatusEnum, BulkReportFormatEnum
+from utilities.report_renderer import render_report_job, render_charts, render_combined_report
+from utilities.report_cache import cache_report, cache_rendered_charts
+
+ACTIVE_STATUSES = (ReportJobStatusEnum.QUEUED, ReportJobStatusEnum.RUNNING)
+
+
+class ReportJobLimitError(Exception):
+    """Raised when a submission would exceed the configured concurrency limits."""
+
+
+class ReportJob:
+    def __init__(self, user_id: int, filename: str, headers: Optional[Dict[str, str]] = None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.filename = filename
+        self.headers = headers or {}
+        self.status = ReportJobStatusEnum.QUEUED
+        self.error: Optional[str] = None
+        self.result: Optional[bytes] = None
+        self.future = None
+        self.payload: Optional[Dict[str, Any]] = None
+        self.cache_key: Optional[str] = None
+        self.from_cache = False
+        self.submitted_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.expires_at: Optional[datetime] = None
+        self.metrics: Dict[str, Any] = {}
+        self.media_type = "application/pdf"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status.value,
+            "error": self.error,
+            "submitted_at": self.submitted_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "metrics": self.metrics,
+        }
+
+
+class BulkReportPart:
+    """One patient's share of a bulk export."""
+
+    def __init__(self, patient_profile_id: int, filename: str, payload: Optional[Dict[str, Any]] = None,
+                 pdf: Optional[bytes] = None, cache_key: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+        self.patient_profile_id = patient_profile_id
+        self.filename = filename
+        self.payload = payload
+        self.pdf = pdf  # already rendered (cached) report, ZIP output only
+        self.cache_key = cache_key
+        self.headers = headers or {}
+        self.future = None
+        self.error: Optional[str] = None
+        self.done = False
+
+
+class BulkReportJob(ReportJob):
+    """Renders many patients' reports in parallel and packs them into a ZIP or one combined PDF."""
+
+    def __init__(self, user_id: int, filename: str, output: BulkReportFormatEnum, parts: List[BulkReportPart]):
+        super().__init__(user_id, filename)
+        self.output = output
+        self.parts = parts
+        self.pending = list(parts)
+        self.stage = "rendering"
+        if output == BulkReportFormatEnum.ZIP:
+            self.media_type = "application/zip"
+
+    def futures(self):
+        return [part.future for part in self.parts if part.future is not None] + ([self.future] if self.future else [])
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "stage": self.stage,
+            "total": len(self.parts),
+            "completed": sum(1 for part in self.parts if part.done and part.error is None),
+            "failed": [
+                {"patient_profile_id": part.patient_profile_id, "error": part.error}
+                for part in self.parts if part.error is not None
+            ],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**super().to_dict(), "output": self.output.value, "progress": self.progress()}
+
+
+class ReportJobManager:
+    """
+    Submits report payloads to a worker pool and tracks their status.
+    At most max_pending jobs (max_per_user per user) may be queued or running at once;
+    the pool itself runs max_workers renders in parallel.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, max_per_user: int, result_ttl_seconds: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self.result_ttl = timedelta(seconds=result_ttl_seconds)
+        self._jobs: Dict[str, ReportJob] = {}
+        self._lock = threading.RLock()  # future.cancel() runs done callbacks in the calling thread
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the API process holds DB connections and scheduler threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _purge_expired(self):
+        now = datetime.now()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.expires_at and job.expires_at <= now]:
+            del self._jobs[job_id]
+
+    def _refresh_status(self, job: ReportJob):
+        futures = job.futures() if isinstance(job, BulkReportJob) else [job.future]
+        if job.status == ReportJobStatusEnum.QUEUED and any(future is not None and future.running() for future in futures):
+            job.status = ReportJobStatusEnum.RUNNING
+
+    def _check_limits(self, user_id: int):
+        active = [job for job in self._jobs.values() if job.status in ACTIVE_STATUSES]
+        if len(active) >= self.max_pending:
+            raise ReportJobLimitError("Too many reports are being generated. Please retry shortly.")
+        if sum(1 for job in active if job.user_id == user_id) >= self.max_per_user:
+            raise ReportJobLimitError(f"You already have {self.max_per_user} reports in progress.")
+
+    def _finish(self, job: ReportJob, status: ReportJobStatusEnum, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.now()
+        job.expires_at = job.finished_at + self.result_ttl
+        job.metrics["total_ms"] = round((job.finished_at - job.submitted_at).total_seconds() * 1000, 1)
+        job.payload = None
+        for part in getattr(job, "parts", ()):
+            part.payload = part.pdf = None
+
+    def submit(self, user_id: int, payload: Dict[str, Any], filename: str, headers: Optional[Dict[str, str]] = None,
+               cache_key: Optional[str] = None) -> ReportJob:
+        """Queue a render; when cache_key is given the finished PDF and its charts are stored in the report cache."""
+        with self._lock:
+            self._purge_expired()
+            self._check_limits(user_id)
+
+            job = ReportJob(user_id, filename, headers)
+            job.payload = payload
+            job.cache_key = cache_key
+            job.future = self._get_executor().submit(render_report_job, payload)
+            self._jobs[job.id] = job
+
+        job.future.add_done_callback(lambda future: self._on_done(job, future))
+        return job
+
+    def complete(self, user_id: int, pdf_bytes: bytes, filename: str, headers: Optional[Dict[str, str]] = None) -> ReportJob:
+        """Register an already rendered (cached) report as a finished job, without touching the pool."""
+        with self._lock:
+            self._purge_expired()
+            job = ReportJob(user_id, filename, headers)
+            job.result = pdf_bytes
+            job.from_cache = True
+            job.metrics["size_bytes"] = len(pdf_bytes)
+            self._finish(job, ReportJobStatusEnum.DONE)
+            self._jobs[job.id] = job
+            return job
+
+    def _on_done(self, job: ReportJob, future):
+        with self._lock:
+            if job.status == ReportJobStatusEnum.CANCELLED or future.cancelled():
+                return
+            try:
+                pdf_bytes, worker_metrics, charts = future.result()
+            except BrokenProcessPool as e:
+                # A worker died; drop the pool so the next submission starts a fresh one
+                self._executor = None
+                self._finish(job, ReportJobStatusEnum.FAILED, f"Report worker crashed: {e}")
+                print(f"❌ Report job {job.id} failed, worker pool restarted: {e}")
+                return
+            except Exception as e:
+                self._finish(job, ReportJobStatusEnum.FAILED, f"Error generating report: {e}")
+                print(f"❌ Report job {job.id} failed: {e}")
+                return
+
+            job.result = pdf_bytes
+            if job.cache_key is not None:
+                cache_rendered_charts(job.payload, charts)
+                cache_report(job.cache_key, pdf_bytes, job.headers)
+            started_at = datetime.fromtimestamp(worker_metrics["started_at"])
+            job.metrics.update({
+                "queue_ms": round(max((started_at - job.submitted_at).total_seconds(), 0) * 1000, 1),
+                "charts_ms": round(worker_metrics["charts_ms"], 1),
+                "pdf_ms": round(worker_metrics["pdf_ms"], 1),
+                "size_bytes": len(pdf_bytes),
+            })
+            self._finish(job, ReportJobStatusEnum.DONE)
+            print(f"📄 Report job {job.id} done in {job.metrics['total_ms']} ms "
+                  f"(queue {job.metrics['queue_ms']} ms, charts {job.metrics['charts_ms']} ms, pdf {job.metrics['pdf_ms']} ms)")
+
+    def submit_bulk(self, user_id: int, parts: List[BulkReportPart], output: BulkReportFormatEnum, filename: str) -> BulkReportJob:
+        """
+        Queue a multi-patient export. It counts as a single job against the limits and
+        keeps at most max_workers of its parts in the pool at once.
+        """
+        with self._lock:
+            self._purge_expired()
+            self._check_limits(user_id)
+
+            job = BulkReportJob(user_id, filename, output, parts)
+            self._jobs[job.id] = job
+            for part in [part for part in parts if part.pdf is not None]:
+                job.pending.remove(part)
+                part.done = True
+            self._submit_parts(job)
+            self._maybe_assemble(job)
+            return job
+
+    def _submit_parts(self, job: BulkReportJob):
+        in_flight = sum(1 for part in job.parts if part.future is not None and not part.done)
+        while job.pending and in_flight < self.max_workers:
+            part = job.pending.pop(0)
+            task = render_report_job if job.output == BulkReportFormatEnum.ZIP else render_charts
+            try:
+                part.future = self._get_executor().submit(task, part.payload)
+            except BrokenProcessPool as e:
+                self._executor = None
+                part.error, part.done = f"Report worker crashed: {e}", True
+                continue
+            in_flight += 1
+            part.future.add_done_callback(lambda future, part=part: self._on_part_done(job, part, future))
+
+    def _on_part_done(self, job: BulkReportJob, part: BulkReportPart, future):
+        with self._lock:
+            if job.status == ReportJobStatusEnum.CANCELLED or future.cancelled():
+                return
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                self._executor = None
+                part.error = f"Report worker crashed: {e}"
+            except Exception as e:
+                part.error = f"Error generating report: {e}"
+
+            if part.error is not None:
+                print(f"❌ Bulk report job {job.id}: patient {part.patient_profile_id} failed: {part.error}")
+            elif job.output == BulkReportFormatEnum.ZIP:
+                part.pdf, _, charts = result
+                if part.cache_key is not None:
+                    cache_rendered_charts(part.payload, charts)
+                    cache_report(part.cache_key, part.pdf, part.headers)
+                part.payload = None
+            else:
+                cache_rendered_charts(part.payload, result)
+                part.payload["charts"] = result
+            part.done = True
+
+            self._submit_parts(job)
+            self._maybe_assemble(job)
+
+    def _maybe_assemble(self, job: BulkReportJob):
+        """Once every part has finished, pack the ZIP here or hand the combined PDF to the pool."""
+        if job.status not in ACTIVE_STATUSES or job.stage != "rendering" or not all(part.done for part in job.parts):
+            return
+        succeeded = [part for part in job.parts if part.error is None]
+        if not succeeded:
+            self._finish(job, ReportJobStatusEnum.FAILED, "No report could be generated.")
+            return
+
+        if job.output == BulkReportFormatEnum.ZIP:
+            buffer = io.BytesIO()
+            # PDF streams are already deflated, so the archive only stores them
+            with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+                for part in succeeded:
+                    archive.writestr(part.filename, part.pdf)
+                    part.pdf = None
+            self._finish_bulk(job, buffer.getvalue())
+            return
+
+        job.stage = "assembling"
+        try:
+            job.future = self._get_executor().submit(render_combined_report, [part.payload for part in succeeded])
+        except BrokenProcessPool as e:
+            self._executor = None
+            self._finish(job, ReportJobStatusEnum.FAILED, f"Report worker crashed: {e}")
+            return
+        job.future.add_done_callback(lambda future: self._on_combined_done(job, future))
+
+    def _on_combined_done(self, job: BulkReportJob, future):
+        with self._lock:
+            if job.status == ReportJobStatusEnum.CANCELLED or future.cancelled():
+                return
+            try:
+                pdf_bytes = future.result()
+            except BrokenProcessPool as e:
+                self._executor = None
+                self._finish(job, ReportJobStatusEnum.FAILED, f"Report worker crashed: {e}")
+                return
+            except Exception as e:
+                self._finish(job, ReportJobStatusEnum.FAILED, f"Error generating report: {e}")
+                print(f"❌ Bulk report job {job.id} failed: {e}")
+                return
+            self._finish_bulk(job, pdf_bytes)
+
+    def _finish_bulk(self, job: BulkReportJob, result: bytes):
+        job.result = result
+        job.stage = "done"
+        job.metrics["size_bytes"] = len(result)
+        self._finish(job, ReportJobStatusEnum.DONE)
+        progress = job.progress()
+        print(f"📦 Bulk report job {job.id} done in {job.metrics['total_ms']} ms "
+              f"({progress['completed']}/{progress['total']} patients, {len(progress['failed'])} failed)")
+
+    def get(self, job_id: str, user_id: int) -> Optional[ReportJob]:
+        """Return the caller's job, or None if it does not exist, expired or belongs to someone else."""
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+            if job is None or job.user_id != user_id:
+                return None
+            self._refresh_status(job)
+            return job
+
+    def cancel(self, job_id: str, user_id: int) -> Optional[ReportJob]:
+        """
+        Cancel a queued or running job. Queued work is removed from the pool; a render
+        that already started runs to completion in its worker but its result is discarded.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.user_id != user_id:
+                return None
+            if job.status in ACTIVE_STATUSES:
+                self._finish(job, ReportJobStatusEnum.CANCELLED)
+                for future in (job.futures() if isinstance(job, BulkReportJob) else [job.future]):
+                    future.cancel()
+            return job
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+report_jobs = ReportJobManager(
+    max_workers=settings.REPORT_WORKERS,
+    max_pending=settings.REPORT_MAX_PENDING_JOBS,
+    max_per_user=settings.REPORT_MAX_JOBS_PER_USER,
+    result_ttl_seconds=settings.REPORT_RESULT_TTL_SECONDS,
+)
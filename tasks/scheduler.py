@@ -1,44 +1,103 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import date, timedelta
 from sqlalchemy.orm import Session
+from config import settings
 from database import SessionLocal
-from models.users import User
+from crud.patient_profiles import get_active_patient_ids_page
 from pytz import timezone
-from utilities.insight_generator import generate_and_save_insight
+from crud.insight_jobs import enqueue_insight_jobs
+from tasks.insight_runner import run_insight_queue
 from constants.enums import InsightPeriodEnum
+from tasks.adherence_rollups import refresh_previous_day_rollups
+from tasks.leader import AdvisoryLockLeader, SCHEDULER_LOCK_KEY
 
-def generate_insights(period: InsightPeriodEnum):
-    db: Session = SessionLocal()
-    try:
-        today = date.today()
-        if period == InsightPeriodEnum.DAILY:
-            start_date = today - timedelta(days=1)  # Previous day
-        elif period == InsightPeriodEnum.WEEKLY:
-            # Previous week: Monday to Sunday
-            last_monday = today - timedelta(days=today.weekday() + 7)
-            start_date = last_monday
-        elif period == InsightPeriodEnum.MONTHLY:
-            # Previous month: 1st to last day
-            first_of_this_month = today.replace(day=1)
-            last_month_end = first_of_this_month - timedelta(days=1)
-            last_month_start = last_month_end.replace(day=1)
-            start_date= last_month_start
-        else:
-            print(f"❌ Unknown period: {period}")
+def previous_period(period: InsightPeriodEnum, today: date = None):
+    """(start_date, end_date) of the last complete day/week/month, or (None, None) for an unknown period."""
+    today = today or date.today()
+    if period == InsightPeriodEnum.DAILY:
+        yesterday = today - timedelta(days=1)  # Previous day
+        return yesterday, yesterday
+    if period == InsightPeriodEnum.WEEKLY:
+        # Previous week: Monday to Sunday
+        last_monday = today - timedelta(days=today.weekday() + 7)
+        return last_monday, last_monday + timedelta(days=6)
+    if period == InsightPeriodEnum.MONTHLY:
+        # Previous month: 1st to last day
+        last_month_end = today.replace(day=1) - timedelta(days=1)
+        return last_month_end.replace(day=1), last_month_end
+    return None, None
+
+
+def iter_active_patient_id_chunks(start_date: date, end_date: date, chunk_size: int = None):
+    """
+    Yield lists of ids of patients with any log in the window, fetched in
+    keyset-paginated chunks. Each chunk uses a short-lived session, so no
+    connection or transaction is held open between chunks.
+    """
+    chunk_size = chunk_size or settings.INSIGHT_PATIENT_CHUNK_SIZE
+    after_id = 0
+    while True:
+        db: Session = SessionLocal()
+        try:
+            chunk = get_active_patient_ids_page(db, start_date, end_date, after_id, chunk_size)
+        finally:
             db.close()
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
             return
-        users = db.query(User).all()
-        for user in users:
-            generate_and_save_insight(db, user_id=user.id, period=period, start_date=start_date)
-        print(f"✅ {period.value.title()} insights generated for {len(users)} users for {start_date}.")
+        after_id = chunk[-1]
+
+
+def enqueue_period_insights(period: InsightPeriodEnum, start_date: date, end_date: date) -> int:
+    """Add an insight_jobs item for every active patient, committing chunk by chunk."""
+    enqueued = 0
+    for chunk in iter_active_patient_id_chunks(start_date, end_date):
+        db: Session = SessionLocal()
+        try:
+            enqueued += enqueue_insight_jobs(db, chunk, period, start_date)
+            db.commit()
+        finally:
+            db.close()
+    return enqueued
+
+
+def generate_insights(period: InsightPeriodEnum):
+    start_date, end_date = previous_period(period)
+    if start_date is None:
+        print(f"❌ Unknown period: {period}")
+        return None
+
+    try:
+        enqueued = enqueue_period_insights(period, start_date, end_date)
+        print(f"📥 Queued {enqueued} {period.value.lower()} insights for {start_date}.")
+        return {"period": period.value, "start_date": start_date, "enqueued": enqueued, **run_insight_queue()}
     except Exception as e:
         print(f"❌ Error generating {period.value.title()} insights: {e}")
-    finally:
-        db.close()
+        return None
 
 
-def start_scheduler():
-    scheduler = BackgroundScheduler()
+def process_insight_queue():
+    """Resume queued insights left behind by a crash or an earlier failed attempt."""
+    try:
+        return run_insight_queue()
+    except Exception as e:
+        print(f"❌ Error processing insight queue: {e}")
+        return None
+
+
+def build_scheduler() -> BackgroundScheduler:
+    # A standby that takes over shortly after a firing was due still runs it once;
+    # every job is idempotent, so a firing the old leader already ran is harmless.
+    scheduler = BackgroundScheduler(job_defaults={"coalesce": True, "misfire_grace_time": 15 * 60})
+    # Adherence rollups: materialize the day that just closed (also repairs it)
+    scheduler.add_job(
+        refresh_previous_day_rollups,
+        "cron",
+        hour=0,
+        minute=5,
+        timezone=timezone("Asia/Karachi"),
+    )
     # Daily: every day at midnight
     scheduler.add_job(
         lambda: generate_insights(InsightPeriodEnum.DAILY),
@@ -65,8 +124,36 @@ def start_scheduler():
         minute=0,
         timezone=timezone("Asia/Karachi"),
     )
-    scheduler.start()
-    print("🕓 Scheduler started for generating daily, weekly, and monthly insights.")
+    # Insight queue: resume items left pending or orphaned by a crashed worker
+    scheduler.add_job(
+        process_insight_queue,
+        "interval",
+        minutes=settings.INSIGHT_QUEUE_POLL_MINUTES,
+        max_instances=1,
+        coalesce=True,
+    )
+    return scheduler
+
+
+def start_scheduler():
+    """
+    Start the jobs paused and campaign for leadership: only the process holding the
+    scheduler advisory lock runs them, the others stand by to take over.
+    """
+    scheduler = build_scheduler()
+    scheduler.start(paused=True)
+
+    def on_elected():
+        scheduler.resume()
+        print("🕓 Scheduler started for adherence rollups and daily, weekly, and monthly insights.")
+
+    def on_demoted():
+        scheduler.pause()
+        print("⏸️ Scheduler paused, standing by.")
+
+    leader = AdvisoryLockLeader(SCHEDULER_LOCK_KEY, on_elected, on_demoted, settings.SCHEDULER_LEADER_RETRY_SECONDS)
+    leader.start()
+    return scheduler, leader
 
 
 
@@ -0,0 +1,47 @@
+"""
+Standalone background worker: runs the scheduled jobs and the insight queue without
+serving any routes, so the API and worker tiers can be scaled independently.
+
+    RUN_SCHEDULER=false uvicorn main:app      # API tier, no background jobs
+    python -m tasks.worker                     # worker tier, any number of replicas
+
+The cron jobs still run on a single elected leader (tasks/leader.py), while every
+worker replica drains the insight queue every INSIGHT_QUEUE_POLL_MINUTES; claims use
+SKIP LOCKED, so adding replicas adds throughput instead of duplicate work.
+"""
+import signal
+import threading
+
+import models  # noqa: F401  registers every table on Base.metadata
+from config import settings
+from database import Base, engine
+from tasks.scheduler import start_scheduler, process_insight_queue
+
+
+def run_worker():
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"🛑 Worker received signal {signum}, shutting down.")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    Base.metadata.create_all(bind=engine)
+    scheduler, leader = start_scheduler()
+    print("👷 Worker started.")
+
+    try:
+        while not stop.is_set():
+            process_insight_queue()
+            stop.wait(settings.INSIGHT_QUEUE_POLL_MINUTES * 60)
+    finally:
+        # Release the leader lock first so a standby can take over right away
+        leader.stop()
+        scheduler.shutdown(wait=False)
+        print("👋 Worker stopped.")
+
+
+if __name__ == "__main__":
+    run_worker()
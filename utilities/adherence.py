@@ -0,0 +1,246 @@
+"""
+Vectorized adherence engine.
+
+Schedules and logs are passed in as plain column tables (dicts of lists) so the
+engine does not care whether they came from ORM objects or raw SQL rows. Each
+table is turned into a (schedule x day) expected-dose matrix and a logged-dose
+matrix with NumPy, and both are reduced to the per-day, per-category and
+overall numbers returned by the report endpoints.
+"""
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from constants.enums import FrequencyEnum, DayOfWeekEnum
+
+CATEGORIES = ("medication", "blood_pressure", "sugar")
+
+_FREQUENCY_CODES = {
+    FrequencyEnum.DAILY: 0,
+    FrequencyEnum.WEEKLY: 1,
+    FrequencyEnum.MONTHLY: 2,
+}
+
+_WEEKDAY_INDEX = {
+    DayOfWeekEnum.MONDAY: 0,
+    DayOfWeekEnum.TUESDAY: 1,
+    DayOfWeekEnum.WEDNESDAY: 2,
+    DayOfWeekEnum.THURSDAY: 3,
+    DayOfWeekEnum.FRIDAY: 4,
+    DayOfWeekEnum.SATURDAY: 5,
+    DayOfWeekEnum.SUNDAY: 6,
+}
+
+
+def empty_schedule_table() -> Dict[str, list]:
+    """Column table describing schedules (one entry per schedule)."""
+    return {
+        "category": [],
+        "schedule_id": [],
+        "start_date": [],
+        "duration_days": [],
+        "frequency": [],
+        "custom_days": [],
+    }
+
+
+def empty_log_table() -> Dict[str, list]:
+    """Column table describing scheduled logs (one entry per log)."""
+    return {
+        "category": [],
+        "schedule_id": [],
+        "day": [],
+    }
+
+
+def add_schedule(table: Dict[str, list], category: str, schedule_id: int, start_date, duration_days, frequency, custom_days):
+    table["category"].append(category)
+    table["schedule_id"].append(schedule_id)
+    table["start_date"].append(start_date)
+    table["duration_days"].append(duration_days)
+    table["frequency"].append(frequency)
+    table["custom_days"].append(custom_days)
+
+
+def add_log(table: Dict[str, list], category: str, schedule_id: int, logged_at):
+    table["category"].append(category)
+    table["schedule_id"].append(schedule_id)
+    table["day"].append(logged_at.date() if isinstance(logged_at, datetime) else logged_at)
+
+
+def _as_enum(enum_cls, value):
+    if value is None or isinstance(value, enum_cls):
+        return value
+    return enum_cls(value)
+
+
+def _weekday_mask(custom_days) -> int:
+    """Bitmask of the weekdays (Monday = bit 0) listed in custom_days."""
+    mask = 0
+    for day in custom_days or []:
+        mask |= 1 << _WEEKDAY_INDEX[_as_enum(DayOfWeekEnum, day)]
+    return mask
+
+
+def _monthly_due_day(start_date: date, day: date) -> int:
+    """Day of month a MONTHLY schedule fires on, clamped for short months."""
+    last_day = calendar.monthrange(day.year, day.month)[1]
+    return min(start_date.day, last_day)
+
+
+def is_scheduled_on(start_date: date, duration_days: Optional[int], frequency, custom_days, day: date) -> bool:
+    """
+    Scalar version of the expected-dose rule for a single schedule and day.
+    duration_days NULL means indefinite; otherwise the last day is start + duration_days - 1.
+    """
+    if day < start_date:
+        return False
+    if duration_days is not None and day > start_date + timedelta(days=duration_days - 1):
+        return False
+    frequency = _as_enum(FrequencyEnum, frequency) or FrequencyEnum.DAILY
+    if frequency == FrequencyEnum.WEEKLY:
+        return bool(_weekday_mask(custom_days) >> day.weekday() & 1)
+    if frequency == FrequencyEnum.MONTHLY:
+        return day.day == _monthly_due_day(start_date, day)
+    return True
+
+
+def build_expected_matrix(schedules: Dict[str, list], start_date: date, end_date: date) -> np.ndarray:
+    """Boolean (schedule x day) matrix, True where a dose/check is expected."""
+    days = [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+    n_schedules = len(schedules["schedule_id"])
+    if n_schedules == 0 or not days:
+        return np.zeros((n_schedules, len(days)), dtype=bool)
+
+    day_ord = np.fromiter((d.toordinal() for d in days), dtype=np.int64, count=len(days))
+    weekday = (day_ord - 1) % 7  # date.fromordinal(1) is a Monday
+    day_of_month = np.fromiter((d.day for d in days), dtype=np.int64, count=len(days))
+    month_len = np.fromiter((calendar.monthrange(d.year, d.month)[1] for d in days), dtype=np.int64, count=len(days))
+
+    sched_start = np.fromiter((d.toordinal() for d in schedules["start_date"]), dtype=np.int64, count=n_schedules)
+    duration = np.fromiter(
+        (d if d is not None else 0 for d in schedules["duration_days"]), dtype=np.int64, count=n_schedules
+    )
+    sched_end = np.where(duration > 0, sched_start + duration - 1, np.iinfo(np.int64).max)
+    freq = np.fromiter(
+        (_FREQUENCY_CODES[_as_enum(FrequencyEnum, f) or FrequencyEnum.DAILY] for f in schedules["frequency"]),
+        dtype=np.int8, count=n_schedules,
+    )
+    mask = np.fromiter((_weekday_mask(c) for c in schedules["custom_days"]), dtype=np.int64, count=n_schedules)
+    start_dom = np.fromiter((d.day for d in schedules["start_date"]), dtype=np.int64, count=n_schedules)
+
+    in_window = (day_ord[None, :] >= sched_start[:, None]) & (day_ord[None, :] <= sched_end[:, None])
+    weekly_ok = ((mask[:, None] >> weekday[None, :]) & 1).astype(bool)
+    monthly_ok = day_of_month[None, :] == np.minimum(start_dom[:, None], month_len[None, :])
+    freq_ok = np.where(
+        (freq == 0)[:, None], True,
+        np.where((freq == 1)[:, None], weekly_ok, monthly_ok),
+    )
+    return in_window & freq_ok
+
+
+def build_logged_matrix(schedules: Dict[str, list], logs: Dict[str, list], start_date: date, end_date: date) -> np.ndarray:
+    """Boolean (schedule x day) matrix, True where at least one log exists."""
+    n_days = (end_date - start_date).days + 1
+    logged = np.zeros((len(schedules["schedule_id"]), max(n_days, 0)), dtype=bool)
+    if not logs["schedule_id"] or n_days <= 0:
+        return logged
+
+    row_of = {
+        key: idx for idx, key in enumerate(zip(schedules["category"], schedules["schedule_id"]))
+    }
+    rows = np.fromiter(
+        (row_of.get(key, -1) for key in zip(logs["category"], logs["schedule_id"])),
+        dtype=np.int64, count=len(logs["schedule_id"]),
+    )
+    start_ord = start_date.toordinal()
+    cols = np.fromiter((d.toordinal() - start_ord for d in logs["day"]), dtype=np.int64, count=len(logs["day"]))
+    valid = (rows >= 0) & (cols >= 0) & (cols < n_days)
+    logged[rows[valid], cols[valid]] = True
+    return logged
+
+
+def _percent(completed: int, scheduled: int) -> float:
+    return (completed / scheduled * 100) if scheduled > 0 else 0
+
+
+def compute_adherence(schedules: Dict[str, list], logs: Dict[str, list], start_date: date, end_date: date) -> Dict[str, Any]:
+    """
+    Reduce schedules and logs to overall, per-category and per-day adherence.
+    A log only counts when it falls on a day its schedule expects a dose/check.
+    """
+    expected = build_expected_matrix(schedules, start_date, end_date)
+    completed = expected & build_logged_matrix(schedules, logs, start_date, end_date)
+
+    category = np.asarray(schedules["category"], dtype=object)
+    breakdown = {}
+    for name in CATEGORIES:
+        rows = category == name
+        breakdown[name] = {
+            "scheduled": int(expected[rows].sum()),
+            "completed": int(completed[rows].sum()),
+        }
+
+    daily_scheduled = expected.sum(axis=0)
+    daily_completed = completed.sum(axis=0)
+    daily = []
+    for n in range(len(daily_scheduled)):
+        scheduled, done = int(daily_scheduled[n]), int(daily_completed[n])
+        daily.append({
+            "date": start_date + timedelta(days=n),
+            "scheduled": scheduled,
+            "completed": done,
+            "adherence_percent": _percent(done, scheduled),
+        })
+
+    total = int(daily_scheduled.sum())
+    adhered = int(daily_completed.sum())
+    return {
+        "total_scheduled": total,
+        "total_completed": adhered,
+        "adherence_percent": _percent(adhered, total),
+        "breakdown": breakdown,
+        "daily": daily,
+    }
+
+
+def summarize_daily_counts(rows, start_date: date, end_date: date) -> Dict[str, Any]:
+    """
+    Build the same result shape as compute_adherence from pre-aggregated rows
+    (one per day, with <category>_scheduled / <category>_completed columns).
+    Days missing from rows had nothing scheduled.
+    """
+    by_day = {row.day: row for row in rows}
+    breakdown = {name: {"scheduled": 0, "completed": 0} for name in CATEGORIES}
+    daily = []
+    day = start_date
+    while day <= end_date:
+        row = by_day.get(day)
+        scheduled = done = 0
+        if row is not None:
+            for name in CATEGORIES:
+                cat_scheduled = int(getattr(row, f"{name}_scheduled"))
+                cat_completed = int(getattr(row, f"{name}_completed"))
+                breakdown[name]["scheduled"] += cat_scheduled
+                breakdown[name]["completed"] += cat_completed
+                scheduled += cat_scheduled
+                done += cat_completed
+        daily.append({
+            "date": day,
+            "scheduled": scheduled,
+            "completed": done,
+            "adherence_percent": _percent(done, scheduled),
+        })
+        day += timedelta(days=1)
+
+    total = sum(cat["scheduled"] for cat in breakdown.values())
+    adhered = sum(cat["completed"] for cat in breakdown.values())
+    return {
+        "total_scheduled": total,
+        "total_completed": adhered,
+        "adherence_percent": _percent(adhered, total),
+        "breakdown": breakdown,
+        "daily": daily,
+    }
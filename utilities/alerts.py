@@ -0,0 +1,204 @@
+from datetime import date, datetime, timedelta, time
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session
+
+from models.bp_schedules import BPSchedule
+from models.scheduled_bp_logs import ScheduledBPLog
+from models.sugar_schedules import SugarSchedule
+from models.scheduled_sugar_logs import ScheduledSugarLog
+from constants.enums import SugarTypeEnum
+from crud.reports import load_medication_adherence_rows
+from utilities.adherence import is_scheduled_on
+
+
+def _index_by_schedule_day(logs, schedule_id_field: str, logged_at_field: str) -> Dict[tuple, Any]:
+    """Index logs by (schedule_id, date), keeping the earliest log for each pair."""
+    index = {}
+    for log in logs:
+        logged_at = getattr(log, logged_at_field)
+        key = (getattr(log, schedule_id_field), logged_at.date())
+        if key not in index:
+            index[key] = log
+    return index
+
+
+def _daterange(start_date: date, end_date: date):
+    for n in range((end_date - start_date).days + 1):
+        yield start_date + timedelta(days=n)
+
+
+def _emergency(heading: str, desc: str, checked_at: datetime) -> Dict[str, Any]:
+    return {
+        "tag": "EMERGENCY",
+        "heading": heading,
+        "description": desc,
+        "date": checked_at.strftime('%m/%d/%y'),
+        "time": checked_at.strftime('%I:%M %p'),
+        "_at": checked_at.replace(tzinfo=None),
+    }
+
+
+def _reminder(heading: str, desc: str, day: date, scheduled_time: time) -> Dict[str, Any]:
+    return {
+        "tag": "REMINDER",
+        "heading": heading,
+        "description": desc,
+        "date": str(day),
+        "time": str(scheduled_time),
+        "_at": datetime.combine(day, scheduled_time),
+    }
+
+
+def _medication_alerts(db: Session, patient_profile_id: int, start_date: date, end_date: date, now: datetime) -> List[Dict[str, Any]]:
+    rows = load_medication_adherence_rows(db, patient_profile_id, start_date, end_date)
+    schedules = rows["schedules"]
+    taken = {
+        (schedule_id, taken_at.date())
+        for schedule_id, taken_at in zip(rows["logs"]["schedule_id"], rows["logs"]["taken_at"])
+    }
+
+    alerts = []
+    for idx, schedule_id in enumerate(schedules["schedule_id"]):
+        med_name = schedules["medicine_name"][idx]
+        scheduled_time = schedules["scheduled_time"][idx]
+        dosage_instruction = schedules["dosage_instruction"][idx]
+        for day in _daterange(start_date, end_date):
+            if not is_scheduled_on(schedules["start_date"][idx], schedules["duration_days"][idx],
+                                   schedules["frequency"][idx], schedules["custom_days"][idx], day):
+                continue
+            if datetime.combine(day, scheduled_time) >= now or (schedule_id, day) in taken:
+                continue
+            if day == now.date():
+                desc = f"You missed your {dosage_instruction or ''} {med_name} dose scheduled at {scheduled_time.strftime('%I:%M %p')} on {day.strftime('%m/%d/%y')}. Please take it now if within 2 hours."
+            else:
+                desc = f"You missed your {dosage_instruction or ''} {med_name} dose scheduled at {scheduled_time.strftime('%I:%M %p')} on {day.strftime('%m/%d/%y')}."
+            alerts.append(_reminder("Medicine Reminder: Missed Dose Alert", desc, day, scheduled_time))
+    return alerts
+
+
+def _bp_alerts(db: Session, profile, start_date: date, end_date: date, now: datetime) -> List[Dict[str, Any]]:
+    schedules = db.query(BPSchedule).filter(
+        BPSchedule.patient_profile_id == profile.user_id,
+        BPSchedule.is_active == True
+    ).all()
+    if not schedules:
+        return []
+    logs = db.query(ScheduledBPLog).filter(
+        ScheduledBPLog.schedule_id.in_([sched.id for sched in schedules]),
+        ScheduledBPLog.checked_at >= datetime.combine(start_date, time.min),
+        ScheduledBPLog.checked_at <= datetime.combine(end_date, time.max)
+    ).order_by(ScheduledBPLog.checked_at).all()
+    logs_by_day = _index_by_schedule_day(logs, "schedule_id", "checked_at")
+
+    alerts = []
+    for sched in schedules:
+        for day in _daterange(start_date, end_date):
+            if not is_scheduled_on(sched.start_date, sched.duration_days, sched.frequency, sched.custom_days, day):
+                continue
+            if datetime.combine(day, sched.scheduled_time) >= now:
+                continue
+            log = logs_by_day.get((sched.id, day))
+            if not log:
+                alerts.append(_reminder(
+                    "BP Reminder: Missed BP Check",
+                    f"You missed your blood pressure check scheduled at {sched.scheduled_time.strftime('%I:%M %p')} on {day.strftime('%m/%d/%y')}. Please check as soon as possible.",
+                    day, sched.scheduled_time,
+                ))
+                continue
+
+            # Determine BP alert type
+            high_systolic = profile.bp_systolic_max is not None and log.systolic > profile.bp_systolic_max
+            low_systolic = profile.bp_systolic_min is not None and log.systolic < profile.bp_systolic_min
+            high_diastolic = profile.bp_diastolic_max is not None and log.diastolic > profile.bp_diastolic_max
+            low_diastolic = profile.bp_diastolic_min is not None and log.diastolic < profile.bp_diastolic_min
+            reading = f"BP Reading: {log.systolic}/{log.diastolic} detected at {log.checked_at.strftime('%I:%M %p')}."
+            if (high_systolic or high_diastolic) and (low_systolic or low_diastolic):
+                alerts.append(_emergency(
+                    "Emergency Alert: High and Low BP Detected",
+                    f"{reading} Systolic or diastolic is both above and below safe range. Seek immediate medical attention.",
+                    log.checked_at,
+                ))
+            elif high_systolic or high_diastolic:
+                alerts.append(_emergency(
+                    "Emergency Alert: High BP Detected",
+                    f"{reading} High blood pressure detected. Immediate attention advised.",
+                    log.checked_at,
+                ))
+            elif low_systolic or low_diastolic:
+                alerts.append(_emergency(
+                    "Emergency Alert: Low BP Detected",
+                    f"{reading} Low blood pressure detected. Immediate attention advised.",
+                    log.checked_at,
+                ))
+    return alerts
+
+
+def _sugar_alerts(db: Session, profile, start_date: date, end_date: date, now: datetime) -> List[Dict[str, Any]]:
+    schedules = db.query(SugarSchedule).filter(
+        SugarSchedule.patient_profile_id == profile.user_id,
+        SugarSchedule.is_active == True
+    ).all()
+    if not schedules:
+        return []
+    logs = db.query(ScheduledSugarLog).filter(
+        ScheduledSugarLog.schedule_id.in_([sched.id for sched in schedules]),
+        ScheduledSugarLog.checked_at >= datetime.combine(start_date, time.min),
+        ScheduledSugarLog.checked_at <= datetime.combine(end_date, time.max)
+    ).order_by(ScheduledSugarLog.checked_at).all()
+    logs_by_day = _index_by_schedule_day(logs, "schedule_id", "checked_at")
+
+    alerts = []
+    for sched in schedules:
+        for day in _daterange(start_date, end_date):
+            if not is_scheduled_on(sched.start_date, sched.duration_days, sched.frequency, sched.custom_days, day):
+                continue
+            if datetime.combine(day, sched.scheduled_time) >= now:
+                continue
+            log = logs_by_day.get((sched.id, day))
+            if not log:
+                alerts.append(_reminder(
+                    "Sugar Reminder: Missed Sugar Check",
+                    f"You missed your sugar check scheduled at {sched.scheduled_time.strftime('%I:%M %p')} on {day.strftime('%m/%d/%y')}. Please check as soon as possible.",
+                    day, sched.scheduled_time,
+                ))
+                continue
+
+            # Fasting or random sugar high/low logic
+            if sched.sugar_type == SugarTypeEnum.FASTING:
+                label, low_limit, high_limit = "Fasting", profile.sugar_fasting_min, profile.sugar_fasting_max
+            else:
+                label, low_limit, high_limit = "Random", profile.sugar_random_min, profile.sugar_random_max
+            reading = f"{label} sugar reading: {log.value} detected at {log.checked_at.strftime('%I:%M %p')} on {log.checked_at.strftime('%m/%d/%y')}."
+            if high_limit is not None and log.value > high_limit:
+                alerts.append(_emergency(
+                    f"Emergency Alert: High {label} Sugar Detected",
+                    f"{reading} High {label.lower()} sugar detected. Immediate attention advised.",
+                    log.checked_at,
+                ))
+            elif low_limit is not None and log.value < low_limit:
+                alerts.append(_emergency(
+                    f"Emergency Alert: Low {label} Sugar Detected",
+                    f"{reading} Low {label.lower()} sugar detected. Immediate attention advised.",
+                    log.checked_at,
+                ))
+    return alerts
+
+
+def evaluate_alerts(db: Session, profile, start_date: date, end_date: date, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Evaluate missed-dose/check and out-of-range alerts for a patient profile.
+    Logs for the window are preloaded with one query per log type and indexed by
+    (schedule_id, date), so the per-day checks never touch the database.
+    """
+    now = now or datetime.now()
+    alerts = (
+        _medication_alerts(db, profile.user_id, start_date, end_date, now)
+        + _bp_alerts(db, profile, start_date, end_date, now)
+        + _sugar_alerts(db, profile, start_date, end_date, now)
+    )
+
+    # Sort alerts: EMERGENCY first, then REMINDER; within each, most recent first
+    alerts.sort(key=lambda alert: (0 if alert["tag"] == "EMERGENCY" else 1, -alert["_at"].timestamp()))
+    for alert in alerts:
+        del alert["_at"]
+    return alerts
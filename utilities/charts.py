@@ -0,0 +1,126 @@
+"""
+Report charts on matplotlib's object-oriented API.
+
+Every chart gets its own Figure bound to a FigureCanvasAgg, so nothing touches the
+pyplot state machine and charts can be drawn from several threads at once. Styling
+lives in ChartTemplate instances built once at import time, and inputs are plain
+columns (sequences or NumPy arrays) rather than ORM rows.
+"""
+import io
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# 10x4 in at 100 dpi gives 1000x400 px, ~140 ppi once placed 180 mm wide in the PDF
+DEFAULT_DPI = 100
+# Up to this many days every day gets a tick; longer windows use automatic ticks
+DAILY_TICK_LIMIT = 31
+
+SERIES_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
+
+
+class ChartTemplate:
+    """Title, axis labels and layout shared by every chart of one kind."""
+
+    def __init__(self, title: str, ylabel: str, xlabel: str = "Date", figsize=(10, 4), ylim=None):
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.figsize = figsize
+        self.ylim = ylim
+
+    def new_axes(self):
+        fig = Figure(figsize=self.figsize, layout="tight")
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_title(self.title)
+        ax.set_xlabel(self.xlabel)
+        ax.set_ylabel(self.ylabel)
+        if self.ylim is not None:
+            ax.set_ylim(*self.ylim)
+        return fig, ax
+
+
+BP_TEMPLATE = ChartTemplate("Blood Pressure Trend", "Blood Pressure (mmHg)")
+SUGAR_TEMPLATE = ChartTemplate("Blood Sugar Trend", "Sugar Level (mg/dL)")
+ADHERENCE_TEMPLATE = ChartTemplate("Daily Adherence", "Adherence (%)", ylim=(0, 100))
+
+
+def to_minutes(checked_at: Sequence) -> np.ndarray:
+    """datetime64[m] column; aware datetimes are converted to naive UTC first."""
+    return np.array(
+        [dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt for dt in checked_at],
+        dtype="datetime64[m]",
+    )
+
+
+def average_by_minute(minutes: np.ndarray, values: Sequence) -> tuple:
+    """Sorted unique timestamps and the mean value at each (avoids vertical lines from duplicates)."""
+    unique, inverse = np.unique(minutes, return_inverse=True)
+    sums = np.bincount(inverse, weights=np.asarray(values, dtype=float), minlength=len(unique))
+    counts = np.bincount(inverse, minlength=len(unique))
+    return unique, sums / counts
+
+
+def _format_date_axis(ax, minutes: np.ndarray):
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+    span_days = (minutes.max() - minutes.min()).astype("timedelta64[D]").astype(int) if len(minutes) else 0
+    if span_days <= DAILY_TICK_LIMIT:
+        ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
+    else:
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+    ax.tick_params(axis="x", labelrotation=45)
+
+
+def render(fig: Figure, fmt: str = "png", dpi: int = DEFAULT_DPI) -> bytes:
+    """Encode a figure; fmt="svg" gives a vector image (dpi is then irrelevant)."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi)
+    return buf.getvalue()
+
+
+def bp_chart(checked_at: Sequence, systolic: Sequence, diastolic: Sequence, fmt: str = "png", dpi: int = DEFAULT_DPI) -> bytes:
+    fig, ax = BP_TEMPLATE.new_axes()
+    if len(checked_at):
+        minutes = to_minutes(checked_at)
+        times, systolic_avg = average_by_minute(minutes, systolic)
+        _, diastolic_avg = average_by_minute(minutes, diastolic)
+        ax.plot(times, systolic_avg, marker='o', label='Systolic', linewidth=2, markersize=4, color='#ff7f0e')
+        ax.plot(times, diastolic_avg, marker='s', label='Diastolic', linewidth=2, markersize=4, color='#2ca02c')
+        ax.legend()
+        _format_date_axis(ax, times)
+    return render(fig, fmt, dpi)
+
+
+def sugar_chart(checked_at: Sequence, values: Sequence, types: Sequence, fmt: str = "png", dpi: int = DEFAULT_DPI) -> bytes:
+    """One line per sugar type, in order of first appearance."""
+    fig, ax = SUGAR_TEMPLATE.new_axes()
+    if len(checked_at):
+        minutes = to_minutes(checked_at)
+        values = np.asarray(values, dtype=float)
+        types = np.asarray(types, dtype=object)
+        labels = list(dict.fromkeys(types))
+        for idx, label in enumerate(labels):
+            rows = types == label
+            times, averages = average_by_minute(minutes[rows], values[rows])
+            ax.plot(times, averages, marker='o', linewidth=2, markersize=4, label=label,
+                    color=SERIES_COLORS[idx % len(SERIES_COLORS)])
+        ax.legend()
+        _format_date_axis(ax, minutes)
+    return render(fig, fmt, dpi)
+
+
+def adherence_chart(labels: Sequence[str], percents: Sequence[float], fmt: str = "png", dpi: int = DEFAULT_DPI) -> bytes:
+    fig, ax = ADHERENCE_TEMPLATE.new_axes()
+    if len(labels):
+        # A single day (daily view) gets one narrow centered bar
+        width = 0.4 if len(labels) == 1 else 0.6
+        x_pos = np.arange(len(labels))
+        ax.bar(x_pos, percents, width=width, alpha=0.7, color='#1f77b4')
+        ax.set_xticks(x_pos, labels)
+        ax.tick_params(axis="x", labelrotation=45)
+    return render(fig, fmt, dpi)
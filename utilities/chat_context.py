@@ -0,0 +1,137 @@
+"""
+Size-budgeted assembly of chat prompts.
+
+A prompt is a list of parts (system prompt, patient summary, conversation summary,
+recent messages, the user's message) rendered in that order. Under
+CHAT_PROMPT_MAX_TOKENS, parts get the budget by priority: required parts always go
+in whole, the rest in ascending priority order until it runs out. A part that
+does not fit is cut: text parts keep their beginning, list parts (recent messages)
+keep their last items. Headers and footers are never cut; a part whose header
+alone does not fit is left out.
+
+Sizes are estimated from characters (utilities/insight_prompt.estimate_tokens),
+and each assembly's metrics are recorded in chat_prompt_stats.
+"""
+import math
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from utilities.insight_prompt import estimate_tokens
+
+TRUNCATION_MARK = "…"
+# A cut text part keeping less than this is left out instead
+MIN_TRUNCATED_CHARS = 200
+
+
+class ContextPart:
+    def __init__(self, name: str, body: Union[str, List[str]], priority: int = 0, required: bool = False,
+                 header: str = "", footer: str = "", separator: str = "\n"):
+        self.name = name
+        self.body = body
+        self.priority = priority
+        self.required = required
+        self.header = header
+        self.footer = footer
+        self.separator = separator
+
+    def render(self, body: Union[str, List[str]]) -> str:
+        text = self.separator.join(body) if isinstance(body, list) else body
+        return self.header + text + self.footer
+
+    def fit(self, max_chars: int) -> Optional[Union[str, List[str]]]:
+        """The largest body whose rendering fits in max_chars, or None if nothing useful does."""
+        room = max_chars - len(self.header) - len(self.footer)
+        if isinstance(self.body, list):
+            kept: List[str] = []
+            used = 0
+            for item in reversed(self.body):
+                size = len(item) + (len(self.separator) if kept else 0)
+                if used + size > room:
+                    break
+                kept.insert(0, item)
+                used += size
+            return kept or None
+        if room < min(MIN_TRUNCATED_CHARS, len(self.body)):
+            return None
+        return self.body[:room - len(TRUNCATION_MARK)].rstrip() + TRUNCATION_MARK
+
+
+def assemble_prompt(parts: List[ContextPart], max_tokens: int) -> Tuple[str, Dict[str, Any]]:
+    """The prompt made of the parts that fit in max_tokens, and its size metrics."""
+    max_chars = max_tokens * 4
+    bodies: Dict[str, Union[str, List[str]]] = {}
+    used = 0
+    for part in parts:
+        if part.required:
+            bodies[part.name] = part.body
+            used += len(part.render(part.body))
+
+    truncated, dropped = [], []
+    for part in sorted((p for p in parts if not p.required and p.body), key=lambda p: p.priority):
+        size = len(part.render(part.body))
+        if used + size <= max_chars:
+            bodies[part.name] = part.body
+            used += size
+            continue
+        body = part.fit(max_chars - used)
+        if body is None:
+            dropped.append(part.name)
+            continue
+        bodies[part.name] = body
+        used += len(part.render(body))
+        truncated.append(part.name)
+
+    prompt = "".join(part.render(bodies[part.name]) for part in parts if part.name in bodies)
+    metrics = {
+        "chars": len(prompt),
+        "tokens": estimate_tokens(prompt),
+        "max_tokens": max_tokens,
+        "parts": {part.name: len(part.render(bodies[part.name])) for part in parts if part.name in bodies},
+        "truncated": truncated,
+        "dropped": dropped,
+        "over_budget": len(prompt) > max_chars,
+    }
+    return prompt, metrics
+
+
+class PromptStats:
+    """Thread-safe prompt size counters, with percentiles over the last `window` prompts."""
+
+    def __init__(self, window: int = 1000):
+        self._tokens = deque(maxlen=window)
+        self._count = 0
+        self._truncated = 0
+        self._dropped = 0
+        self._over_budget = 0
+        self._max_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, metrics: Dict[str, Any]):
+        with self._lock:
+            self._count += 1
+            self._tokens.append(metrics["tokens"])
+            self._truncated += bool(metrics["truncated"])
+            self._dropped += bool(metrics["dropped"])
+            self._over_budget += metrics["over_budget"]
+            self._max_tokens = max(self._max_tokens, metrics["tokens"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._tokens)
+
+            def pct(value: float) -> Optional[int]:
+                return ordered[max(math.ceil(value / 100 * len(ordered)) - 1, 0)] if ordered else None
+
+            return {
+                "prompts": self._count,
+                "p50_tokens": pct(50),
+                "p95_tokens": pct(95),
+                "max_tokens": self._max_tokens,
+                "with_truncated_parts": self._truncated,
+                "with_dropped_parts": self._dropped,
+                "over_budget": self._over_budget,
+            }
+
+
+chat_prompt_stats = PromptStats()
@@ -1,20 +1,44 @@
-import os
-from dotenv import load_dotenv
+"""
+Shared Gemini client for every LLM call (insights and chat).
+
+The API is configured once per process, and one GenerativeModel is built per
+(model name, safety profile) pair and reused. All models share the library's
+default client, so calls reuse one connection instead of setting up their own.
+Every request gets a timeout (GEMINI_TIMEOUT_SECONDS) and goes through the same
+retry policy; callers only choose how many attempts they can afford.
+"""
+import logging
+from functools import lru_cache
+from typing import Iterator
+
 import google.generativeai as genai
 from google.api_core import exceptions as google_exceptions
 import tenacity
-import logging
 
-# Load .env file
-load_dotenv()
+from config import settings
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_KEY = settings.GEMINI_API_KEY
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables.")
 
 # Configure the Gemini client
 genai.configure(api_key=GEMINI_API_KEY)
 
+INSIGHT_MODEL = "models/gemini-1.5-flash"
+CHAT_MODEL = "gemini-2.5-flash"
+
+SAFETY_PROFILES = {
+    # Library defaults
+    "default": None,
+    # Health data trips the default filters too often for generated insights
+    "insights": {
+        genai.types.HarmCategory.HARM_CATEGORY_HARASSMENT: genai.types.HarmBlockThreshold.BLOCK_NONE,
+        genai.types.HarmCategory.HARM_CATEGORY_HATE_SPEECH: genai.types.HarmBlockThreshold.BLOCK_NONE,
+        genai.types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: genai.types.HarmBlockThreshold.BLOCK_NONE,
+        genai.types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: genai.types.HarmBlockThreshold.BLOCK_NONE,
+    },
+}
+
 # Retry on API/network errors or blocked content
 RETRY_EXCEPTIONS = (
     google_exceptions.GoogleAPIError,
@@ -24,36 +48,75 @@ RETRY_EXCEPTIONS = (
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-@tenacity.retry(
-    stop=tenacity.stop_after_attempt(5),
-    wait=tenacity.wait_exponential(multiplier=1, min=4, max=10),
-    retry=tenacity.retry_if_exception_type(RETRY_EXCEPTIONS),
-    before_sleep=tenacity.before_sleep_log(logger, logging.INFO),
-    reraise=True
-)
-def generate_gemini_response(prompt: str) -> str:
-    model = genai.GenerativeModel(
-        "models/gemini-1.5-flash",
-        safety_settings={
-            genai.types.HarmCategory.HARM_CATEGORY_HARASSMENT: genai.types.HarmBlockThreshold.BLOCK_NONE,
-            genai.types.HarmCategory.HARM_CATEGORY_HATE_SPEECH: genai.types.HarmBlockThreshold.BLOCK_NONE,
-            genai.types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: genai.types.HarmBlockThreshold.BLOCK_NONE,
-            genai.types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: genai.types.HarmBlockThreshold.BLOCK_NONE,
-            # genai.types.HarmCategory.MEDICAL: genai.types.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-            # genai.types.HarmCategory.HARM_CATEGORY_TOXICITY: genai.types.HarmBlockThreshold.BLOCK_NONE,
-            # genai.types.HarmCategory.HARM_CATEGORY_DEROGATORY: genai.types.HarmBlockThreshold.BLOCK_NONE,
-        }
-    )
 
-    logger.info("Attempting to generate Gemini response...")
+@lru_cache(maxsize=None)
+def get_model(model_name: str, safety_profile: str = "default") -> genai.GenerativeModel:
+    """Cached model instance for the (model name, safety profile) pair."""
+    return genai.GenerativeModel(model_name, safety_settings=SAFETY_PROFILES[safety_profile])
+
+
+def _retrying(max_attempts: int) -> tenacity.Retrying:
+    return tenacity.Retrying(
+        stop=tenacity.stop_after_attempt(max_attempts),
+        wait=tenacity.wait_exponential(multiplier=1, min=4, max=10),
+        retry=tenacity.retry_if_exception_type(RETRY_EXCEPTIONS),
+        before_sleep=tenacity.before_sleep_log(logger, logging.INFO),
+        reraise=True,
+    )
 
-    response = model.generate_content(prompt)
 
-    if not response.parts:
+def generate_text(prompt: str, model_name: str = CHAT_MODEL, safety_profile: str = "default",
+                  max_attempts: int = None, timeout: float = None) -> str:
+    """
+    Generate a response with the shared retry policy. Raises the last error once
+    max_attempts (default GEMINI_MAX_ATTEMPTS) are used up; blocked output counts
+    as an error (ValueError).
+    """
+    model = get_model(model_name, safety_profile)
+    request_options = {"timeout": timeout or settings.GEMINI_TIMEOUT_SECONDS}
+    for attempt in _retrying(max_attempts or settings.GEMINI_MAX_ATTEMPTS):
+        with attempt:
+            logger.info("Attempting to generate Gemini response...")
+            response = model.generate_content(prompt, request_options=request_options)
+            if not response.parts:
+                logger.warning("⚠️ Gemini response was blocked due to safety concerns.")
+                raise ValueError("Gemini output was blocked by safety settings.")
+            return response.text
+
+
+def stream_text(prompt: str, model_name: str = CHAT_MODEL, safety_profile: str = "default",
+                max_attempts: int = None, timeout: float = None) -> Iterator[str]:
+    """
+    Yield the response text chunk by chunk as Gemini produces it. Only opening the
+    stream (up to the first chunk) is retried; closing the generator early cancels
+    the request so an abandoned answer stops generating.
+    """
+    model = get_model(model_name, safety_profile)
+    request_options = {"timeout": timeout or settings.GEMINI_TIMEOUT_SECONDS}
+    for attempt in _retrying(max_attempts or settings.GEMINI_MAX_ATTEMPTS):
+        with attempt:
+            logger.info("Attempting to stream Gemini response...")
+            response = model.generate_content(prompt, stream=True, request_options=request_options)
+
+    produced = False
+    try:
+        for chunk in response:
+            if chunk.parts:
+                produced = True
+                yield chunk.text
+    finally:
+        # The library has no public cancel; the underlying gRPC stream does
+        cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+        if cancel is not None:
+            cancel()
+    if not produced:
         logger.warning("⚠️ Gemini response was blocked due to safety concerns.")
         raise ValueError("Gemini output was blocked by safety settings.")
 
-    return response.text
+
+def generate_gemini_response(prompt: str) -> str:
+    """Insight generation: the insight model with relaxed safety filters."""
+    return generate_text(prompt, INSIGHT_MODEL, "insights")
 
 
 # import os
@@ -0,0 +1,95 @@
+"""
+Cache of parsed insights keyed by their exact prompt.
+
+The key is a hash of the model and the full single-patient prompt (period, date range,
+schedules and logs), so identical inputs reuse the earlier title, summary and JSON
+instead of calling Gemini again, e.g. when a deleted insight is requested again.
+Any change to a log or schedule changes the prompt and therefore the key.
+
+Entries live in an in-memory LRU bounded by total bytes, and expire after
+INSIGHT_CACHE_TTL_SECONDS.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import settings
+
+# Bump when prompt parsing or the stored fields change so stale results are not served
+INSIGHT_CACHE_VERSION = 1
+
+
+def insight_cache_key(model_name: str, prompt: str) -> str:
+    return hashlib.sha256(f"{INSIGHT_CACHE_VERSION}\0{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class InsightCache:
+    """Thread-safe LRU of parsed insights with a TTL, evicting least recently used entries past max_bytes."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return json.loads(entry[0])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a JSON-serializable value; values larger than the whole cache are skipped."""
+        encoded = json.dumps(value)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (encoded, size, time.monotonic() + self.ttl_seconds)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self._evictions,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0,
+            }
+
+
+insight_cache = InsightCache(settings.INSIGHT_CACHE_MAX_BYTES, settings.INSIGHT_CACHE_TTL_SECONDS)
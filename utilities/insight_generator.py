@@ -4,13 +4,22 @@ import json
 import re
 from models.insights import Insight
 from constants.enums import InsightPeriodEnum
-from crud.scheduled_bp_logs import get_logs_by_date as get_bp_logs
-from crud.scheduled_sugar_logs import get_sugar_logs_by_date
-from crud.scheduled_medication_logs import get_logs_by_date as get_med_logs
+from sqlalchemy.orm import contains_eager, joinedload
+from models.bp_schedules import BPSchedule
+from models.scheduled_bp_logs import ScheduledBPLog
+from models.sugar_schedules import SugarSchedule
+from models.scheduled_sugar_logs import ScheduledSugarLog
+from models.medications import Medication
+from models.medication_schedules import MedicationSchedule
+from models.scheduled_medication_logs import ScheduledMedicationLog
+from models.patient_profiles import PatientProfile
 from crud.bp_schedules import get_patient_bp_schedules
 from crud.sugar_schedules import get_user_sugar_schedules
 from crud.medications import get_user_medications
-from utilities.gemini_client import generate_gemini_response
+from utilities.gemini_client import generate_gemini_response, INSIGHT_MODEL
+from utilities.insight_cache import insight_cache, insight_cache_key
+from utilities.insight_prompt import encode_logs, estimate_tokens
+from config import settings
 from sqlalchemy.exc import IntegrityError
 import tenacity
 import google.generativeai as genai
@@ -28,6 +37,14 @@ DANGEROUS_RECOMMENDATION_KEYWORDS = [
     "cure diabetes", "cure hypertension", "replace insulin", "ignore doctor"
 ]
 
+INSIGHT_SAFETY_GUIDELINES = """**Important Safety Guidelines:**
+* **DO NOT** make medical diagnoses or claim to cure diseases.
+* **DO NOT** prescribe specific medications or advise on medication dosages.
+* **DO NOT** tell the user to stop or change their prescribed medications without consulting a doctor.
+* Focus on observations from the data, general healthy lifestyle recommendations (e.g., "stay hydrated", "monitor readings"), and adherence tracking.
+* Remind the user to consult a healthcare professional for personalized medical advice.
+"""
+
 # --- Main generate_daily_insight function with all guardrails and updated error handling ---
 
 def build_gemini_prompt(period, start_date, end_date, bp_schedules_str, sugar_schedules_str, med_schedules_str, bp_logs_str, sugar_logs_str, med_logs_str):
@@ -56,13 +73,7 @@ Medication Schedules:\n{med_schedules_str}
     -   "unusual_spikes": identification of any abnormal or concerning readings that stand out.
     Ensure all JSON values are valid strings, numbers, or boolean types. Do NOT include any non-JSON content inside the ```json...``` block.
 
-**Important Safety Guidelines:**
-* **DO NOT** make medical diagnoses or claim to cure diseases.
-* **DO NOT** prescribe specific medications or advise on medication dosages.
-* **DO NOT** tell the user to stop or change their prescribed medications without consulting a doctor.
-* Focus on observations from the data, general healthy lifestyle recommendations (e.g., "stay hydrated", "monitor readings"), and adherence tracking.
-* Remind the user to consult a healthcare professional for personalized medical advice.
-
+{INSIGHT_SAFETY_GUIDELINES}
 Blood Pressure Logs:\n{bp_logs_str}
 
 Sugar Logs:\n{sugar_logs_str}
@@ -73,53 +84,76 @@ Remember to provide insights relevant to managing chronic conditions.
 """
 
 
-def generate_insight(db: Session, user_id: int, period: InsightPeriodEnum, start_date: date):
-    """
-    Generates a health insight for a user for the given period (daily, weekly, monthly), returns the parsed data (does NOT save to DB).
-    The end_date is calculated based on the period.
-    """
-    # Calculate end_date based on period
+def load_insight_logs(db: Session, patient_profile_id: int, start_date: date, end_date: date):
+    """Scheduled BP, sugar and medication logs for the period, oldest first, with the schedule fields the prompt prints."""
+    start_dt = datetime.combine(start_date, datetime.min.time())
+    end_dt = datetime.combine(end_date, datetime.max.time())
+    bp_logs = db.query(ScheduledBPLog).join(BPSchedule).filter(
+        BPSchedule.patient_profile_id == patient_profile_id,
+        ScheduledBPLog.checked_at >= start_dt,
+        ScheduledBPLog.checked_at <= end_dt
+    ).order_by(ScheduledBPLog.checked_at).all()
+    sugar_logs = db.query(ScheduledSugarLog).join(SugarSchedule).options(
+        contains_eager(ScheduledSugarLog.schedule)
+    ).filter(
+        SugarSchedule.patient_profile_id == patient_profile_id,
+        ScheduledSugarLog.checked_at >= start_dt,
+        ScheduledSugarLog.checked_at <= end_dt
+    ).order_by(ScheduledSugarLog.checked_at).all()
+    med_logs = db.query(ScheduledMedicationLog).join(ScheduledMedicationLog.schedule).join(MedicationSchedule.medication).options(
+        contains_eager(ScheduledMedicationLog.schedule)
+        .contains_eager(MedicationSchedule.medication)
+        .joinedload(Medication.medicine)
+    ).filter(
+        Medication.patient_profile_id == patient_profile_id,
+        ScheduledMedicationLog.taken_at >= start_dt,
+        ScheduledMedicationLog.taken_at <= end_dt
+    ).order_by(ScheduledMedicationLog.taken_at).all()
+    return bp_logs, sugar_logs, med_logs
+
+
+def insight_end_date(period: InsightPeriodEnum, start_date: date) -> date:
+    """Last day of the insight period starting on start_date."""
     if period == InsightPeriodEnum.DAILY:
-        end_date = start_date
-    elif period == InsightPeriodEnum.WEEKLY:
-        end_date = start_date + timedelta(days=6)
-    elif period == InsightPeriodEnum.MONTHLY:
+        return start_date
+    if period == InsightPeriodEnum.WEEKLY:
+        return start_date + timedelta(days=6)
+    if period == InsightPeriodEnum.MONTHLY:
         # Get last day of the month
         if start_date.month == 12:
-            end_date = start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
-        else:
-            end_date = start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
-    else:
-        raise ValueError(f"Unknown period: {period}")
+            return start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
+        return start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
+    raise ValueError(f"Unknown period: {period}")
 
 
-    # Fetch logs for the period
-    if period == InsightPeriodEnum.DAILY:
-        bp_logs = get_bp_logs(db, user_id, start_date)
-        sugar_logs = get_sugar_logs_by_date(db, user_id, start_date)
-        med_logs = get_med_logs(db, user_id, start_date)
-    else:
-        # Use date range functions for weekly/monthly
-        from crud.scheduled_bp_logs import get_logs_by_date_range as get_bp_logs_by_range
-        from crud.scheduled_sugar_logs import get_sugar_logs_by_date_range as get_sugar_logs_by_range
-        from crud.scheduled_medication_logs import get_logs_by_date_range as get_med_logs_by_range
-        # For BP logs, use datetime range
-        bp_logs = get_bp_logs_by_range(db, user_id, datetime.combine(start_date, datetime.min.time()), datetime.combine(end_date, datetime.max.time()))
-        sugar_logs = get_sugar_logs_by_range(db, user_id, start_date, end_date)
-        med_logs = get_med_logs_by_range(db, user_id, start_date, end_date)
+def format_insight_context(db: Session, user_id: int, period: InsightPeriodEnum, start_date: date, end_date: date):
+    """
+    The patient's schedules and logs for the period as prompt-ready strings, keyed
+    like the build_gemini_prompt arguments.
+    """
+    # Fetch logs for the period (schedules carry the patient id, sugar type and medicine)
+    bp_logs, sugar_logs, med_logs = load_insight_logs(db, user_id, start_date, end_date)
 
     # Schedules logic remains unchanged
     bp_schedules = get_patient_bp_schedules(db, user_id)
     sugar_schedules = get_user_sugar_schedules(db, user_id)
     medications = get_user_medications(db, user_id)
 
+    def schedule_window(s):
+        last_day = s.start_date + timedelta(days=s.duration_days - 1) if s.duration_days else None
+        return f"{s.start_date.strftime('%Y-%m-%d')} to {last_day.strftime('%Y-%m-%d') if last_day else 'ongoing'}"
+
+    def overlaps_period(s):
+        last_day = s.start_date + timedelta(days=s.duration_days - 1) if s.duration_days else end_date
+        return s.is_active and s.start_date <= end_date and last_day >= start_date
+
     # Format BP schedules concisely
     def format_bp_schedules():
         if not bp_schedules:
             return "No BP schedules."
         return "\n".join(
-            f"- {s.time.strftime('%I:%M %p')} ({s.start_date.strftime('%Y-%m-%d')} to {s.end_date.strftime('%Y-%m-%d')})"
-            for s in bp_schedules if s.is_active and s.start_date <= end_date and (s.end_date or end_date) >= start_date
+            f"- {s.scheduled_time.strftime('%I:%M %p')} ({schedule_window(s)})"
+            for s in bp_schedules if overlaps_period(s)
         ) or "No BP schedules."
 
     # Format sugar schedules concisely
@@ -127,8 +161,8 @@ def generate_insight(db: Session, user_id: int, period: InsightPeriodEnum, start
         if not sugar_schedules:
             return "No sugar schedules."
         return "\n".join(
-            f"- {s.time.strftime('%I:%M %p')} ({s.start_date.strftime('%Y-%m-%d')} to {s.end_date.strftime('%Y-%m-%d')})"
-            for s in sugar_schedules if s.is_active and s.start_date <= end_date and (s.end_date or end_date) >= start_date
+            f"- {s.scheduled_time.strftime('%I:%M %p')} {s.sugar_type.value} ({schedule_window(s)})"
+            for s in sugar_schedules if overlaps_period(s)
         ) or "No sugar schedules."
 
     # Format medication schedules concisely
@@ -137,71 +171,31 @@ def generate_insight(db: Session, user_id: int, period: InsightPeriodEnum, start
             return "No medication schedules."
         lines = []
         for med in medications:
+            if not overlaps_period(med):
+                continue
             med_name = f"{med.medicine.name} {med.medicine.strength}"
             scheds = [
-                f"{s.time.strftime('%I:%M %p')}{f' ({s.dosage_instruction})' if s.dosage_instruction else ''}"
-                for s in med.schedules
+                f"{s.scheduled_time.strftime('%I:%M %p')}{f' ({s.dosage_instruction})' if s.dosage_instruction else ''}"
+                for s in med.schedules if s.is_active
             ]
             if scheds:
                 lines.append(f"- {med_name}: {', '.join(scheds)}")
         return "\n".join(lines) or "No medication schedules."
 
-    # Format logs into string
-    def format_bp():
-        if not bp_logs:
-            return "No blood pressure readings."
-        return "\n".join(
-            f"- {log.checked_at.strftime('%Y-%m-%d %I:%M %p')}: {log.systolic}/{log.diastolic} (Pulse: {log.pulse})"
-            for log in bp_logs
-        )
-
-    def format_sugar():
-        if not sugar_logs:
-            return "No sugar readings."
-        return "\n".join(
-            f"- {log.checked_at.strftime('%Y-%m-%d %I:%M %p')} ({log.type.value}): {log.value} mg/dL"
-            for log in sugar_logs
-        )
+    return {
+        "bp_schedules_str": format_bp_schedules(),
+        "sugar_schedules_str": format_sugar_schedules(),
+        "med_schedules_str": format_medication_schedules(),
+        # Per-day aggregates by default, one line per log with INSIGHT_COMPACT_LOGS=false
+        **encode_logs(bp_logs, sugar_logs, med_logs, db.get(PatientProfile, user_id), settings.INSIGHT_COMPACT_LOGS),
+    }
 
-    def format_meds():
-        if not med_logs:
-            return "No medication logs."
-        return "\n".join(
-            f"- {log.medication_schedule.medication.medicine.name} ({'Taken' if log.taken_at else 'Missed'})"
-            for log in med_logs
-        )
 
-    # Compose Gemini prompt with schedules and period
-    prompt = build_gemini_prompt(
-        period,
-        start_date,
-        end_date,
-        format_bp_schedules(),
-        format_sugar_schedules(),
-        format_medication_schedules(),
-        format_bp(),
-        format_sugar(),
-        format_meds()
-    )
-
-    print(prompt)
-
-    # Call Gemini with retry logic (unchanged)
-    gemini_output = ""
-    try:
-        gemini_output = generate_gemini_response(prompt)
-    except (GoogleAPIError, tenacity.RetryError, ValueError) as e:
-        print(f"❌ Failed to get a valid Gemini response after retries for user {user_id} for {period.value} period {start_date} to {end_date}: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
-
-    # --- Guardrail: Check for empty response (if it somehow slipped through or was initially empty) ---
-    if not gemini_output:
-        print(f"❌ Gemini output was unexpectedly empty for user {user_id} for {period.value} period {start_date} to {end_date} after retries. Cannot generate insight.")
-        return None
-
-    # Parsing and validation logic (unchanged, but use start_date/end_date/period)
+def parse_insight_output(gemini_output: str, user_id: int, period: InsightPeriodEnum, start_date: date, end_date: date):
+    """
+    Parse and validate one insight (Title, Summary and JSON block) from Gemini output.
+    Returns the insight data, or None if the output fails validation.
+    """
     title = f"{period.value.title()} Health Insight"
     summary = "No detailed summary provided by AI."
     json_data = {key: [] for key in EXPECTED_INSIGHT_JSON_KEYS}
@@ -267,7 +261,7 @@ def generate_insight(db: Session, user_id: int, period: InsightPeriodEnum, start
             "end_date": end_date,
             "title": title,
             "summary": summary,
-            "json_data": json.dumps(json_data)
+            "json_data": json_data
         }
     except json.JSONDecodeError as e:
         print(f"❌ JSON parsing failed for user {user_id} for {period.value} period {start_date} to {end_date}: {e}")
@@ -281,6 +275,188 @@ def generate_insight(db: Session, user_id: int, period: InsightPeriodEnum, start
         traceback.print_exc()
         return None
 
+
+def cached_insight(cache_key: str, user_id: int, period: InsightPeriodEnum, start_date: date, end_date: date):
+    """Insight data from the prompt cache, or None."""
+    cached = insight_cache.get(cache_key)
+    if cached is None:
+        return None
+    print(f"♻️ Reusing cached {period.value.lower()} insight for user {user_id} ({start_date} to {end_date}), inputs unchanged.")
+    return {"user_id": user_id, "period": period, "start_date": start_date, "end_date": end_date, **cached}
+
+
+def cache_insight(cache_key: str, insight_data):
+    insight_cache.put(cache_key, {key: insight_data[key] for key in ("title", "summary", "json_data")})
+
+
+def generate_insight(db: Session, user_id: int, period: InsightPeriodEnum, start_date: date):
+    """
+    Generates a health insight for a user for the given period (daily, weekly, monthly), returns the parsed data (does NOT save to DB).
+    The end_date is calculated based on the period.
+    """
+    end_date = insight_end_date(period, start_date)
+
+    # Compose Gemini prompt with schedules and period
+    prompt = build_gemini_prompt(period, start_date, end_date, **format_insight_context(db, user_id, period, start_date, end_date))
+
+    # Identical inputs give the same insight, reuse it without calling Gemini
+    cache_key = insight_cache_key(INSIGHT_MODEL, prompt)
+    cached = cached_insight(cache_key, user_id, period, start_date, end_date)
+    if cached:
+        return cached
+
+    print(prompt)
+    print(f"📏 Insight prompt for user {user_id}: {len(prompt)} chars, ~{estimate_tokens(prompt)} tokens.")
+
+    # Call Gemini with retry logic (unchanged)
+    gemini_output = ""
+    try:
+        gemini_output = generate_gemini_response(prompt)
+    except (GoogleAPIError, tenacity.RetryError, ValueError) as e:
+        print(f"❌ Failed to get a valid Gemini response after retries for user {user_id} for {period.value} period {start_date} to {end_date}: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+    # --- Guardrail: Check for empty response (if it somehow slipped through or was initially empty) ---
+    if not gemini_output:
+        print(f"❌ Gemini output was unexpectedly empty for user {user_id} for {period.value} period {start_date} to {end_date} after retries. Cannot generate insight.")
+        return None
+
+    insight_data = parse_insight_output(gemini_output, user_id, period, start_date, end_date)
+    if insight_data:
+        cache_insight(cache_key, insight_data)
+    return insight_data
+
+
+# --- Batch mode: several patients per Gemini request for the scheduled jobs ---
+
+def format_patient_section(user_id: int, context) -> str:
+    """One patient's schedules and logs, delimited so the model can tell patients apart."""
+    return f"""
+=== Patient {user_id} ===
+Blood Pressure Schedules:\n{context["bp_schedules_str"]}
+
+Sugar Schedules:\n{context["sugar_schedules_str"]}
+
+Medication Schedules:\n{context["med_schedules_str"]}
+
+Blood Pressure Logs:\n{context["bp_logs_str"]}
+
+Sugar Logs:\n{context["sugar_logs_str"]}
+
+Medication Logs:\n{context["med_logs_str"]}
+=== End of Patient {user_id} ===
+"""
+
+
+def build_batch_gemini_prompt(period, start_date, end_date, contexts) -> str:
+    """
+    Build one prompt for several patients (contexts maps user id to format_insight_context
+    output). The instructions are shared, and every patient's insight comes back in its
+    own "### Patient <id>" section using the single-patient response format.
+    """
+    period_label = period.value.title()
+    date_range_str = f"{start_date} to {end_date}" if start_date != end_date else f"{start_date}"
+    patient_sections = "".join(format_patient_section(user_id, context) for user_id, context in contexts.items())
+    return f"""
+You are an AI health assistant for HealthMate, focused on managing chronic conditions like diabetes and hypertension.
+Below are the {period_label.lower()} health logs and schedules of {len(contexts)} patients for {date_range_str}. Generate a separate concise {period_label.lower()} health insight for each patient, using only that patient's data.
+
+**Instructions for Response Format (Strictly Adhere):**
+For every patient, in the order given, write a section that starts with a line "### Patient <id>" (the id from the patient's "=== Patient <id> ===" header), followed by:
+1.  **Title:** A line starting with "Title:" followed by a concise, informative title (e.g., "{period_label} Health Summary for {date_range_str}").
+2.  **Summary:** On a new line, start with "Summary:" followed by a brief overall summary of the patient's {period_label.lower()} health, highlighting key observations from the logs.
+3.  **JSON Block:** A valid JSON object enclosed in triple backticks (```json...```). This JSON must contain the following top-level keys, each with a list of relevant observations or recommendations:
+    -   "smart_recommendations": actionable general health advice based on the provided logs.
+    -   "adherence": observations on medication and schedule adherence for the {period_label.lower()}.
+    -   "vital_sign_patterns": analysis of blood pressure and/or sugar trends or significant readings.
+    -   "unusual_spikes": identification of any abnormal or concerning readings that stand out.
+    Ensure all JSON values are valid strings, numbers, or boolean types. Do NOT include any non-JSON content inside the ```json...``` block.
+Do not skip any patient and never mention one patient's data in another patient's section.
+
+{INSIGHT_SAFETY_GUIDELINES}
+{patient_sections}
+Remember to provide insights relevant to managing chronic conditions.
+"""
+
+
+def split_batch_output(gemini_output: str, user_ids) -> dict:
+    """
+    Map each requested user id to its "### Patient <id>" section of a batch response.
+    Patients whose section is missing or repeated are left out.
+    """
+    parts = re.split(r"^#+\s*Patient\s+(\d+)\s*$", gemini_output, flags=re.MULTILINE)
+    sections, seen = {}, set()
+    for user_id, body in zip(parts[1::2], parts[2::2]):
+        user_id = int(user_id)
+        if user_id in seen:
+            sections.pop(user_id, None)
+        elif user_id in user_ids:
+            sections[user_id] = body
+        seen.add(user_id)
+    return sections
+
+
+def pack_insight_batches(contexts, max_patients: int, max_prompt_chars: int):
+    """
+    Group user ids (in order) into batches of at most max_patients whose patient
+    sections together stay within max_prompt_chars. A patient too large for any
+    batch ends up alone, which the caller sends as a single-patient request.
+    """
+    batches, batch, batch_chars = [], [], 0
+    for user_id, context in contexts.items():
+        chars = len(format_patient_section(user_id, context))
+        if batch and (len(batch) >= max_patients or batch_chars + chars > max_prompt_chars):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(user_id)
+        batch_chars += chars
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def generate_insight_batch(period: InsightPeriodEnum, start_date: date, end_date: date, contexts):
+    """
+    Generate insights for several patients with one Gemini request. Returns the parsed
+    data of every patient whose section passed validation (does NOT save to DB); the
+    caller falls back to generate_insight for the rest. Patients whose exact inputs
+    are in the insight cache are answered from it. Gemini errors are raised.
+    """
+    # Cached under the single-patient prompt, so both modes share results
+    cache_keys = {
+        user_id: insight_cache_key(INSIGHT_MODEL, build_gemini_prompt(period, start_date, end_date, **context))
+        for user_id, context in contexts.items()
+    }
+    results = {}
+    for user_id, cache_key in cache_keys.items():
+        cached = cached_insight(cache_key, user_id, period, start_date, end_date)
+        if cached:
+            results[user_id] = cached
+    contexts = {user_id: context for user_id, context in contexts.items() if user_id not in results}
+    if not contexts:
+        return results
+
+    prompt = build_batch_gemini_prompt(period, start_date, end_date, contexts)
+    print(f"📦 Requesting {period.value.lower()} insights for {len(contexts)} patients in one call "
+          f"({len(prompt)} chars, ~{estimate_tokens(prompt)} tokens).")
+    gemini_output = generate_gemini_response(prompt)
+    if not gemini_output:
+        print(f"❌ Gemini output was unexpectedly empty for batch {list(contexts)} for {period.value} period {start_date} to {end_date}.")
+        return results
+
+    for user_id, section in split_batch_output(gemini_output, set(contexts)).items():
+        insight_data = parse_insight_output(section, user_id, period, start_date, end_date)
+        if insight_data:
+            cache_insight(cache_keys[user_id], insight_data)
+            results[user_id] = insight_data
+    missing = [user_id for user_id in contexts if user_id not in results]
+    if missing:
+        print(f"⚠️ Batch response had no valid section for users {missing}; they will be generated individually.")
+    return results
+
+
 # Saving function remains as before
 def save_insight_to_db(db, user_id, period, start_date, end_date, title, summary, json_data):
     """
@@ -288,7 +464,7 @@ def save_insight_to_db(db, user_id, period, start_date, end_date, title, summary
     """
     try:
         insight = Insight(
-            user_id=user_id,
+            patient_profile_id=user_id,
             period=period,
             start_date=start_date,
             end_date=end_date,
@@ -319,7 +495,7 @@ def generate_and_save_insight(db: Session, user_id: int, period: InsightPeriodEn
     Returns the saved Insight object or None.
     """
     existing = db.query(Insight).filter_by(
-        user_id=user_id,
+        patient_profile_id=user_id,
         period=period,
         start_date=start_date
     ).first()
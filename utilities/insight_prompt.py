@@ -0,0 +1,176 @@
+"""
+Encodings of the log sections of the insight prompt.
+
+The raw encoding is one line per log. The compact encoding pre-aggregates the logs
+per day (readings, min/mean/max, out-of-range counts against the patient's own
+targets, doses per medicine) into short pipe-separated rows, which keeps monthly
+prompts to a few dozen lines instead of hundreds. Flags count readings above (H)
+or below (L) the targets, e.g. "H2".
+
+Logs are ScheduledBPLog, ScheduledSugarLog and ScheduledMedicationLog rows (or
+anything with the same fields), ordered by time.
+"""
+import math
+from collections import defaultdict
+from statistics import mean
+
+from constants.enums import SugarTypeEnum
+
+SUGAR_TYPE_CODES = {SugarTypeEnum.FASTING: "F", SugarTypeEnum.RANDOM: "R", SugarTypeEnum.POST_MEAL: "P"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer-free estimate, ~4 characters per token for English and digits."""
+    return math.ceil(len(text) / 4)
+
+
+# --- raw: one line per log ---
+
+def raw_bp_logs(bp_logs) -> str:
+    if not bp_logs:
+        return "No blood pressure readings."
+    return "\n".join(
+        f"- {log.checked_at.strftime('%Y-%m-%d %I:%M %p')}: {log.systolic}/{log.diastolic} (Pulse: {log.pulse})"
+        for log in bp_logs
+    )
+
+
+def raw_sugar_logs(sugar_logs) -> str:
+    if not sugar_logs:
+        return "No sugar readings."
+    return "\n".join(
+        f"- {log.checked_at.strftime('%Y-%m-%d %I:%M %p')} ({log.schedule.sugar_type.value}): {log.value} mg/dL"
+        for log in sugar_logs
+    )
+
+
+def raw_med_logs(med_logs) -> str:
+    if not med_logs:
+        return "No medication logs."
+    return "\n".join(
+        f"- {log.taken_at.strftime('%Y-%m-%d %I:%M %p')}: {log.schedule.medication.medicine.name} (Taken)"
+        for log in med_logs
+    )
+
+
+# --- compact: per-day aggregates ---
+
+def _range(low, high, unit: str) -> str:
+    if low is None and high is None:
+        return "not set"
+    return f"{low if low is not None else '-'} to {high if high is not None else '-'} {unit}"
+
+
+def _flags(high: int, low: int) -> str:
+    """Readings above (H) and below (L) target for a row, e.g. "H2 L1", or "-" when all are in range."""
+    return " ".join(f"{code}{count}" for code, count in (("H", high), ("L", low)) if count) or "-"
+
+
+def _stats(values) -> str:
+    """min/mean/max, or the value itself for a single reading."""
+    if len(values) == 1:
+        return f"{values[0]:.0f}"
+    return f"{min(values):.0f}/{mean(values):.0f}/{max(values):.0f}"
+
+
+def sugar_limits(profile, sugar_type: SugarTypeEnum) -> tuple:
+    """(low, high) target for a sugar reading: fasting targets for fasting, random targets otherwise."""
+    if profile is None:
+        return None, None
+    if sugar_type == SugarTypeEnum.FASTING:
+        return profile.sugar_fasting_min, profile.sugar_fasting_max
+    return profile.sugar_random_min, profile.sugar_random_max
+
+
+def compact_bp_logs(bp_logs, profile) -> str:
+    if not bp_logs:
+        return "No blood pressure readings."
+    sys_low, sys_high = (profile.bp_systolic_min, profile.bp_systolic_max) if profile else (None, None)
+    dia_low, dia_high = (profile.bp_diastolic_min, profile.bp_diastolic_max) if profile else (None, None)
+
+    by_day = defaultdict(list)
+    for log in bp_logs:
+        by_day[log.checked_at.date()].append(log)
+
+    lines = [
+        f"Targets: systolic {_range(sys_low, sys_high, 'mmHg')}, diastolic {_range(dia_low, dia_high, 'mmHg')}.",
+        "Per day: date|readings|systolic min/mean/max|diastolic min/mean/max|mean pulse|flags",
+    ]
+    for day in sorted(by_day):
+        logs = by_day[day]
+        high = sum(
+            (sys_high is not None and log.systolic > sys_high) or (dia_high is not None and log.diastolic > dia_high)
+            for log in logs
+        )
+        low = sum(
+            (sys_low is not None and log.systolic < sys_low) or (dia_low is not None and log.diastolic < dia_low)
+            for log in logs
+        )
+        pulses = [log.pulse for log in logs if log.pulse is not None]
+        lines.append(
+            f"{day.strftime('%m-%d')}|{len(logs)}|{_stats([log.systolic for log in logs])}|"
+            f"{_stats([log.diastolic for log in logs])}|{f'{mean(pulses):.0f}' if pulses else '-'}|{_flags(high, low)}"
+        )
+    return "\n".join(lines)
+
+
+def compact_sugar_logs(sugar_logs, profile) -> str:
+    if not sugar_logs:
+        return "No sugar readings."
+    by_day_type = defaultdict(list)
+    for log in sugar_logs:
+        by_day_type[(log.checked_at.date(), log.schedule.sugar_type)].append(log.value)
+
+    lines = [
+        "Targets: " + ", ".join(
+            f"{sugar_type.value.lower()} {_range(*sugar_limits(profile, sugar_type), 'mg/dL')}"
+            for sugar_type in (SugarTypeEnum.FASTING, SugarTypeEnum.RANDOM)
+        ) + " (post-meal uses the random target).",
+        "Per day: date|type (F=fasting, R=random, P=post-meal)|readings|min/mean/max mg/dL|flags",
+    ]
+    for (day, sugar_type), values in sorted(by_day_type.items(), key=lambda item: (item[0][0], item[0][1].value)):
+        low_limit, high_limit = sugar_limits(profile, sugar_type)
+        high = sum(high_limit is not None and value > high_limit for value in values)
+        low = sum(low_limit is not None and value < low_limit for value in values)
+        lines.append(
+            f"{day.strftime('%m-%d')}|{SUGAR_TYPE_CODES.get(sugar_type, sugar_type.value)}|{len(values)}|"
+            f"{_stats(values)}|{_flags(high, low)}"
+        )
+    return "\n".join(lines)
+
+
+def compact_med_logs(med_logs) -> str:
+    if not med_logs:
+        return "No medication logs."
+    by_day = defaultdict(lambda: defaultdict(int))
+    for log in med_logs:
+        by_day[log.taken_at.date()][log.schedule.medication.medicine.name] += 1
+
+    lines = ["Doses taken per day: date|medicine x doses"]
+    for day in sorted(by_day):
+        lines.append(f"{day.strftime('%m-%d')}|" + ", ".join(f"{name} x{count}" for name, count in by_day[day].items()))
+    return "\n".join(lines)
+
+
+def _shorter(compact: str, raw: str) -> str:
+    return compact if len(compact) < len(raw) else raw
+
+
+def encode_logs(bp_logs, sugar_logs, med_logs, profile=None, compact: bool = True) -> dict:
+    """
+    The three log sections of the prompt, keyed like the build_gemini_prompt arguments.
+    In compact mode a section keeps the raw lines when aggregating would not make it
+    shorter (a day or two of sparse logs), so the prompt never grows.
+    """
+    raw = {
+        "bp_logs_str": raw_bp_logs(bp_logs),
+        "sugar_logs_str": raw_sugar_logs(sugar_logs),
+        "med_logs_str": raw_med_logs(med_logs),
+    }
+    if not compact:
+        return raw
+    return {
+        "bp_logs_str": _shorter(compact_bp_logs(bp_logs, profile), raw["bp_logs_str"]),
+        "sugar_logs_str": _shorter(compact_sugar_logs(sugar_logs, profile), raw["sugar_logs_str"]),
+        "med_logs_str": _shorter(compact_med_logs(med_logs), raw["med_logs_str"]),
+    }
@@ -0,0 +1,91 @@
+"""
+Cache of the rendered "Patient Summary" block of chat prompts (medicines and the
+latest BP and sugar readings), keyed by patient profile.
+
+Those change far less often than patients chat, so a turn reuses the block instead
+of running three queries and formatting it again. Writes to medications and
+BP/sugar logs call invalidate_patient_context; entries also expire after
+PATIENT_CONTEXT_CACHE_TTL_SECONDS, which bounds staleness for writes made by
+other processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import settings
+
+
+class PatientContextCache:
+    """Thread-safe LRU of rendered blocks with a TTL, holding at most max_entries patients."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Bumped on every invalidation, so a block built from rows read before a write is not stored
+        self._generations: Dict[int, int] = {}
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, patient_profile_id: int, build: Callable[[], str]) -> str:
+        with self._lock:
+            entry = self._entries.get(patient_profile_id)
+            if entry is not None and entry[1] >= time.monotonic():
+                self._entries.move_to_end(patient_profile_id)
+                self._hits += 1
+                return entry[0]
+            self._misses += 1
+            generation = self._generations.get(patient_profile_id, 0)
+
+        block = build()
+
+        with self._lock:
+            if self._generations.get(patient_profile_id, 0) == generation:
+                self._entries[patient_profile_id] = (block, time.monotonic() + self.ttl_seconds)
+                self._entries.move_to_end(patient_profile_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return block
+
+    def invalidate(self, patient_profile_id: int):
+        with self._lock:
+            self._entries.pop(patient_profile_id, None)
+            self._generations[patient_profile_id] = self._generations.get(patient_profile_id, 0) + 1
+            self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "invalidations": self._invalidations,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0,
+            }
+
+
+patient_context_cache = PatientContextCache(
+    settings.PATIENT_CONTEXT_CACHE_MAX_ENTRIES, settings.PATIENT_CONTEXT_CACHE_TTL_SECONDS
+)
+
+
+def invalidate_patient_context(db: Session, patient_profile_id: int):
+    """
+    Drop the patient's block now and again once db commits, so a chat turn that reads
+    the rows before the commit cannot leave the old block cached.
+    """
+    patient_context_cache.invalidate(patient_profile_id)
+    event.listen(db, "after_commit", lambda session: patient_context_cache.invalidate(patient_profile_id), once=True)
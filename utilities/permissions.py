@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Iterable, List, Optional
 from sqlalchemy.orm import Session
 from models.user_roles import UserRole
 from constants.enums import UserRoleEnum
@@ -53,6 +53,21 @@ def is_doctor_of(db: Session, doctor_user_id: int, patient_profile_id: int) -> b
     return conn is not None
 
 
+def get_doctor_patient_ids(db: Session, doctor_user_id: int, patient_profile_ids: Optional[Iterable[int]] = None) -> List[int]:
+    """
+    Patient profile ids with an accepted DOCTOR connection to the doctor, in one query.
+    When patient_profile_ids is given, only those ids are checked.
+    """
+    query = db.query(Connection.patient_id).filter(
+        Connection.connected_user_id == doctor_user_id,
+        Connection.connection_type == 'DOCTOR',
+        Connection.status == 'ACCEPTED'
+    )
+    if patient_profile_ids is not None:
+        query = query.filter(Connection.patient_id.in_(list(patient_profile_ids)))
+    return sorted({patient_id for (patient_id,) in query.all()})
+
+
 def can_modify_patient_logs(db: Session, actor_user, patient_profile_id: int) -> bool:
     # Patients can modify their own logs
     if actor_user is None:
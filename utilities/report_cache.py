@@ -0,0 +1,125 @@
+"""
+Content-addressed cache for rendered reports and charts.
+
+PDFs are keyed by a hash of (patient, period, window, data fingerprint), where the
+fingerprint (crud.reports.get_report_fingerprint) changes whenever a log or schedule
+the report reads is added, edited or removed. Charts are keyed by a hash of the data
+they are drawn from, so an unchanged chart is reused even when the PDF must be rebuilt.
+
+Entries live in an in-memory LRU bounded by total bytes. All lookups and stores
+happen in the API process; report worker processes only receive cached charts
+inside the payload and hand newly drawn ones back.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Optional
+
+from config import settings
+from utilities.report_renderer import chart_inputs
+
+# Bump when the report layout changes so stale renders are not served
+REPORT_LAYOUT_VERSION = 3
+
+
+def make_key(*parts) -> str:
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+def report_cache_key(patient_profile_id: int, period: str, start_date: date, end_date: date, fingerprint: tuple) -> str:
+    return make_key("pdf", REPORT_LAYOUT_VERSION, patient_profile_id, period, start_date, end_date, fingerprint)
+
+
+def chart_cache_key(chart: str, data) -> str:
+    return make_key("chart", REPORT_LAYOUT_VERSION, chart, data)
+
+
+class ReportCache:
+    """Thread-safe LRU of rendered artifacts, evicting least recently used entries past max_bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._size = 0
+        self._evictions = 0
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, kind: str, outcome: str):
+        counters = self._counters.setdefault(kind, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                self._count(kind, "misses")
+                return None
+            self._entries.move_to_end((kind, key))
+            self._count(kind, "hits")
+            return entry[0]
+
+    def put(self, kind: str, key: str, value: Any, size: Optional[int] = None):
+        """Store value; size defaults to len(value). Values larger than the whole cache are skipped."""
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((kind, key), None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[(kind, key)] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_kind = {}
+            for kind, counters in self._counters.items():
+                lookups = counters["hits"] + counters["misses"]
+                by_kind[kind] = {
+                    **counters,
+                    "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0,
+                }
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "evictions": self._evictions,
+                "by_kind": by_kind,
+            }
+
+
+report_cache = ReportCache(settings.REPORT_CACHE_MAX_BYTES)
+
+
+def get_cached_report(key: str):
+    """(pdf_bytes, headers) for a cached report, or None."""
+    return report_cache.get("pdf", key)
+
+
+def cache_report(key: str, pdf_bytes: bytes, headers: Dict[str, str]):
+    report_cache.put("pdf", key, (pdf_bytes, headers), size=len(pdf_bytes))
+
+
+def attach_cached_charts(payload: Dict[str, Any]):
+    """Fill payload["charts"] with any chart already rendered for the same data."""
+    payload["charts"] = {
+        chart: report_cache.get("chart", chart_cache_key(chart, data))
+        for chart, data in chart_inputs(payload).items()
+    }
+
+
+def cache_rendered_charts(payload: Dict[str, Any], charts: Dict[str, bytes]):
+    inputs = chart_inputs(payload)
+    for chart, png in charts.items():
+        report_cache.put("chart", chart_cache_key(chart, inputs[chart]), png)
@@ -0,0 +1,257 @@
+"""
+Report rendering on plain data.
+
+Everything here works on dicts/lists of primitives (see build_report_payload) and
+never touches the database, so a payload can be pickled and rendered in a worker
+process by tasks.report_jobs as well as inline by the /reports route.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Dict, List, Tuple
+
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+
+from utilities.charts import bp_chart, sugar_chart, adherence_chart
+
+
+def build_report_payload(user, bp_logs, sugar_logs, adherence: Dict[str, Any], start_date: date, end_date: date) -> Dict[str, Any]:
+    """Flatten ORM rows and the adherence result into a picklable report payload."""
+    return {
+        "patient": {"id": user.id, "name": user.name},
+        "start_date": start_date,
+        "end_date": end_date,
+        "adherence": {
+            "adherence_percent": adherence["adherence_percent"],
+            "total_scheduled": adherence["total_scheduled"],
+            "total_completed": adherence["total_completed"],
+            "daily": [
+                {"date": day["date"], "adherence_percent": day["adherence_percent"]}
+                for day in adherence["daily"]
+            ],
+        },
+        # Logs are passed as columns, ready for the chart functions
+        "bp_logs": {
+            "checked_at": [log.checked_at for log in bp_logs],
+            "systolic": [log.systolic for log in bp_logs],
+            "diastolic": [log.diastolic for log in bp_logs],
+        },
+        "sugar_logs": {
+            "checked_at": [log.checked_at for log in sugar_logs],
+            "value": [log.value for log in sugar_logs],
+            "type": [log.schedule.sugar_type.name for log in sugar_logs],
+        },
+    }
+
+
+LOGO_PATH = "static/healthmate_logo.png"
+# Height reserved for a chart placed 180 mm wide (10x4 in figures)
+CHART_HEIGHT = 75
+
+@lru_cache(maxsize=1)
+def _logo_bytes() -> bytes:
+    """The logo file, read once per process."""
+    with open(LOGO_PATH, "rb") as logo_file:
+        return logo_file.read()
+
+
+def add_logo(pdf: FPDF, x: float, y: float, w: float):
+    """Place the logo; fpdf2 keys its image cache by content, so it is decoded once per document."""
+    pdf.image(_logo_bytes(), x=x, y=y, w=w)
+
+
+def add_chart(pdf: FPDF, chart_png: bytes):
+    """Embed a chart straight from its PNG bytes, starting a new page if it would not fit."""
+    if pdf.get_y() + CHART_HEIGHT > 270:  # Avoid bottom margin cutoff
+        pdf.add_page()
+    pdf.image(chart_png, x=15, y=pdf.get_y(), w=180)
+    pdf.set_y(pdf.get_y() + CHART_HEIGHT)
+
+
+def write_report_pages(pdf: FPDF, patient: Dict[str, Any], bp_logs, sugar_logs, adherence_data, adherence_chart: bytes, bp_chart: bytes, sugar_chart: bytes, start_date, end_date):
+    """Append one patient's report to pdf, starting on a new page; charts are PNG bytes."""
+    pdf.add_page()
+
+    # --- HEADER ---
+    add_logo(pdf, x=10, y=8, w=25)
+    pdf.set_font("helvetica", "B", 16)
+    pdf.cell(0, 10, "HEALTHMATE", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+    pdf.set_font("helvetica", "", 12)
+    pdf.cell(0, 5, "YOUR WELLNESS COMPANION", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+    pdf.ln(10)
+
+    # --- PATIENT INFO ---
+    pdf.set_font("helvetica", "", 11)
+    pdf.cell(100, 7, f"Patient Name: {patient['name']}")
+    pdf.cell(90, 7, f"Date: {datetime.now().strftime('%Y-%m-%d')}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(100, 7, f"Patient ID: {patient['id']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(5)
+
+    # --- ADHERENCE SECTION ---
+    pdf.set_font("helvetica", "B", 13)
+    pdf.cell(0, 10, "Medication Adherence", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_font("helvetica", "", 11)
+    pdf.cell(0, 8, f"Overall adherence: {adherence_data.get('adherence_percent', 0):.1f}%", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    add_chart(pdf, adherence_chart)
+
+    # --- BLOOD PRESSURE SECTION ---
+    if bp_logs["checked_at"]:
+        if pdf.get_y() > 200:  # Avoid bottom cutoff
+            pdf.add_page()
+        pdf.set_font("helvetica", "B", 13)
+        pdf.cell(0, 10, "Blood Pressure Logs", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+        pdf.set_font("helvetica", "B", 10)
+        pdf.cell(50, 8, "Date", 1)
+        pdf.cell(40, 8, "Time", 1)
+        pdf.cell(50, 8, "Systolic (mmHg)", 1)
+        pdf.cell(50, 8, "Diastolic (mmHg)", 1)
+        pdf.ln()
+
+        pdf.set_font("helvetica", "", 10)
+        for checked_at, systolic, diastolic in list(zip(bp_logs["checked_at"], bp_logs["systolic"], bp_logs["diastolic"]))[-10:]:
+            pdf.cell(50, 8, checked_at.strftime("%Y-%m-%d"), 1)
+            pdf.cell(40, 8, checked_at.strftime("%H:%M"), 1)
+            pdf.cell(50, 8, str(systolic), 1, align="C")
+            pdf.cell(50, 8, str(diastolic), 1, align="C")
+            pdf.ln()
+        pdf.ln()
+        # pdf.cell(0, 10, "Blood Pressure Trend", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        add_chart(pdf, bp_chart)
+
+    # --- SUGAR SECTION ---
+    if sugar_logs["checked_at"]:
+        if pdf.get_y() > 200:  # Avoid bottom cutoff
+            pdf.add_page()
+        pdf.set_font("helvetica", "B", 13)
+        pdf.cell(0, 10, "Blood Sugar Logs", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+        pdf.set_font("helvetica", "B", 10)
+        pdf.cell(50, 8, "Date", 1)
+        pdf.cell(40, 8, "Time", 1)
+        pdf.cell(50, 8, "Type", 1)
+        pdf.cell(50, 8, "Value (mg/dL)", 1)
+        pdf.ln()
+
+        pdf.set_font("helvetica", "", 10)
+        for checked_at, sugar_type, value in list(zip(sugar_logs["checked_at"], sugar_logs["type"], sugar_logs["value"]))[-10:]:
+            pdf.cell(50, 8, checked_at.strftime("%Y-%m-%d"), 1)
+            pdf.cell(40, 8, checked_at.strftime("%H:%M"), 1)
+            pdf.cell(50, 8, sugar_type, 1)
+            pdf.cell(50, 8, str(value), 1, align="C")
+            pdf.ln()
+        pdf.ln()
+        # pdf.cell(0, 10, "Sugar Trend", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        add_chart(pdf, sugar_chart)
+
+    #Alerts Section
+    # if alerts:
+    #     if pdf.get_y() > 200:  # Avoid bottom cutoff
+    #         pdf.add_page()
+    #     pdf.set_font("helvetica", "B", 13)
+    #     pdf.cell(0, 10, "Alerts", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    #     pdf.set_font("helvetica", "B", 10)
+    #     pdf.cell(50, 8, "Tag", 1)
+    #     pdf.cell(40, 8, "Heading", 1)
+    #     pdf.cell(50, 8, "Description", 1)
+    #     pdf.cell(50, 8, "Date", 1)
+    #     pdf.cell(50, 8, "Time", 1)
+    #     pdf.ln()
+
+    #     pdf.set_font("helvetica", "", 10)
+    #     for alert in alerts[-10:]:
+    #         if alert["tag"]=="Emergency":
+    #             pdf.cell(50, 8, str(alert["tag"]), 1, align="C")
+    #             pdf.cell(50, 8, str(alert["heading"]), 1, align="C")
+    #             pdf.cell(50, 8, str(alert["description"]), 1, align="C")
+    #             pdf.cell(50, 8, alert["date"], 1)
+    #             pdf.cell(40, 8, alert["time"], 1)
+    #             pdf.ln()
+    #     pdf.ln()
+    
+    # --- FOOTER ---
+    pdf.ln()
+    pdf.set_font("helvetica", "", 11)
+    pdf.cell(0, 10, "Automated Report", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="R")
+
+
+def generate_pdf_report(patient: Dict[str, Any], bp_logs, sugar_logs, adherence_data, adherence_chart: bytes, bp_chart: bytes, sugar_chart: bytes, start_date, end_date) -> bytes:
+    """Assemble the report PDF in memory; charts are PNG bytes."""
+    pdf = FPDF()
+    write_report_pages(pdf, patient, bp_logs, sugar_logs, adherence_data, adherence_chart, bp_chart, sugar_chart, start_date, end_date)
+    return bytes(pdf.output())
+
+
+def chart_inputs(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The data each chart is drawn from, keyed by chart name (used for chart cache keys)."""
+    daily = payload["adherence"]["daily"]
+    return {
+        "adherence": (
+            [day["date"].strftime("%m/%d") for day in daily],
+            [day["adherence_percent"] for day in daily],
+        ),
+        "bp": payload["bp_logs"],
+        "sugar": payload["sugar_logs"],
+    }
+
+
+def render_charts(payload: Dict[str, Any]) -> Dict[str, bytes]:
+    """
+    PNG bytes for every chart. Charts already present in payload["charts"]
+    (e.g. served from the report cache) are reused instead of redrawn.
+    """
+    charts = dict(payload.get("charts") or {})
+    inputs = chart_inputs(payload)
+    if charts.get("bp") is None:
+        bp = inputs["bp"]
+        charts["bp"] = bp_chart(bp["checked_at"], bp["systolic"], bp["diastolic"])
+    if charts.get("sugar") is None:
+        sugar = inputs["sugar"]
+        charts["sugar"] = sugar_chart(sugar["checked_at"], sugar["value"], sugar["type"])
+    if charts.get("adherence") is None:
+        charts["adherence"] = adherence_chart(*inputs["adherence"])
+    return charts
+
+
+def render_report_job(payload: Dict[str, Any]) -> Tuple[bytes, Dict[str, float], Dict[str, bytes]]:
+    """
+    Worker entry point: render a report and time each stage.
+    Returns the PDF bytes, {"started_at", "charts_ms", "pdf_ms"} (started_at is epoch
+    seconds) and the chart PNGs so the caller can cache them.
+    """
+    started_at = datetime.now().timestamp()
+
+    charts_start = perf_counter()
+    charts = render_charts(payload)
+    charts_ms = (perf_counter() - charts_start) * 1000
+
+    pdf_start = perf_counter()
+    pdf_bytes = generate_pdf_report(
+        payload["patient"],
+        payload["bp_logs"], payload["sugar_logs"], payload["adherence"],
+        charts["adherence"], charts["bp"], charts["sugar"],
+        payload["start_date"], payload["end_date"]
+    )
+    pdf_ms = (perf_counter() - pdf_start) * 1000
+
+    return pdf_bytes, {"started_at": started_at, "charts_ms": charts_ms, "pdf_ms": pdf_ms}, charts
+
+
+def render_combined_report(payloads: List[Dict[str, Any]]) -> bytes:
+    """
+    Worker entry point for bulk exports: one PDF with every payload's report on its
+    own pages, in the given order. Charts are expected in payload["charts"]
+    (drawn in parallel beforehand); any missing one is drawn here.
+    """
+    pdf = FPDF()
+    for payload in payloads:
+        charts = render_charts(payload)
+        write_report_pages(
+            pdf, payload["patient"],
+            payload["bp_logs"], payload["sugar_logs"], payload["adherence"],
+            charts["adherence"], charts["bp"], charts["sugar"],
+            payload["start_date"], payload["end_date"]
+        )
+    return bytes(pdf.output())
@@ -0,0 +1,12 @@
+"""Server-sent event formatting for StreamingResponse bodies."""
+import json
+from typing import Any
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Comment line that keeps idle connections (and proxies) from timing out
+SSE_KEEPALIVE = ": keep-alive\n\n"